@@ -7,15 +7,89 @@ load_dotenv()
 # Application settings
 PORT = int(os.getenv("PORT", 8000))
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_MAX_IN_FLIGHT = int(os.getenv("TELEGRAM_MAX_IN_FLIGHT", 8))  # updates processed at once
+TELEGRAM_MAX_QUEUED = int(os.getenv("TELEGRAM_MAX_QUEUED", 32))  # updates waiting before users are told we're busy
+TELEGRAM_EDIT_INTERVAL_SECONDS = float(os.getenv("TELEGRAM_EDIT_INTERVAL_SECONDS", 1.5))  # between edits of a streamed answer
+API_QUERY_TIMEOUT_SECONDS = float(os.getenv("API_QUERY_TIMEOUT_SECONDS", 120))  # default and longest allowed per question
+API_BATCH_CONCURRENCY = int(os.getenv("API_BATCH_CONCURRENCY", 4))  # questions of one batch answered at once
+API_MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", 50))
+
+# Seconds from process start to accepting traffic before a warning is logged
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", 1.0))
 
 # Admin configuration
 ADMIN_USER_IDS = [int(id) for id in os.getenv("ADMIN_USER_IDS", "").split(",") if id]
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")  # bearer token for the /query and /process API routes; unset disables them
 
 # Database settings
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./rag_chatbot.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # connections kept open to a database server
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))  # extra connections allowed under load
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))  # wait for a free connection
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))  # reconnect before servers drop idle links
 
 # OpenAI settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Document processing settings
 TEXT_DIRECTORY = "text_files"
+
+# Embedding model settings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS")) if os.getenv("EMBEDDING_DIMENSIONS") else None
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # float32 or float16 in the database
+
+# Embedding ingestion settings
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 100000))  # tokens per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 512))  # inputs per request
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))  # requests in flight
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", 3000))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", 1000000))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 5))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))  # processes splitting files in parallel
+
+# Vector index settings
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")  # faiss (local app/knowledge) or pgvector (shared, in DATABASE_URL)
+PGVECTOR_INDEX_TYPE = os.getenv("PGVECTOR_INDEX_TYPE", "hnsw")  # hnsw or ivfflat; uses the HNSW and IVF settings below
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")  # flat, hnsw, ivf_flat, ivf_pq or sq_fp16
+VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", 32))
+VECTOR_INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", 200))
+VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", 64))
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", 1024))
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", 16))
+VECTOR_INDEX_PQ_M = int(os.getenv("VECTOR_INDEX_PQ_M", 96))  # sub-quantizers, must divide the dimension
+VECTOR_INDEX_TRAIN_SAMPLE = int(os.getenv("VECTOR_INDEX_TRAIN_SAMPLE", 50000))
+VECTOR_SEARCH_DIMENSIONS = int(os.getenv("VECTOR_SEARCH_DIMENSIONS", 0))  # e.g. 256, 512 or 1024 to index shortened vectors; 0 = full width
+VECTOR_RERANK_CANDIDATES = int(os.getenv("VECTOR_RERANK_CANDIDATES", 100))  # re-scored at full width per shortened search
+
+# Number of previous vector store versions kept on disk for rollback
+KNOWLEDGE_KEEP_VERSIONS = int(os.getenv("KNOWLEDGE_KEEP_VERSIONS", 3))
+
+# Conversation memory settings
+CHAT_MEMORY_PATH = os.getenv("CHAT_MEMORY_PATH", "./chat_memory.db")  # SQLite file holding chat checkpoints
+CHAT_MAX_THREADS = int(os.getenv("CHAT_MAX_THREADS", 10000))  # least recently used threads beyond this are deleted
+CHAT_THREAD_IDLE_SECONDS = float(os.getenv("CHAT_THREAD_IDLE_SECONDS", 30 * 24 * 3600))  # idle threads are deleted
+CHAT_CHECKPOINTS_PER_THREAD = int(os.getenv("CHAT_CHECKPOINTS_PER_THREAD", 3))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 3000))  # earlier turns sent to the LLM
+CHAT_OLD_TOOL_OUTPUT_CHARS = int(os.getenv("CHAT_OLD_TOOL_OUTPUT_CHARS", 200))  # kept of tool outputs from earlier turns
+
+# Answer cache for opening questions
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))  # 0 disables the cache
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.92))  # cosine similarity for a match
+
+# Search settings
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", 8))
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")  # hybrid, vector or lexical
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", 30))  # per ranking, before fusion
+SEARCH_CONTEXT_TOKEN_BUDGET = int(os.getenv("SEARCH_CONTEXT_TOKEN_BUDGET", 2000))  # per search_documents call
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", 5))  # per search_documents_batch call
+SEARCH_BATCH_TOKEN_BUDGET = int(os.getenv("SEARCH_BATCH_TOKEN_BUDGET", 4000))  # shared by the queries of a batch
+SEARCH_MMR_LAMBDA = float(os.getenv("SEARCH_MMR_LAMBDA", 0.7))  # 1.0 = pure relevance, 0.0 = pure diversity
+SEARCH_DUPLICATE_THRESHOLD = float(os.getenv("SEARCH_DUPLICATE_THRESHOLD", 0.8))  # shared character bigrams
+QUERY_EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("QUERY_EMBEDDING_TIMEOUT_SECONDS", 3.0))
+QUERY_EMBEDDING_COOLDOWN_SECONDS = float(os.getenv("QUERY_EMBEDDING_COOLDOWN_SECONDS", 30))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 2048))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", 3600))
@@ -1,19 +1,156 @@
-from fastapi import FastAPI, Depends
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional
+
+from fastapi import FastAPI, Depends, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from app.models.database import get_session_maker
-from app.config.settings import PORT
+from app.config.settings import (
+    PORT, ADMIN_API_TOKEN, API_QUERY_TIMEOUT_SECONDS, API_BATCH_CONCURRENCY, API_MAX_BATCH_SIZE
+)
+from app.services import metrics, readiness
+from app.services.ingest_jobs import IngestJobRunner, IngestJobRunning, ingest_jobs
+
+logger = logging.getLogger(__name__)
+
+class QueryRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    user_id: Optional[str] = None  # continue this API conversation; a new one is started if omitted
+    timeout_seconds: Optional[float] = Field(None, gt=0, le=API_QUERY_TIMEOUT_SECONDS)
+
+class QueryResponse(BaseModel):
+    question: str
+    user_id: str
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    elapsed_seconds: float
+
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest] = Field(..., min_length=1, max_length=API_MAX_BATCH_SIZE)
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+    elapsed_seconds: float
+
+class ProcessRequest(BaseModel):
+    full_rebuild: bool = False  # ignore the manifest and embed everything again
+
+async def _on_loop(loop: Optional[asyncio.AbstractEventLoop], coroutine):
+    """Await a coroutine on another thread's event loop, or on this one if loop is None or current.
+
+    Cancelling the caller cancels the coroutine on its loop as well.
+    """
+    if loop is None or loop is asyncio.get_running_loop():
+        return await coroutine
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+async def _iterate_on(loop: Optional[asyncio.AbstractEventLoop], events: AsyncIterator) -> AsyncIterator:
+    """Iterate an async generator that must run on another thread's event loop."""
+    async def next_event():
+        return await events.__anext__()
+
+    try:
+        while True:
+            try:
+                yield await _on_loop(loop, next_event())
+            except StopAsyncIteration:
+                return
+    finally:
+        await _on_loop(loop, events.aclose())
+
+def _thread_id(user_id: str) -> str:
+    """Conversation thread of an API user, kept apart from Telegram threads, which are numeric user ids."""
+    return f"api:{user_id}"
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 class APIServer:
     """Handles FastAPI server operations."""
-    
-    def __init__(self):
+
+    def __init__(
+        self, chat_service=None, ingest_runner: IngestJobRunner = ingest_jobs, admin_token: str = ADMIN_API_TOKEN
+    ):
         self.app = FastAPI(
             title="RAG Chatbot API",
             description="A simple RAG-based chatbot API that answers questions based on your documents",
             version="1.0.0"
         )
+        # The server starts before the chat stack is loaded; queries get 503 until it is set
+        self.chat_service = chat_service
+        # Shared with the Telegram commands, so only one ingestion runs at a time
+        self.ingest_runner = ingest_runner
+        self.admin_token = admin_token
         self._setup_routes()
-    
+
+    def set_chat_service(self, chat_service):
+        """Serve queries with chat_service from now on."""
+        self.chat_service = chat_service
+
+    def _require_chat_service(self):
+        if self.chat_service is None:
+            raise HTTPException(status_code=503, detail="Chat service is still starting")
+        return self.chat_service
+
+    def _require_token(self, authorization: Optional[str]):
+        """Reject requests without the bearer ADMIN_API_TOKEN; every route that spends or changes anything needs it."""
+        if not self.admin_token:
+            raise HTTPException(status_code=403, detail="Set ADMIN_API_TOKEN to enable the /query and /process routes")
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), self.admin_token.encode()):
+            raise HTTPException(status_code=401, detail="Invalid admin token")
+
+    async def _answer(self, query: QueryRequest) -> QueryResponse:
+        """Answer one question within its timeout, reporting a timeout as an error rather than raising."""
+        chat_service = self._require_chat_service()
+        user_id = query.user_id or uuid.uuid4().hex
+        timeout = query.timeout_seconds or API_QUERY_TIMEOUT_SECONDS
+        started = time.monotonic()
+        answer, error = None, None
+        try:
+            # The agent's conversation memory belongs to the bot's event loop, not the server's
+            answer = await asyncio.wait_for(
+                _on_loop(chat_service.loop, chat_service.answer_question(_thread_id(user_id), query.question)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Query timed out after {timeout:g}s: {query.question[:50]}")
+            error = f"Timed out after {timeout:g}s"
+        return QueryResponse(
+            question=query.question,
+            user_id=user_id,
+            answer=answer,
+            error=error,
+            elapsed_seconds=round(time.monotonic() - started, 3),
+        )
+
+    async def _stream(self, query: QueryRequest) -> AsyncIterator[str]:
+        """Server-sent events for a streamed answer: status, partial, then answer or error."""
+        chat_service = self.chat_service
+        user_id = query.user_id or uuid.uuid4().hex
+        timeout = query.timeout_seconds or API_QUERY_TIMEOUT_SECONDS
+        deadline = time.monotonic() + timeout
+        yield _sse("start", {"user_id": user_id})
+        events = _iterate_on(chat_service.loop, chat_service.stream_answer(_thread_id(user_id), query.question))
+        try:
+            while True:
+                try:
+                    kind, text = await asyncio.wait_for(events.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                yield _sse(kind, {"text": text})
+        except asyncio.TimeoutError:
+            logger.warning(f"Streamed query timed out after {timeout:g}s: {query.question[:50]}")
+            yield _sse("error", {"error": f"Timed out after {timeout:g}s"})
+        finally:
+            await events.aclose()
+
     def _setup_routes(self):
         """Setup FastAPI routes."""
         @self.app.get("/")
@@ -24,12 +161,79 @@ class APIServer:
                 "message": "RAG Chatbot API is running. Telegram bot is active.",
                 "port": PORT
             }
-        
+
         @self.app.get("/health")
         async def health_check():
-            """Health check endpoint."""
-            return {"status": "healthy"}
-    
+            """Health check endpoint reporting whether retrieval is ready or still warming."""
+            return readiness.status()
+
+        @self.app.get("/metrics")
+        async def prometheus_metrics():
+            """Stage latencies, answer and tool call counts and LLM tokens for Prometheus to scrape."""
+            return Response(content=metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+        @self.app.post("/query", response_model=QueryResponse)
+        async def query(request: QueryRequest, authorization: Optional[str] = Header(None)):
+            """Answer a single question; 504 if it takes longer than its timeout."""
+            self._require_token(authorization)
+            response = await self._answer(request)
+            if response.error:
+                raise HTTPException(status_code=504, detail=response.error)
+            return response
+
+        @self.app.post("/query/batch", response_model=BatchQueryResponse)
+        async def query_batch(request: BatchQueryRequest, authorization: Optional[str] = Header(None)):
+            """Answer many questions concurrently; each result carries its own answer or error."""
+            self._require_token(authorization)
+            self._require_chat_service()
+            started = time.monotonic()
+            semaphore = asyncio.Semaphore(API_BATCH_CONCURRENCY)
+
+            async def answer(query: QueryRequest) -> QueryResponse:
+                async with semaphore:
+                    return await self._answer(query)
+
+            results = await asyncio.gather(*(answer(query) for query in request.queries))
+            return BatchQueryResponse(results=results, elapsed_seconds=round(time.monotonic() - started, 3))
+
+        @self.app.post("/query/stream")
+        async def query_stream(request: QueryRequest, authorization: Optional[str] = Header(None)):
+            """Stream an answer as server-sent events while the agent works."""
+            self._require_token(authorization)
+            self._require_chat_service()
+            return StreamingResponse(
+                self._stream(request),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        @self.app.post("/process", status_code=202)
+        async def process(request: ProcessRequest = ProcessRequest(), authorization: Optional[str] = Header(None)):
+            """Start processing documents in the background; 409 if a job is already running."""
+            self._require_token(authorization)
+            try:
+                job = self.ingest_runner.start("api", full_rebuild=request.full_rebuild)
+            except IngestJobRunning as e:
+                raise HTTPException(status_code=409, detail=e.job.status())
+            return job.status()
+
+        @self.app.get("/process/status")
+        async def process_status(authorization: Optional[str] = Header(None)):
+            """Progress of the running ingestion job, or the outcome of the last one."""
+            self._require_token(authorization)
+            status = self.ingest_runner.status()
+            if status is None:
+                raise HTTPException(status_code=404, detail="No ingestion job has been run")
+            return status
+
+        @self.app.post("/process/cancel", status_code=202)
+        async def process_cancel(authorization: Optional[str] = Header(None)):
+            """Cancel the running ingestion job; 409 if none is running or it is already saving its results."""
+            self._require_token(authorization)
+            if not self.ingest_runner.cancel():
+                raise HTTPException(status_code=409, detail="No cancellable ingestion job is running")
+            return self.ingest_runner.status()
+
     def get_app(self):
         """Get the FastAPI application instance."""
-        return self.app 
\ No newline at end of file
+        return self.app
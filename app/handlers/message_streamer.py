@@ -0,0 +1,131 @@
+import time
+import asyncio
+import logging
+from typing import List, Optional
+
+import telegramify_markdown
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from app.config.settings import TELEGRAM_EDIT_INTERVAL_SECONDS
+from app.services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects longer messages; leave room for MarkdownV2 escaping
+MAX_MESSAGE_CHARS = 4096
+MAX_PART_CHARS = 3000
+
+# Flood-control waits sat out for an edit that must not be skipped, before giving up on it
+FLOOD_RETRIES = 2
+
+def split_answer(text: str, limit: int = MAX_PART_CHARS) -> List[str]:
+    """Split a long answer into message-sized parts at paragraph or line breaks."""
+    parts, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        parts.append(current)
+    return parts or [text]
+
+class MessageStreamer:
+    """Shows an answer in progress by editing one placeholder message.
+
+    Edits are throttled to one per min_interval seconds to stay within
+    Telegram's rate limits; intermediate states that arrive in between are
+    skipped, and finish() always shows the final answer.
+    """
+
+    def __init__(self, reply_to: Message, min_interval: float = TELEGRAM_EDIT_INTERVAL_SECONDS):
+        self.reply_to = reply_to
+        self.min_interval = min_interval
+        self.message: Optional[Message] = None
+        self.shown = ""
+        self.next_edit = 0.0
+        self.answered = False  # the placeholder holds (the start of) the final answer
+
+    async def start(self, text: str = "🤔 思考中…"):
+        with timed("telegram_send"):
+            self.message = await self.reply_to.reply_text(text)
+        self.shown = text
+        self.next_edit = time.monotonic() + self.min_interval
+
+    async def update(self, text: str):
+        """Show text in the placeholder unless an edit was made too recently."""
+        text = text[:MAX_MESSAGE_CHARS]
+        if self.message is None or text == self.shown or time.monotonic() < self.next_edit:
+            return
+        await self._edit(text)
+
+    async def _edit(self, text: str, parse_mode: Optional[str] = None, wait: bool = False) -> bool:
+        """Edit the placeholder.
+
+        Args:
+            text: New text of the placeholder
+            parse_mode: Telegram parse mode of the text
+            wait: Sit out the throttle and any flood-control delay Telegram asks for, instead of giving up
+
+        Returns:
+            bool: Whether the placeholder now shows the text
+        """
+        for _ in range(FLOOD_RETRIES + 1 if wait else 1):
+            if wait:
+                await asyncio.sleep(max(0.0, self.next_edit - time.monotonic()))
+            try:
+                with timed("telegram_edit"):
+                    await self.message.edit_text(text, parse_mode=parse_mode)
+                self.shown = text
+                return True
+            except RetryAfter as e:
+                # Flood control: hold edits back until Telegram allows them
+                self.next_edit = time.monotonic() + e.retry_after
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return True
+                if parse_mode is None:
+                    logger.warning(f"Could not edit streamed message: {str(e)}")
+                return False
+            finally:
+                self.next_edit = max(self.next_edit, time.monotonic() + self.min_interval)
+        return False
+
+    async def finish(self, answer: str):
+        """Replace the placeholder with the rendered answer, adding messages if it is long."""
+        parts = split_answer(answer)
+        for i, part in enumerate(parts):
+            with timed("telegram_format"):
+                rendered = telegramify_markdown.markdownify(part)
+            if i == 0 and self.message is not None:
+                # The final edit must not be skipped, so wait out the throttle and flood control instead
+                if await self._edit(rendered, parse_mode="MarkdownV2", wait=True) or await self._edit(part, wait=True):
+                    self.answered = True
+                    continue
+            with timed("telegram_send"):
+                try:
+                    await self.reply_to.reply_markdown_v2(rendered)
+                except TelegramError:
+                    await self.reply_to.reply_text(part)
+            self.answered = True
+
+    async def fail(self, text: str):
+        """Show an error in place of the placeholder, or as a new message if that can't be edited.
+
+        A placeholder that already holds the answer is left alone.
+        """
+        if self.message is not None and not self.answered:
+            try:
+                if await self._edit(text, wait=True):
+                    return
+            except TelegramError as e:
+                logger.warning(f"Could not show the error in the streamed message: {str(e)}")
+        with timed("telegram_send"):
+            await self.reply_to.reply_text(text)
@@ -1,20 +1,51 @@
+import time
+import asyncio
 import logging
+from typing import Optional
 from telegram import Update
-import telegramify_markdown
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from sqlalchemy.orm import Session
 
 from app.config.settings import ADMIN_USER_IDS
-from app.services.document_processor import DocumentProcessor
+from app.handlers.message_streamer import MessageStreamer
 from app.services.chat_service import ChatService
+from app.services.ingest_jobs import IngestJobRunner, IngestJobRunning, ingest_jobs
+from app.services.metrics import observe
+from app.tools.search_tool import index_version, retrieval_state
 
 logger = logging.getLogger(__name__)
 
-def setup_handlers(application: Application, db: Session, chat_service: ChatService):
+def format_job_status(status: Optional[dict]) -> str:
+    """Telegram text for the status of an ingestion job."""
+    if status is None:
+        return "No document processing has been run since the bot started."
+    progress = status["progress"]
+    icon = {"running": "🔄", "succeeded": "✅", "failed": "⚠️", "cancelled": "⏹"}[status["state"]]
+    state = status["state"]
+    if state == "running" and status["cancel_requested"]:
+        state = "cancelling"
+    lines = [
+        f"{icon} Job {status['id']} {state}",
+        f"Stage: {progress['stage']}",
+        f"Files: {progress['files_done']}/{progress['files_total']}",
+        f"Chunks: {progress['chunks']}, embedded: {progress['embeddings_done']}",
+        f"Elapsed: {progress['elapsed_seconds']:.0f}s",
+    ]
+    if status["state"] == "running" and progress["eta_seconds"] is not None:
+        lines.append(f"ETA: {progress['eta_seconds']:.0f}s")
+    if status["version"]:
+        lines.append(f"Serving version {status['version']} with {status['total_chunks']} chunks")
+    if status["error"]:
+        lines.append(f"Error: {status['error']}")
+    return "\n".join(lines)
+
+def setup_handlers(application: Application, chat_service: ChatService, jobs: IngestJobRunner = ingest_jobs):
     """Setup all Telegram bot handlers."""
-    # Initialize processor
-    processor = DocumentProcessor(db)
-    
+    async def require_admin(update: Update) -> bool:
+        if update.effective_user.id not in ADMIN_USER_IDS:
+            await update.message.reply_text("❌ This command is only available for admins.")
+            return False
+        return True
+
     async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "Hello! I'm your RAG-powered assistant. Ask me any question about your documents!\n"
@@ -29,59 +60,107 @@ def setup_handlers(application: Application, db: Session, chat_service: ChatServ
             "/status - Check bot status\n"
         )
         if update.effective_user.id in ADMIN_USER_IDS:
-            help_text += "/process - Process documents (admin only)\n"
+            help_text += (
+                "/process - Process documents in the background, /process full to re-embed everything (admin only)\n"
+                "/process_status - Show the progress of document processing (admin only)\n"
+                "/process_cancel - Cancel document processing (admin only)\n"
+            )
         await update.message.reply_text(help_text)
     
     async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         status = "🟢 Bot is running"
-        if not chat_service.vector_store:
+        if retrieval_state() == "warming":
+            status += "\n⏳ Knowledge base is loading"
+        elif index_version() is None:
             status += "\n⚠️ Documents not processed yet"
         else:
             status += "\n✅ Documents processed and ready"
         await update.message.reply_text(status)
     
     async def process_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if update.effective_user.id not in ADMIN_USER_IDS:
-            await update.message.reply_text("❌ This command is only available for admins.")
+        if not await require_admin(update):
             return
-        
-        await update.message.reply_text("🔄 Starting document processing...")
-        
+
         try:
-            vector_store = await processor.process_documents()
-            if vector_store:
-                await chat_service.set_vector_store(vector_store)
-                await update.message.reply_text("✅ Document processing completed successfully!")
-                logger.info("System initialization complete!")
-            else:
-                await update.message.reply_text("⚠️ No documents were processed, but the system is still operational.")
-                logger.warning("No documents were processed")
-        except Exception as e:
-            logger.error(f"Error during processing: {str(e)}")
+            # Runs in a worker thread, so questions keep being answered meanwhile
+            job = jobs.start(f"telegram:{update.effective_user.id}", full_rebuild="full" in (context.args or []))
+        except IngestJobRunning as e:
             await update.message.reply_text(
-                "⚠️ There was an error processing documents, but the system is still operational. "
-                "You can try processing again later."
+                f"⏳ Document processing is already running.\n\n{format_job_status(e.job.status())}"
             )
+            return
+        await update.message.reply_text(
+            f"🔄 Started document processing (job {job.id}).\n"
+            "Use /process_status to follow it and /process_cancel to stop it."
+        )
+
+        async def report():
+            # Processing publishes a new store version that searches switch to immediately
+            await asyncio.wrap_future(job.done)
+            if job.state == "succeeded" and job.total_chunks:
+                await update.message.reply_text(
+                    f"✅ Document processing completed successfully! Serving version {index_version()}."
+                )
+            elif job.state == "succeeded":
+                await update.message.reply_text("⚠️ No documents were processed, but the system is still operational.")
+            elif job.state == "cancelled":
+                await update.message.reply_text("⏹ Document processing was cancelled, nothing was changed.")
+            else:
+                await update.message.reply_text(
+                    "⚠️ There was an error processing documents, but the system is still operational. "
+                    "You can try processing again later."
+                )
+
+        # Not awaited here: the admin's later commands would queue behind it
+        context.application.create_task(report(), update=update)
+
+    async def process_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await require_admin(update):
+            return
+        await update.message.reply_text(format_job_status(jobs.status()))
+
+    async def process_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await require_admin(update):
+            return
+        if jobs.cancel():
+            await update.message.reply_text("⏹ Cancelling document processing...")
+        elif jobs.current is not None and jobs.current.running:
+            await update.message.reply_text("⏳ Document processing is already saving its results and can't be cancelled.")
+        else:
+            await update.message.reply_text("No document processing is running.")
     
     async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        streamer = MessageStreamer(update.message)
+        started = time.perf_counter()
         try:
             question = update.message.text
             user_id = update.effective_user.id
             logger.info(f"Received Telegram query: {question}")
             
-            result = await chat_service.answer_question(user_id, question)
-            result_markdown_tgv2 = telegramify_markdown.markdownify(result)
-            await update.message.reply_markdown_v2(result_markdown_tgv2)
+            # Show a placeholder right away and edit it as the agent works
+            await streamer.start()
+            answer = ""
+            async for kind, text in chat_service.stream_answer(user_id, question):
+                if kind == "status":
+                    await streamer.update(text)
+                elif kind == "partial":
+                    await streamer.update(text + " ▌")
+                else:
+                    answer = text
+            await streamer.finish(answer)
             logger.info("Query processed and response sent successfully")
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
-            await update.message.reply_text(
-                "I'm having trouble processing your question right now. Please try again later."
-            )
+            # Replaces the placeholder, which would otherwise stay on the thinking or partial text
+            await streamer.fail("I'm having trouble processing your question right now. Please try again later.")
+        finally:
+            observe("telegram_message", time.perf_counter() - started)
     
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("status", status_command))
     application.add_handler(CommandHandler("process", process_command))
+    application.add_handler(CommandHandler("process_status", process_status_command))
+    application.add_handler(CommandHandler("process_cancel", process_cancel_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)) 
\ No newline at end of file
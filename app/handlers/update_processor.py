@@ -0,0 +1,101 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from app.config.settings import TELEGRAM_MAX_IN_FLIGHT, TELEGRAM_MAX_QUEUED
+from app.services.metrics import observe
+
+logger = logging.getLogger(__name__)
+
+OVERLOADED_MESSAGE = "⏳ I'm answering a lot of questions right now, please try again in a minute."
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in order.
+
+    A user's updates run one at a time because the chat memory is per user
+    thread. At most max_in_flight updates run at once; up to max_queued more
+    wait, and anything beyond that is answered with an overload notice.
+    """
+
+    def __init__(self, max_in_flight: int = TELEGRAM_MAX_IN_FLIGHT, max_queued: int = TELEGRAM_MAX_QUEUED):
+        # PTB holds its own slot for every update it hands over, so leave room
+        # for the quick overload replies instead of making them wait too
+        super().__init__(max_in_flight + 2 * max_queued)
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self._slots = None
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_waiters: Dict[int, int] = {}
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "queued": self.queued, "rejected": self.rejected}
+
+    @asynccontextmanager
+    async def _user_turn(self, user_id: Optional[int]):
+        """Hold the user's lock, dropping it once nobody is waiting on it."""
+        if user_id is None:
+            yield
+            return
+        self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        try:
+            async with lock:
+                yield
+        finally:
+            self._user_waiters[user_id] -= 1
+            if not self._user_waiters[user_id]:
+                del self._user_waiters[user_id]
+                del self._user_locks[user_id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self._slots is None:
+            await self.initialize()
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            coroutine.close()
+            logger.warning(f"Overloaded ({self.in_flight} running, {self.queued} queued), rejecting update")
+            await self._reply_overloaded(update)
+            return
+
+        user = getattr(update, "effective_user", None)
+        self.queued += 1
+        started = False
+        queued_at = time.perf_counter()
+        try:
+            # Wait for the user's earlier updates first so they don't hold a global slot meanwhile
+            async with self._user_turn(user.id if user else None):
+                async with self._slots:
+                    self.queued -= 1
+                    started = True
+                    observe("telegram_queue_wait", time.perf_counter() - queued_at)
+                    self.in_flight += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            if not started:
+                self.queued -= 1
+                coroutine.close()
+
+    async def _reply_overloaded(self, update: object):
+        message = getattr(update, "effective_message", None)
+        if message is None:
+            return
+        try:
+            await message.reply_text(OVERLOADED_MESSAGE)
+        except Exception as e:
+            logger.error(f"Error sending overload notice: {str(e)}")
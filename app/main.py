@@ -1,18 +1,17 @@
+import time
 import logging
 import uvicorn
-from sqlalchemy.orm import Session
 import signal
 import sys
 import os
 import threading
 import atexit
 
-from app.config.settings import PORT, TELEGRAM_TOKEN
-from app.models.database import init_db, get_session_maker
+# Imported first so startup time is measured from here
+from app.services import readiness
+from app.config.settings import PORT, TELEGRAM_TOKEN, VECTOR_BACKEND
+from app.models.database import init_db
 from app.handlers.api import APIServer
-from app.handlers.telegram import setup_handlers
-from app.services.chat_service import ChatService
-from telegram.ext import Application
 
 # Configure logging
 logging.basicConfig(
@@ -22,38 +21,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def start_api_server(app) -> uvicorn.Server:
+    """Start the FastAPI server in a daemon thread and wait until it is listening."""
+    server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=PORT))
+    fastapi_thread = threading.Thread(target=server.run)
+    fastapi_thread.daemon = True
+    fastapi_thread.start()
+    while not server.started and fastapi_thread.is_alive():
+        time.sleep(0.01)
+    return server
+
 def run():
     """Run the application."""
     try:
         # Initialize database
         logger.info("Initializing database...")
-        engine = init_db()
-        SessionLocal = get_session_maker(engine)
-        db = SessionLocal()
-        
-        # Initialize ChatService
-        logger.info("Initializing ChatService...")
-        chat_service = ChatService()
+        init_db().dispose()
         
-        # Initialize FastAPI server
+        # Initialize FastAPI server first so /health answers while the rest warms up
         logger.info("Initializing FastAPI server...")
         api_server = APIServer()
         app = api_server.get_app()
+        start_api_server(app)
+        readiness.mark_accepting_traffic()
         
-        # Start FastAPI server in a separate thread
-        fastapi_thread = threading.Thread(
-            target=lambda: uvicorn.run(app, host="0.0.0.0", port=PORT)
-        )
-        fastapi_thread.daemon = True
-        fastapi_thread.start()
+        # The agent stack is slow to import, so it is loaded once the server is up
+        from app.handlers.telegram import setup_handlers
+        from app.handlers.update_processor import ChatUpdateProcessor
+        from app.services.chat_service import ChatService
+        from app.tools.search_tool import warm_up
+        from telegram.ext import Application
+
+        if VECTOR_BACKEND == "pgvector":
+            # Schema changes happen once here, so ingestion needs no rights beyond writing rows
+            from app.services.pgvector_store import pgvector_store
+            pgvector_store.setup()
+
+        # Load the knowledge store in the background; searches report it as warming meanwhile
+        warm_up()
+        
+        # Initialize ChatService
+        logger.info("Initializing ChatService...")
+        chat_service = ChatService()
+
+        async def start_chat(_):
+            # The agent lives on the bot's event loop; the API hands its queries over to it
+            await chat_service.start()
+            api_server.set_chat_service(chat_service)
+            readiness.set_component_state("chat", "ready")
+
+        async def shutdown(_):
+            await chat_service.close()
         
         # Initialize and run Telegram bot
         logger.info("Initializing Telegram bot...")
         if not TELEGRAM_TOKEN:
             raise ValueError("TELEGRAM_TOKEN environment variable is not set")
         
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
-        setup_handlers(application, db, chat_service)
+        # Different users are answered concurrently; each user's messages stay in order
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .concurrent_updates(ChatUpdateProcessor())
+            .post_init(start_chat)
+            .post_shutdown(shutdown)
+            .build()
+        )
+        setup_handlers(application, chat_service)
         application.run_polling()
         
     except Exception as e:
@@ -69,4 +103,4 @@ def cleanup():
 atexit.register(cleanup)
 
 if __name__ == "__main__":
-    run() 
\ No newline at end of file
+    run()
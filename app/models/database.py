@@ -1,7 +1,22 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey
+import logging
+from typing import List
+import numpy as np
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Text, ForeignKey, LargeBinary
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from app.config.settings import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config.settings import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -10,8 +25,9 @@ class Document(Base):
     __tablename__ = "documents"
 
     id = Column(Integer, primary_key=True)
-    filename = Column(String(255), nullable=False)
-    content = Column(Text, nullable=False)
+    filename = Column(String(255), nullable=False, unique=True)
+    sha256 = Column(String(64), nullable=False)
+    content = Column(Text)  # No longer stored; chunks keep their text and offsets into the file
     
     # Relationship with text chunks
     chunks = relationship("TextChunk", back_populates="document", cascade="all, delete-orphan")
@@ -21,19 +37,107 @@ class TextChunk(Base):
     __tablename__ = "text_chunks"
 
     id = Column(Integer, primary_key=True)
+    chunk_id = Column(String(64), nullable=False, unique=True)  # Id of the chunk in the vector store
+    chunk_index = Column(Integer, nullable=False)  # Position of the chunk within its document
+    byte_offset = Column(Integer, nullable=False)  # Where the chunk starts in the source file
+    byte_length = Column(Integer, nullable=False)  # Length of the chunk in the source file, in bytes
+    section = Column(String(255), nullable=False, default="")  # Enclosing 卷/篇/章 headings
     content = Column(Text, nullable=False)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
-    embedding = Column(Text, nullable=False)  # Store embeddings as JSON string
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    embedding = Column(LargeBinary, nullable=False)  # Raw little-endian float16/float32 vector
+    embedding_dtype = Column(String(8), nullable=False, default="float32")
     
     # Relationship with document
     document = relationship("Document", back_populates="chunks")
 
-def init_db():
-    """Initialize the database and create tables."""
-    engine = create_engine(DATABASE_URL)
-    Base.metadata.create_all(bind=engine)
+def encode_vector(vector: List[float], dtype: str = "float32") -> bytes:
+    """Pack an embedding into compact little-endian binary for storage."""
+    return np.asarray(vector, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+
+def decode_vector(blob: bytes, dtype: str = "float32") -> np.ndarray:
+    """Unpack a stored embedding into a float32 array."""
+    return np.frombuffer(blob, dtype=np.dtype(dtype).newbyteorder("<")).astype(np.float32)
+
+def drop_legacy_tables(connection: Connection) -> bool:
+    """Drop documents and text_chunks if they were created with columns the models no longer match.
+
+    create_all never alters an existing table, so databases created before the
+    chunk ids, offsets and binary embeddings would otherwise fail on every
+    ingestion. The old schema's rows have no chunk ids to keep, so the tables
+    are recreated empty and /process fills them again.
+
+    Returns:
+        bool: Whether the tables were dropped
+    """
+    inspector = inspect(connection)
+    tables = (TextChunk.__table__, Document.__table__)  # dependants first
+    legacy = [
+        table.name for table in tables
+        if inspector.has_table(table.name)
+        and {column.name for column in table.columns} - {column["name"] for column in inspector.get_columns(table.name)}
+    ]
+    if not legacy:
+        return False
+    logger.warning(f"Recreating outdated tables {', '.join(legacy)}; run /process to fill them again")
+    for table in tables:
+        table.drop(connection, checkfirst=True)
+    return True
+
+def init_db(url: str = DATABASE_URL):
+    """Initialize the database, replacing outdated tables, and create tables."""
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        drop_legacy_tables(connection)
+        Base.metadata.create_all(bind=connection)
     return engine
 
 def get_session_maker(engine):
     """Create a session maker for database operations."""
-    return sessionmaker(autocommit=False, autoflush=False, bind=engine) 
\ No newline at end of file
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def async_database_url(url: str = DATABASE_URL) -> str:
+    """The async driver variant of a database URL: aiosqlite for SQLite, asyncpg for PostgreSQL."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    elif backend in ("postgresql", "postgres"):
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+def init_async_db(url: str = DATABASE_URL) -> AsyncEngine:
+    """Create the pooled async engine; connections are opened on the event loop that first uses it.
+
+    Tables are created by init_db(), which runs once at startup.
+    """
+    url = async_database_url(url)
+    pool_options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+    }
+    url_parts = make_url(url)
+    if url_parts.get_backend_name() != "sqlite":
+        return create_async_engine(url, **pool_options)
+    if url_parts.database in (None, "", ":memory:"):
+        return create_async_engine(url)
+
+    # aiosqlite defaults to a new connection (and thread) per session; keep a few open instead
+    engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, **pool_options)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def configure_sqlite(dbapi_connection, _):
+        # WAL lets readers run while ingestion writes; busy_timeout waits out a concurrent writer
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+    return engine
+
+def get_async_session_maker(engine: AsyncEngine) -> async_sessionmaker:
+    """Create a session maker for async database operations, one session per unit of work."""
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
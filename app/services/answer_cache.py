@@ -0,0 +1,77 @@
+import logging
+from typing import Hashable, List, Optional
+
+import numpy as np
+
+from app.config.settings import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY
+from app.services.query_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class SemanticAnswerCache:
+    """Answers to opening questions, found again by exact text or by embedding similarity.
+
+    Entries belong to a scope, such as the current 節氣 and index version,
+    and are only ever matched within it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        threshold: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.entries = TTLCache(max_entries, ttl_seconds)
+        self.threshold = threshold
+
+    @property
+    def enabled(self) -> bool:
+        return self.entries.max_entries > 0
+
+    def get(self, scope: Hashable, question: str, vector: Optional[List[float]] = None) -> Optional[str]:
+        """The cached answer to the same question, or to the most similar one above the threshold.
+
+        Args:
+            scope: Scope the answer must have been stored under
+            question: Normalized question
+            vector: Embedding of the question, if available
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss
+        """
+        entry = self.entries.get((scope, question))
+        if entry is not None:
+            return entry[1]
+        if vector is None:
+            return None
+
+        candidates = [
+            (key, value) for key, value in self.entries.items() if key[0] == scope and value[0] is not None
+        ]
+        if not candidates:
+            return None
+        matrix = np.stack([value[0] for _, value in candidates])
+        scores = matrix @ _unit(vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        key, (_, answer) = candidates[best]
+        logger.info(f"Answer cache matched '{question}' to '{key[1]}' (similarity {scores[best]:.3f})")
+        # Count the hit and refresh the entry's recency
+        self.entries.get(key)
+        return answer
+
+    def set(self, scope: Hashable, question: str, vector: Optional[List[float]], answer: str):
+        """Remember the answer to a normalized question."""
+        self.entries.set((scope, question), (None if vector is None else _unit(vector), answer))
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+# Shared by every chat front end in the process
+answer_cache = SemanticAnswerCache()
@@ -1,13 +1,21 @@
+import asyncio
 import logging
 import os
 import sys
+import time
 from langchain_openai.chat_models.base import BaseChatOpenAI
 from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+from typing import AsyncIterator, Optional, Tuple
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
 
-from app.tools.search_tool import search_documents
-from app.tools.time_tool import get_time_and_season
+from app.services.answer_cache import answer_cache
+from app.services.conversation_memory import open_checkpointer, trim_history
+from app.services.metrics import AgentMetrics, observe, timed
+from app.services.query_cache import normalize_query
+from app.services.vector_store_registry import registry
+from app.tools.search_tool import embed_question, index_version, search_documents, search_documents_batch
+from app.tools.time_tool import solar_context, time_context
 
 # Configure logging
 logging.getLogger("httpx").setLevel(logging.WARNING)  # Suppress HTTP logs
@@ -26,6 +34,52 @@ root_logger.addHandler(console_handler)
 
 logger = logging.getLogger(__name__)
 
+ERROR_ANSWER = "I encountered an error while processing your question. Please try again later."
+
+# Progress shown to the user while a tool runs
+TOOL_STATUS = {
+    "search_documents": "📚 查閱典籍：{query}…",
+    "search_documents_batch": "📚 查閱典籍：{queries}…",
+}
+
+def tool_status(tool_calls: list) -> str:
+    """One status line per tool call, e.g. '📚 查閱典籍：桂枝湯…'."""
+    lines = []
+    for tool_call in tool_calls:
+        template = TOOL_STATUS.get(tool_call["name"], "🔧 {name}…")
+        args = {
+            key: "、".join(map(str, value)) if isinstance(value, list) else value
+            for key, value in tool_call.get("args", {}).items()
+        }
+        try:
+            lines.append(template.format(name=tool_call["name"], **args))
+        except (KeyError, IndexError, TypeError):
+            lines.append(f"🔧 {tool_call['name']}…")
+    return "\n".join(lines)
+
+SYSTEM_PROMPT = """你是個熟悉中醫理論的中醫師，請利用你的中醫知識，配合中文醫學典籍，回答使用者提出的問題。
+
+你依照用戶的使用語言回答問題，記得引用經典時，使用引號包起來。
+
+必要工具 (MUST USE Tools) -- ALWAYS use the following tool
+
+1. 非常重要：使用 search_documents 工具來從中醫典籍中查找相關信息。使用簡潔的搜尋關鍵字
+[This is very important, You MUST use this tool to find the relevant information, weather to do additional research or to double check the answer]
+
+2. 需要查找多個關鍵字時，使用 search_documents_batch 工具一次查完，例如 ["咳嗽", "肺氣虛", "止咳穴道"]，不要逐個呼叫 search_documents。
+[When several keywords are needed, search them in one search_documents_batch call. Tool calls that don't depend on each other should be made together in the same turn, they run in parallel]
+
+當前時令 (Current season) -- 非常重要：依照以下的節氣、時辰，讓建議切合當下的時令。
+[This is very important], Use it to give advice that is accurate and suits the current environment.
+
+"""
+
+def build_prompt(state: dict) -> list:
+    """System prompt with the current 節氣 and 時辰, which saves the model a tool call per question."""
+    with timed("time_context"):
+        context = time_context()
+    return [SystemMessage(content=SYSTEM_PROMPT + context)] + state["messages"]
+
 class ChatService:
     """Handles chat interactions using ReAct agent."""
     
@@ -34,10 +88,17 @@ class ChatService:
         self.llm = self._init_llm()
         logger.info("LLM initialized")
         
-        # Initialize agent with search tool
-        self.agent = self._create_agent()
+        # The agent is created on first use, since its SQLite checkpointer belongs to the running event loop
+        self.agent = None
+        self.loop = None
+        self._agent_lock = asyncio.Lock()
         logger.info("ChatService fully initialized and ready")
     
+    @property
+    def vector_store(self):
+        """The vector store version currently served to the search tool."""
+        return registry.current_store
+
     def _init_llm(self):
         """Initialize the Claude LLM."""
         try:
@@ -49,7 +110,8 @@ class ChatService:
                 model='deepseek-chat',
                 openai_api_key=api_key,
                 openai_api_base='https://api.deepseek.com/v1',
-                max_tokens=4096
+                max_tokens=4096,
+                stream_usage=True  # token counts for streamed answers too
             )
 
             return llm
@@ -57,32 +119,70 @@ class ChatService:
             logger.error(f"Failed to initialize LLM: {str(e)}")
             raise
     
-    def _create_agent(self):
-        """Create the ReAct agent with the search tool."""
-        try:
-            system_prompt = """你是個熟悉中醫理論的中醫師，請利用你的中醫知識，配合中文醫學典籍，回答使用者提出的問題。
+    async def _get_agent(self):
+        """Create the agent and open its conversation memory on first use."""
+        async with self._agent_lock:
+            if self.agent is None:
+                self.agent = self._create_agent(await open_checkpointer())
+                self.loop = asyncio.get_running_loop()
+        return self.agent
 
-                你依照用戶的使用語言回答問題，記得引用經典時，使用引號包起來。
-                
-                必要工具 (MUST USE Tools) -- ALWAYS use the following tools
+    async def start(self):
+        """Open the agent on the running loop; callers on other loops must hand their calls to self.loop."""
+        await self._get_agent()
 
-                1. 非常重要：使用 search_documents 工具來從中醫典籍中查找相關信息。使用簡潔的搜尋關鍵字
-                [This is very important, You MUST use this tool to find the relevant information, weather to do additional research or to double check the answer]
-                
-                2. 非常重要：使用 get_time_and_season 工具來獲取當前的節氣、時辰。 
-                [This tool is very important], Must use this to give the advice that is accurate and suit the current environment. 
+    async def close(self):
+        """Close the conversation memory; its connection thread would otherwise keep the process alive."""
+        async with self._agent_lock:
+            if self.agent is not None:
+                await self.agent.checkpointer.conn.close()
+                self.agent = None
+                self.loop = None
 
-                """
-            
-            memory = MemorySaver()
+    async def _cached_answer(self, agent, config: dict, question: str) -> Tuple[Optional[str], Optional[tuple]]:
+        """Look a conversation's opening question up in the answer cache.
+
+        Returns:
+            Tuple[Optional[str], Optional[tuple]]: The cached answer or None, and the key to
+            store the real answer under, which is None when the cache doesn't apply
+        """
+        # Later turns depend on the conversation so far, and answers on the season and the texts
+        version = index_version()
+        if not answer_cache.enabled or version is None or (await agent.aget_state(config)).values.get("messages"):
+            return None, None
+        with timed("answer_cache"):
+            scope = (*solar_context(), version)
+            question = normalize_query(question)
 
+            answer = answer_cache.get(scope, question)
+            vector = None
+            if answer is None:
+                vector = await asyncio.to_thread(embed_question, question)
+                answer = answer_cache.get(scope, question, vector)
+        return answer, (scope, question, vector)
+
+    async def _remember(self, agent, config: dict, question: str, answer: str, cache_key: Optional[tuple], hit: bool):
+        """Store a fresh answer in the cache, or record a cached one in the conversation."""
+        if cache_key is None or answer == ERROR_ANSWER:
+            return
+        if hit:
+            # Follow-up questions need the exchange in the thread's history
+            await agent.aupdate_state(
+                config, {"messages": [HumanMessage(content=question), AIMessage(content=answer)]}, as_node="agent"
+            )
+        else:
+            answer_cache.set(*cache_key, answer)
 
-            # Create the agent
+    def _create_agent(self, checkpointer: BaseCheckpointSaver):
+        """Create the ReAct agent with the search tool."""
+        try:
+            # Create the agent; earlier turns are trimmed before every model call
             agent = create_react_agent(
                 model=self.llm,
-                tools=[search_documents, get_time_and_season],
-                prompt=system_prompt,
-                checkpointer=memory
+                tools=[search_documents, search_documents_batch],
+                prompt=build_prompt,
+                pre_model_hook=trim_history,
+                checkpointer=checkpointer
             )
             
             logger.info("ReAct agent created successfully")
@@ -93,22 +193,98 @@ class ChatService:
     
     async def answer_question(self, user_id: str, question: str) -> str:
         """Answer a question using the ReAct agent."""
+        metrics = AgentMetrics()
+        started = time.perf_counter()
         try:
             logger.info(f"🤔 Processing question: {question}")
             
-            config = {"configurable": {"thread_id": user_id}}
+            config = {"configurable": {"thread_id": user_id}, "callbacks": [metrics]}
+
+            agent = await self._get_agent()
+            cached, cache_key = await self._cached_answer(agent, config, question)
+            if cached is not None:
+                logger.info("💡 Answered from the answer cache")
+                await self._remember(agent, config, question, cached, cache_key, hit=True)
+                metrics.finish("cache")
+                return cached
 
             # Invoke the agent
-            response = await self.agent.ainvoke({
+            response = await agent.ainvoke({
                 "messages": [HumanMessage(content=question)],
             }, config)
 
             logger.info(f"💡 All response: {response}")
 
             answer = response["messages"][-1].content
+            await self._remember(agent, config, question, answer, cache_key, hit=False)
+            metrics.finish("model")
             
             logger.info(f"💡 Generated answer: {answer[:100]}...")
             return answer
         except Exception as e:
             logger.error(f"❌ Error answering question: {str(e)}")
-            return "I encountered an error while processing your question. Please try again later." 
\ No newline at end of file
+            metrics.finish("error")
+            return ERROR_ANSWER
+        finally:
+            observe("answer", time.perf_counter() - started)
+
+    async def stream_answer(self, user_id: str, question: str) -> AsyncIterator[Tuple[str, str]]:
+        """Answer a question, reporting progress while the agent works.
+
+        Yields:
+            Tuple[str, str]: ("status", text) when a tool starts, ("partial", text) with the
+            answer so far as tokens arrive, and finally ("answer", text) with the full answer
+        """
+        metrics = AgentMetrics()
+        started = time.perf_counter()
+        try:
+            logger.info(f"🤔 Processing question (streaming): {question}")
+            config = {"configurable": {"thread_id": user_id}, "callbacks": [metrics]}
+            agent = await self._get_agent()
+            cached, cache_key = await self._cached_answer(agent, config, question)
+            if cached is not None:
+                logger.info("💡 Answered from the answer cache")
+                await self._remember(agent, config, question, cached, cache_key, hit=True)
+                metrics.finish("cache")
+                observe("answer", time.perf_counter() - started)
+                yield "answer", cached
+                return
+
+            partial, answer = "", ""
+            answer_started = False
+            async for mode, chunk in agent.astream(
+                {"messages": [HumanMessage(content=question)]}, config, stream_mode=["messages", "updates"]
+            ):
+                if mode == "messages":
+                    token, metadata = chunk
+                    if isinstance(token, AIMessageChunk) and metadata.get("langgraph_node") == "agent":
+                        if token.tool_call_chunks:
+                            # Text before a tool call is not the answer
+                            partial = ""
+                        elif isinstance(token.content, str) and token.content:
+                            if not answer_started:
+                                answer_started = True
+                                observe("first_token", time.perf_counter() - started)
+                            partial += token.content
+                            yield "partial", partial
+                elif mode == "updates":
+                    for message in (chunk.get("agent") or {}).get("messages", []):
+                        if not isinstance(message, AIMessage):
+                            continue
+                        if message.tool_calls:
+                            partial = ""
+                            yield "status", tool_status(message.tool_calls)
+                        else:
+                            answer = message.content
+
+            answer = answer or partial
+            logger.info(f"💡 Generated answer: {answer[:100]}...")
+            await self._remember(agent, config, question, answer, cache_key, hit=False)
+            metrics.finish("model")
+            observe("answer", time.perf_counter() - started)
+            yield "answer", answer
+        except Exception as e:
+            logger.error(f"❌ Error answering question: {str(e)}")
+            metrics.finish("error")
+            observe("answer", time.perf_counter() - started)
+            yield "answer", ERROR_ANSWER 
\ No newline at end of file
@@ -0,0 +1,198 @@
+import os
+import re
+import logging
+from typing import List, Set
+
+from langchain_core.documents import Document
+
+from app.config.settings import (
+    SEARCH_TOP_K,
+    SEARCH_CONTEXT_TOKEN_BUDGET,
+    SEARCH_MMR_LAMBDA,
+    SEARCH_DUPLICATE_THRESHOLD,
+)
+from app.services.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Longest overlap looked for between neighbouring chunks without offsets
+MAX_OVERLAP_CHARS = 400
+
+# Chunks this close in the source file are merged as one passage
+MAX_GAP_BYTES = 8
+
+class Passage:
+    """A run of text from one source, built from one or more retrieved chunks."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.source = doc.metadata.get("source", "")
+        self.section = doc.metadata.get("section", "")
+        self.last_chunk = doc.metadata.get("chunk")
+        self.end = _end(doc)  # byte offset in the source file where the passage ends
+        self.text = doc.page_content
+        self.rank = rank  # best retrieval rank among the merged chunks
+        self.shingles = _shingles(self.text)
+
+    def follows(self, doc: Document) -> bool:
+        """Whether the chunk overlaps or directly continues this passage."""
+        if self.source != doc.metadata.get("source", "") or not self.source:
+            return False
+        offset = doc.metadata.get("offset")
+        if self.end is not None and offset is not None:
+            return offset <= self.end + MAX_GAP_BYTES
+        chunk = doc.metadata.get("chunk")
+        return self.last_chunk is not None and chunk is not None and chunk - self.last_chunk in (0, 1)
+
+    def extend(self, doc: Document, rank: int):
+        offset, end = doc.metadata.get("offset"), _end(doc)
+        if self.end is not None and offset is not None:
+            if end > self.end:
+                # Offsets give the overlap exactly; skip the bytes already in the passage
+                shared = max(0, self.end - offset)
+                rest = doc.page_content.encode("utf-8")[shared:].decode("utf-8", errors="ignore")
+                # Chunks are stripped, so a small gap between them was whitespace
+                self.text += ("\n" if offset > self.end else "") + rest
+                self.end = end
+        elif doc.metadata.get("chunk") != self.last_chunk:
+            self.text = _join(self.text, doc.page_content)
+        self.last_chunk = doc.metadata.get("chunk")
+        self.rank = min(self.rank, rank)
+        self.shingles = _shingles(self.text)
+
+def _end(doc: Document):
+    offset, length = doc.metadata.get("offset"), doc.metadata.get("length")
+    return None if offset is None or length is None else offset + length
+
+def _shingles(text: str) -> Set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _similarity(a: Passage, b: Passage) -> float:
+    """Jaccard similarity of the passages' character bigrams."""
+    if not a.shingles or not b.shingles:
+        return 0.0
+    return len(a.shingles & b.shingles) / len(a.shingles | b.shingles)
+
+def _containment(a: Passage, b: Passage) -> float:
+    """Share of the smaller passage's bigrams that also appear in the other."""
+    if not a.shingles or not b.shingles:
+        return 0.0
+    return len(a.shingles & b.shingles) / min(len(a.shingles), len(b.shingles))
+
+def _join(left: str, right: str) -> str:
+    """Concatenate neighbouring chunks, dropping the text they share."""
+    limit = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(limit, 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + right
+
+def source_label(source: str) -> str:
+    """Readable book title from a file name like 'CM001-醫宗金鑑 File_1039.txt'."""
+    name = os.path.splitext(os.path.basename(source))[0]
+    name = re.sub(r"^CM\d+-", "", name)
+    return re.sub(r"\s*File_\d+\s*$", "", name).strip()
+
+def passage_label(passage: Passage) -> str:
+    """Book title plus the innermost named section, e.g. '醫宗金鑑 · 辨太陽病脈證並治上篇'."""
+    names = [name for name in passage.section.split(" / ") if name and not name.isdigit()]
+    return " · ".join([source_label(passage.source)] + names[-1:])
+
+def merge_adjacent(docs: List[Document]) -> List[Passage]:
+    """Merge retrieved chunks that overlap or follow each other in the same source."""
+    passages: List[Passage] = []
+    by_position = sorted(
+        enumerate(docs),
+        key=lambda item: (
+            item[1].metadata.get("source", ""),
+            item[1].metadata.get("offset", item[1].metadata.get("chunk", -1)),
+            item[0],
+        )
+    )
+    for rank, doc in by_position:
+        if passages and passages[-1].follows(doc):
+            passages[-1].extend(doc, rank)
+        else:
+            passages.append(Passage(doc, rank))
+    return sorted(passages, key=lambda passage: passage.rank)
+
+def drop_near_duplicates(passages: List[Passage], threshold: float = SEARCH_DUPLICATE_THRESHOLD) -> List[Passage]:
+    """Keep only the best-ranked of passages that repeat each other's text.
+
+    Containment rather than Jaccard, so a chunk quoted inside a longer
+    merged passage (common across commentaries) counts as a repeat.
+    """
+    kept: List[Passage] = []
+    for passage in passages:
+        if all(_containment(passage, other) < threshold for other in kept):
+            kept.append(passage)
+    return kept
+
+def mmr_order(passages: List[Passage], lambda_mult: float = SEARCH_MMR_LAMBDA) -> List[Passage]:
+    """Order passages by maximal marginal relevance.
+
+    Relevance is the reciprocal retrieval rank and redundancy the bigram
+    similarity to passages already chosen, so no extra embeddings are needed.
+    """
+    remaining = list(passages)
+    chosen: List[Passage] = []
+    while remaining:
+        def score(passage: Passage) -> float:
+            redundancy = max((_similarity(passage, other) for other in chosen), default=0.0)
+            return lambda_mult / (1 + passage.rank) - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=score)
+        remaining.remove(best)
+        chosen.append(best)
+    return chosen
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text to fit max_tokens, preferably at the end of a sentence."""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    boundary = max(cut.rfind(mark) for mark in "。！？\n")
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary + 1]
+    return cut
+
+def pack_context(
+    docs: List[Document],
+    token_budget: int = SEARCH_CONTEXT_TOKEN_BUDGET,
+    max_passages: int = SEARCH_TOP_K,
+) -> str:
+    """Turn ranked chunks into a compact, diverse context within a token budget.
+
+    Args:
+        docs: Retrieved chunks, best first
+        token_budget: Maximum tokens of the returned text
+        max_passages: Maximum number of passages to return
+
+    Returns:
+        str: Passages headed by their book title, separated by blank lines
+    """
+    passages = mmr_order(drop_near_duplicates(merge_adjacent(docs)))[:max_passages]
+
+    parts, used = [], 0
+    for passage in passages:
+        header = f"【{passage_label(passage)}】\n" if passage.source else ""
+        separator = 2 if parts else 0
+        available = token_budget - used - separator - count_tokens(header)
+        if available <= 0:
+            break
+        text = passage.text.strip()
+        tokens = count_tokens(text)
+        if tokens > available:
+            # Only worth including a fragment if a meaningful part fits
+            if available < 50:
+                break
+            text = _truncate(text, available)
+            tokens = count_tokens(text)
+        parts.append(header + text)
+        used += separator + count_tokens(header) + tokens
+
+    logger.info(f"Packed {len(docs)} chunks into {len(parts)} passages, about {used} tokens")
+    return "\n\n".join(parts)
@@ -0,0 +1,177 @@
+import time
+import logging
+from typing import List
+
+import aiosqlite
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, ToolMessage, trim_messages
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from app.config.settings import (
+    CHAT_MEMORY_PATH,
+    CHAT_MAX_THREADS,
+    CHAT_THREAD_IDLE_SECONDS,
+    CHAT_CHECKPOINTS_PER_THREAD,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    CHAT_OLD_TOOL_OUTPUT_CHARS,
+)
+from app.services.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Idle and surplus threads are looked for every this many saved checkpoints
+EVICT_EVERY = 100
+
+# Rough per-message overhead of the chat format, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class BoundedSqliteSaver(AsyncSqliteSaver):
+    """SQLite checkpointer that keeps a bounded number of threads and checkpoints.
+
+    Only the newest checkpoints of a thread are kept, which is all a chat
+    needs to continue. Threads idle for longer than idle_seconds, and the
+    least recently used ones beyond max_threads, are deleted.
+    """
+
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        max_threads: int = CHAT_MAX_THREADS,
+        idle_seconds: float = CHAT_THREAD_IDLE_SECONDS,
+        checkpoints_per_thread: int = CHAT_CHECKPOINTS_PER_THREAD,
+    ):
+        super().__init__(conn)
+        self.max_threads = max_threads
+        self.idle_seconds = idle_seconds
+        self.checkpoints_per_thread = checkpoints_per_thread
+        self._puts = 0
+
+    async def setup(self) -> None:
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            await self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_used REAL NOT NULL)"
+            )
+            await self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS thread_activity_last_used ON thread_activity (last_used)"
+            )
+            await self.conn.commit()
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await super().aput(config, checkpoint, metadata, new_versions)
+        await self._prune_thread(str(config["configurable"]["thread_id"]))
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            await self.evict_threads()
+        return next_config
+
+    async def _prune_thread(self, thread_id: str):
+        """Record the thread as used and drop all but its newest checkpoints."""
+        async with self.lock:
+            await self.conn.execute(
+                "INSERT INTO thread_activity (thread_id, last_used) VALUES (?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET last_used = excluded.last_used",
+                (thread_id, time.time()),
+            )
+            # Checkpoint ids are time-ordered, so the newest sort last
+            await self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT ?)",
+                (thread_id, thread_id, self.checkpoints_per_thread),
+            )
+            await self.conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)",
+                (thread_id, thread_id),
+            )
+            await self.conn.commit()
+
+    async def evict_threads(self) -> int:
+        """Delete idle threads and the least recently used ones beyond max_threads.
+
+        Returns:
+            int: Number of threads deleted
+        """
+        await self.setup()
+        async with self.lock:
+            cursor = await self.conn.execute(
+                "SELECT thread_id FROM thread_activity WHERE last_used < ? "
+                "UNION SELECT thread_id FROM "
+                "(SELECT thread_id FROM thread_activity ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (time.time() - self.idle_seconds, self.max_threads),
+            )
+            stale = [(thread_id,) for (thread_id,) in await cursor.fetchall()]
+            if stale:
+                await self.conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", stale)
+                await self.conn.executemany("DELETE FROM writes WHERE thread_id = ?", stale)
+                await self.conn.executemany("DELETE FROM thread_activity WHERE thread_id = ?", stale)
+                await self.conn.commit()
+        if stale:
+            logger.info(f"Evicted {len(stale)} idle conversation threads")
+        return len(stale)
+
+async def open_checkpointer(path: str = CHAT_MEMORY_PATH) -> BoundedSqliteSaver:
+    """Open the conversation checkpointer; must be called on the loop that will use it."""
+    saver = BoundedSqliteSaver(await aiosqlite.connect(path))
+    await saver.setup()
+    return saver
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """Approximate prompt tokens of messages, tool call arguments included."""
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(str(message.content))
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            total += count_tokens(str(tool_call.get("args", "")))
+    return total
+
+def compact_history(
+    messages: List[BaseMessage],
+    token_budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+    tool_output_chars: int = CHAT_OLD_TOOL_OUTPUT_CHARS,
+) -> List[BaseMessage]:
+    """Shrink earlier turns so the conversation fits a token budget.
+
+    The current turn (the last human message and everything after it) is
+    kept whole. In earlier turns, tool outputs are cut to a short excerpt,
+    since the answers that used them are kept, and then the oldest turns
+    are dropped until the rest fits token_budget.
+    """
+    last_human = next(
+        (i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), None
+    )
+    if not last_human:
+        return messages
+    history, current = messages[:last_human], messages[last_human:]
+
+    history = [
+        message.model_copy(update={"content": message.content[:tool_output_chars] + "…（已省略）"})
+        if isinstance(message, ToolMessage) and isinstance(message.content, str)
+        and len(message.content) > tool_output_chars + 10
+        else message
+        for message in history
+    ]
+    history = trim_messages(
+        history,
+        max_tokens=token_budget,
+        token_counter=count_message_tokens,
+        strategy="last",
+        start_on="human",
+        allow_partial=False,
+    )
+    return history + current
+
+def trim_history(state: dict) -> dict:
+    """pre_model_hook that keeps the stored conversation and the prompt bounded."""
+    messages = state["messages"]
+    compacted = compact_history(messages)
+    if len(compacted) == len(messages) and all(a is b for a, b in zip(compacted, messages)):
+        return {"llm_input_messages": messages}
+    logger.info(
+        f"Trimmed conversation from {len(messages)} to {len(compacted)} messages "
+        f"({count_message_tokens(messages)} to {count_message_tokens(compacted)} tokens)"
+    )
+    # Rewriting the state, not just the model input, keeps saved checkpoints small too
+    return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *compacted]}
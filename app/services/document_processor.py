@@ -1,103 +1,394 @@
 import os
+import time
+import asyncio
+import hashlib
 import logging
-from typing import List
-from sqlalchemy.orm import Session
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain.schema import Document as LangchainDocument
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
 
-from app.models.database import Document
-from app.config.settings import TEXT_DIRECTORY
+from app.models.database import Document, TextChunk, encode_vector, decode_vector
+from app.config.settings import (
+    TEXT_DIRECTORY,
+    EMBEDDING_STORAGE_DTYPE,
+    VECTOR_BACKEND,
+    VECTOR_INDEX_TYPE,
+    VECTOR_SEARCH_DIMENSIONS,
+    INGEST_WORKERS,
+)
+from app.services.embedding_cache import get_embeddings
+from app.services.embedding_pipeline import EmbeddingPipeline
+from app.services.index_factory import build_store, supports_removal
+from app.services.ingest_jobs import IngestProgress
+from app.services.metrics import observe, timed
+from app.services.pgvector_store import PgVectorStore, pgvector_store
+from app.services.text_chunker import split_file
+from app.services.vector_store_registry import VectorStoreRegistry, registry
 
-# Define vector store path
-VECTOR_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "knowledge")
+# Version of the manifest of per-file content hashes and the chunk ids they produced
+MANIFEST_VERSION = 2
 
 logger = logging.getLogger(__name__)
 
+def file_sha256(path: str) -> str:
+    """Compute the SHA-256 of a file without loading it all into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 class DocumentProcessor:
     """Handles document processing and vector store creation."""
-    
-    def __init__(self, db: Session):
-        self.db = db
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,  # Reduced chunk size
-            chunk_overlap=200,  # Reduced overlap
-            separators=["\n\n\n", "\n\n", "\n", "。", "！", "？", " ", ""]
-        )
+
+    def __init__(
+        self,
+        sessions: Optional[async_sessionmaker],
+        store_registry: VectorStoreRegistry = registry,
+        shared_index: Optional[PgVectorStore] = pgvector_store if VECTOR_BACKEND == "pgvector" else None,
+        embeddings: Optional[Embeddings] = None,
+        text_directory: Optional[str] = None,
+    ):
+        # Each unit of work opens its own session, so concurrent handlers never share one
+        self.sessions = sessions
+        self.registry = store_registry
+        # Vectors are also written to this index in the chunks' own transaction
+        self.shared_index = shared_index
+        self.embeddings = embeddings or get_embeddings()
+        self.text_directory = text_directory or TEXT_DIRECTORY
+        self.embedding_pipeline = EmbeddingPipeline(self.embeddings)
         self.vector_store = None
-    
+        # Replaced by the job runner with the progress of the job it runs
+        self.progress = IngestProgress()
+
     def _print_chunk_sample(self, chunk: str, chunk_num: int):
         """Print a formatted chunk sample with clear boundaries."""
         logger.info(f"\n{'='*80}\nCHUNK #{chunk_num}:\n{'-'*80}\n{chunk}\n{'='*80}\n")
-    
-    async def process_documents(self) -> FAISS:
-        """Process documents and create vector store.
-        
+
+    def _scan_files(self) -> Dict[str, str]:
+        """Map each text file (relative to the text directory) to its content hash."""
+        files = {}
+        for root, _, names in os.walk(self.text_directory):
+            for name in names:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, self.text_directory)] = file_sha256(path)
+        return dict(sorted(files.items()))
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        """Load the per-file manifest of the current vector store version."""
+        manifest = self.registry.load_manifest()
+        if manifest is None:
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            logger.warning("Manifest version mismatch, ignoring it")
+            return {}
+        if manifest.get("index_type", "flat") != VECTOR_INDEX_TYPE:
+            logger.info(f"Index type changed to {VECTOR_INDEX_TYPE}, rebuilding the index")
+            return {}
+        if manifest.get("search_dimensions", 0) != VECTOR_SEARCH_DIMENSIONS:
+            logger.info(f"Search dimensions changed to {VECTOR_SEARCH_DIMENSIONS}, rebuilding the index")
+            return {}
+        return manifest.get("files", {})
+
+    def _load_existing_store(self) -> Optional[FAISS]:
+        """Load a private copy of the current vector store version to update."""
+        name = self.registry.current_version()
+        if name is None:
+            return None
+        try:
+            return self.registry.load_store(name)
+        except Exception as e:
+            logger.warning(f"Could not load existing vector store, rebuilding: {str(e)}")
+            return None
+
+    def _save(self, manifest: Dict[str, dict]):
+        """Publish the vector store and its manifest as a new version."""
+        self.progress.set_stage("publishing")
+        with timed("ingest_publish"):
+            self.registry.publish(
+                self.vector_store,
+                {
+                    "version": MANIFEST_VERSION,
+                    "index_type": VECTOR_INDEX_TYPE,
+                    "search_dimensions": VECTOR_SEARCH_DIMENSIONS,
+                    "files": manifest,
+                }
+            )
+
+    async def _store_in_db(
+        self, stale_files: List[str], documents: List[dict], chunk_rows: List[dict], vectors: List[List[float]]
+    ):
+        """Replace the stored rows of changed files and bulk insert the new ones in one transaction."""
+        stale_ids = select(Document.id).where(Document.filename.in_(stale_files + [d["filename"] for d in documents]))
+        async with self.sessions() as session, session.begin():
+            await session.execute(delete(TextChunk).where(TextChunk.document_id.in_(stale_ids)))
+            await session.execute(delete(Document).where(Document.id.in_(stale_ids)))
+
+            if documents:
+                result = await session.execute(insert(Document).returning(Document.id, Document.filename), documents)
+                document_ids = {filename: document_id for document_id, filename in result}
+                rows = [
+                    {**{k: v for k, v in row.items() if k != "filename"}, "document_id": document_ids[row["filename"]]}
+                    for row in chunk_rows
+                ]
+                # Insert in slices to keep statements and parameter lists bounded
+                for start in range(0, len(rows), 1000):
+                    await session.execute(insert(TextChunk), rows[start:start + 1000])
+            if self.shared_index is not None:
+                await self.shared_index.write(session, [row["chunk_id"] for row in chunk_rows], vectors)
+                version = await self.shared_index.publish(session)
+                logger.info(f"Published pgvector index version {version}")
+        logger.info(f"Stored {len(documents)} documents and {len(chunk_rows)} chunks in the database")
+
+    async def _build_from_db(self) -> Tuple[Optional[FAISS], Dict[str, dict]]:
+        """Build a vector store and manifest from the vectors stored in the database."""
+        async with self.sessions() as session:
+            result = await session.execute(
+                select(
+                    Document.filename, Document.sha256, TextChunk.chunk_id, TextChunk.chunk_index,
+                    TextChunk.byte_offset, TextChunk.byte_length, TextChunk.section,
+                    TextChunk.content, TextChunk.embedding, TextChunk.embedding_dtype
+                )
+                .select_from(TextChunk)
+                .join(TextChunk.document)
+                .order_by(Document.filename, TextChunk.chunk_index)
+            )
+            rows = result.all()
+        # Decoding the vectors and building the index is CPU work, keep it off the event loop
+        return await asyncio.to_thread(self._build_store, rows)
+
+    def _build_store(self, rows: list) -> Tuple[Optional[FAISS], Dict[str, dict]]:
+        """Vector store and manifest from (filename, sha256, chunk_id, ..., embedding, dtype) rows."""
+        manifest, text_embeddings, metadatas, ids = {}, [], [], []
+        for filename, sha256, chunk_id, chunk_index, offset, length, section, content, blob, dtype in rows:
+            entry = manifest.setdefault(filename, {"sha256": sha256, "chunk_ids": []})
+            entry["chunk_ids"].append(chunk_id)
+            text_embeddings.append((content, decode_vector(blob, dtype).tolist()))
+            metadatas.append({
+                "source": filename, "chunk": chunk_index, "offset": offset, "length": length, "section": section
+            })
+            ids.append(chunk_id)
+        if not ids:
+            return None, {}
+        store = build_store(text_embeddings, self.embeddings, metadatas, ids)
+        return store, manifest
+
+    async def rebuild_from_db(self) -> Optional[FAISS]:
+        """Rebuild the vector store, and the shared index if any, from the database without embedding API calls.
+
         Returns:
-            FAISS: The created vector store
+            FAISS: The rebuilt vector store, or None if the database holds no chunks
         """
-        if not os.path.exists(TEXT_DIRECTORY):
-            logger.warning(f"Directory {TEXT_DIRECTORY} does not exist. Creating it...")
-            os.makedirs(TEXT_DIRECTORY)
-        
-        # Load documents
-        logger.info("Loading documents...")
-        loader = DirectoryLoader(
-            TEXT_DIRECTORY,
-            glob="**/*.txt",
-            loader_cls=TextLoader
+        self.vector_store, manifest = await self._build_from_db()
+        if self.vector_store is None:
+            logger.warning("No chunks stored in the database")
+            return None
+        logger.info(f"Rebuilt vector store with {self.vector_store.index.ntotal} chunks from the database")
+        self._save(manifest)
+        if self.shared_index is not None:
+            # Also fills the shared index after switching backends on an existing database
+            async with self.sessions() as session, session.begin():
+                await self.shared_index.backfill(session)
+                await self.shared_index.publish(session)
+        return self.vector_store
+
+    def _chunk_ids(self, relpath: str, sha256: str, count: int) -> List[str]:
+        """Stable, content-addressed ids for the chunks of one file version."""
+        prefix = hashlib.sha256(f"{relpath}:{sha256}".encode("utf-8")).hexdigest()[:16]
+        return [f"{prefix}-{i}" for i in range(count)]
+
+    def _split_executor(self, files: int) -> Executor:
+        """Process pool for splitting files, or a single thread when one worker is enough."""
+        workers = min(INGEST_WORKERS, files)
+        if workers <= 1:
+            return ThreadPoolExecutor(max_workers=1)
+        # Spawn rather than fork: the bot process already runs threads
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def process_documents(self, full_rebuild: bool = False) -> FAISS:
+        """Process documents and update the vector store incrementally.
+
+        Only files whose content hash differs from the saved manifest are
+        re-split and re-embedded; chunks of changed or deleted files are
+        removed from the index.
+
+        Args:
+            full_rebuild: Ignore the manifest and the saved index and embed everything again
+
+        Returns:
+            FAISS: The updated vector store
+        """
+        if not os.path.exists(self.text_directory):
+            logger.warning(f"Directory {self.text_directory} does not exist. Creating it...")
+            os.makedirs(self.text_directory)
+
+        # Hash documents
+        logger.info("Scanning documents...")
+        progress = self.progress
+        progress.set_stage("scanning")
+        with timed("ingest_scan"):
+            current = self._scan_files()
+        logger.info(f"Found {len(current)} documents")
+
+        manifest = {} if full_rebuild else self._load_manifest()
+        self.vector_store = self._load_existing_store() if manifest else None
+        restored = False
+        if self.vector_store is None:
+            manifest = {}
+            # A fresh container starts from the vectors already in the database
+            if not full_rebuild and self.sessions is not None:
+                self.vector_store, manifest = await self._build_from_db()
+                if self.vector_store is not None:
+                    restored = True
+                    logger.info(f"Restored {self.vector_store.index.ntotal} chunks from the database")
+
+        added = [f for f in current if f not in manifest]
+        changed = [f for f in current if f in manifest and manifest[f]["sha256"] != current[f]]
+        deleted = [f for f in manifest if f not in current]
+        logger.info(
+            f"{len(added)} new, {len(changed)} changed, {len(deleted)} deleted, "
+            f"{len(current) - len(added) - len(changed)} unchanged documents"
         )
-        documents = loader.load()
-        logger.info(f"Loaded {len(documents)} documents")
-        
-        # Initialize vector store with first document
-        if not documents:
+
+        if not current and self.vector_store is None:
             logger.warning("No documents found to process!")
             return None
-            
-        logger.info("Processing first document to initialize vector store...")
-        first_doc = documents[0]
-        first_splits = self.text_splitter.split_text(first_doc.page_content)
-        first_docs = [LangchainDocument(page_content=text) for text in first_splits]
-        self.vector_store = FAISS.from_documents(
-            documents=first_docs,
-            embedding=self.embeddings
-        )
-        logger.info(f"Initialized vector store with {len(first_splits)} chunks from first document")
-        
-        # Process remaining documents in batches
-        batch_size = 5  # Process 5 documents at a time
-        for i in range(1, len(documents), batch_size):
-            batch = documents[i:i + batch_size]
-            logger.info(f"Processing batch of {len(batch)} documents...")
-            
-            for doc in batch:
+        if not (added or changed or deleted):
+            logger.info("Vector store is up to date, nothing to process")
+            if restored:
+                self._save(manifest)
+            return self.vector_store
+
+        # Remove stale vectors of changed and deleted files
+        stale_ids = [cid for f in changed + deleted for cid in manifest[f]["chunk_ids"]]
+        rebuild_from_db = bool(stale_ids) and not supports_removal(self.vector_store.index)
+        if rebuild_from_db:
+            # HNSW and IVF indexes can't delete in place; rebuild once the database is up to date
+            if self.sessions is None:
+                logger.info("Index does not support deletion, re-ingesting everything through the embedding cache")
+                return await self.process_documents(full_rebuild=True)
+            logger.info("Index does not support deletion, it will be rebuilt from the database")
+        elif stale_ids:
+            self.vector_store.delete(stale_ids)
+            logger.info(f"Removed {len(stale_ids)} stale chunks from vector store")
+        for f in changed + deleted:
+            manifest.pop(f)
+
+        # Split new and changed files in parallel, embedding chunks as soon as a batch is ready
+        to_split = added + changed
+        progress.files_total = len(to_split)
+        progress.set_stage("splitting")
+        texts, metadatas, ids, documents = [], [], [], []
+        embed_tasks = []
+        dispatched = 0  # texts already handed to the embedding stage
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        total_bytes = 0
+
+        def on_embedded(count: int):
+            progress.embeddings_done += count
+
+        def dispatch():
+            nonlocal dispatched
+            if dispatched < len(texts):
+                embed_tasks.append(asyncio.create_task(self.embedding_pipeline.embed(texts[dispatched:], on_embedded)))
+                dispatched = len(texts)
+
+        with self._split_executor(len(to_split)) as executor:
+            async def split(relpath: str):
                 try:
-                    # Split document into chunks
-                    splits = self.text_splitter.split_text(doc.page_content)
-                    logger.info(f"Split document into {len(splits)} chunks")
-                    
-                    # Convert chunks to Document objects
-                    doc_chunks = [LangchainDocument(page_content=text) for text in splits]
-                    
-                    # Add chunks to vector store
-                    self.vector_store.add_documents(doc_chunks)
-                    logger.info(f"Added {len(splits)} chunks to vector store")
-                    
+                    return await loop.run_in_executor(
+                        executor, split_file, os.path.join(self.text_directory, relpath), relpath
+                    )
                 except Exception as e:
-                    logger.error(f"Error processing document: {str(e)}")
+                    logger.error(f"Error processing document {relpath}: {str(e)}")
+                    return None
+
+            for result in asyncio.as_completed([split(relpath) for relpath in to_split]):
+                result = await result
+                progress.files_done += 1
+                if result is None:
                     continue
-        
+                relpath, chunks, size, seconds = result
+                total_bytes += size
+                logger.info(
+                    f"Split {relpath} into {len(chunks)} chunks "
+                    f"({size / 1024:.0f} KB in {seconds:.2f}s, {size / 1e6 / max(seconds, 1e-6):.1f} MB/s)"
+                )
+                chunk_ids = self._chunk_ids(relpath, current[relpath], len(chunks))
+                texts.extend(chunk.text for chunk in chunks)
+                metadatas.extend(chunk.metadata for chunk in chunks)
+                ids.extend(chunk_ids)
+                progress.chunks = len(texts)
+                documents.append({"filename": relpath, "sha256": current[relpath]})
+                manifest[relpath] = {"sha256": current[relpath], "chunk_ids": chunk_ids}
+                if len(texts) - dispatched >= self.embedding_pipeline.max_batch_size:
+                    dispatch()
+            dispatch()
+
+        if to_split:
+            elapsed = time.monotonic() - started
+            observe("ingest_split", elapsed)
+            logger.info(
+                f"Split {len(documents)} files ({total_bytes / 1e6:.1f} MB) into {len(texts)} chunks "
+                f"with {min(INGEST_WORKERS, len(to_split))} workers in {elapsed:.1f}s "
+                f"({total_bytes / 1e6 / max(elapsed, 1e-6):.1f} MB/s)"
+            )
+
+        # Collect the vectors in dispatch order, then add them to the index in bulk
+        progress.set_stage("embedding")
+        with timed("ingest_embed_wait"):
+            vectors = [vector for batch in await asyncio.gather(*embed_tasks) for vector in batch]
+        if texts:
+            text_embeddings = list(zip(texts, vectors))
+            progress.set_stage("indexing")
+            with timed("ingest_index"):
+                if self.vector_store is None:
+                    self.vector_store = build_store(text_embeddings, self.embeddings, metadatas, ids)
+                elif not rebuild_from_db:
+                    self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            logger.info(f"Added {len(ids)} chunks to vector store")
+
+        if self.sessions is not None:
+            chunk_rows = [
+                {
+                    "filename": metadata["source"],
+                    "chunk_id": chunk_id,
+                    "chunk_index": metadata["chunk"],
+                    "byte_offset": metadata["offset"],
+                    "byte_length": metadata["length"],
+                    "section": metadata["section"][:255],
+                    "content": text,
+                    "embedding": encode_vector(vector, EMBEDDING_STORAGE_DTYPE),
+                    "embedding_dtype": EMBEDDING_STORAGE_DTYPE,
+                }
+                for text, metadata, chunk_id, vector in zip(texts, metadatas, ids, vectors)
+            ]
+            stale_files = changed + deleted
+            if full_rebuild:
+                async with self.sessions() as session:
+                    stored = await session.scalars(select(Document.filename))
+                    stale_files = [f for f in stored if f not in current]
+            progress.set_stage("storing")
+            with timed("ingest_store_db"):
+                await self._store_in_db(stale_files, documents, chunk_rows, vectors)
+            if rebuild_from_db:
+                self.vector_store, manifest = await self._build_from_db()
+
+        if self.vector_store is None:
+            logger.warning("No documents were embedded!")
+            return None
+
         logger.info(f"Final vector store contains {self.vector_store.index.ntotal} chunks")
-        
-        # Save vector store to disk
-        if not os.path.exists(VECTOR_STORE_PATH):
-            os.makedirs(VECTOR_STORE_PATH)
-        self.vector_store.save_local(VECTOR_STORE_PATH)
-        logger.info(f"Vector store saved to {VECTOR_STORE_PATH}")
-        
+
+        # Save vector store and manifest to disk
+        self._save(manifest)
+
         logger.info("Document processing completed successfully!")
-        return self.vector_store 
\ No newline at end of file
+        return self.vector_store
@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from app.config.settings import (
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Size-bounded SQLite store of float32 embeddings keyed by text hash."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache at {path} holds {self._size} vectors")
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        """Build the cache key for a text embedded under a model namespace."""
+        return f"{namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for whichever keys are present."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                        [now, *batch]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Store vectors, evicting the least recently used ones beyond max_entries."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._size += len(rows)
+            if self._size > self.max_entries:
+                self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = self._size - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self._size -= excess
+                    logger.info(f"Evicted {excess} least recently used embeddings from cache")
+            self._conn.commit()
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the API for texts not in the cache."""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, namespace: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.namespace = namespace
+
+    def _split_hits(self, texts: List[str]):
+        keys = [EmbeddingCache.make_key(self.namespace, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+        # Embed each distinct missing text once
+        missing, seen = [], set()
+        for i, key in enumerate(keys):
+            if key not in cached and key not in seen:
+                seen.add(key)
+                missing.append(i)
+        return keys, cached, missing
+
+    def _merge(self, texts, keys, cached, missing, vectors) -> List[List[float]]:
+        fresh = {keys[i]: vector for i, vector in zip(missing, vectors)}
+        self.cache.put_many(fresh)
+        cached.update(fresh)
+        if missing:
+            logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split_hits(texts)
+        vectors = self.underlying.embed_documents([texts[i] for i in missing]) if missing else []
+        return self._merge(texts, keys, cached, missing, vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await asyncio.to_thread(self._split_hits, texts)
+        vectors = await self.underlying.aembed_documents([texts[i] for i in missing]) if missing else []
+        return await asyncio.to_thread(self._merge, texts, keys, cached, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+def get_embeddings() -> Embeddings:
+    """Build the embedding model used for both ingestion and queries, backed by the shared cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    underlying = OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS)
+    namespace = f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS or 'native'}"
+    return CachedEmbeddings(underlying, _cache, namespace)
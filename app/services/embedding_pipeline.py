@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, List, Optional, Tuple
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from app.config.settings import (
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_TOKENS_PER_MINUTE,
+    EMBEDDING_MAX_RETRIES,
+)
+from app.services.metrics import timed
+from app.services.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Errors that will fail the same way however often they are retried
+NON_RETRYABLE_ERRORS = (
+    openai.BadRequestError,
+    openai.AuthenticationError,
+    openai.PermissionDeniedError,
+    openai.NotFoundError,
+)
+
+class RateLimiter:
+    """Token bucket that refills `per_minute` units every minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int = 1):
+        """Wait until `amount` units are available and take them."""
+        # A single request larger than the bucket can never be satisfied in full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class EmbeddingPipeline:
+    """Embeds many texts with token-bounded, concurrent, rate-limited requests."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        requests_per_minute: int = EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = EMBEDDING_TOKENS_PER_MINUTE,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+    ):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.request_limiter = RateLimiter(requests_per_minute)
+        self.token_limiter = RateLimiter(tokens_per_minute)
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _shared_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limit shared by all embed calls running on the current event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore, self._semaphore_loop = asyncio.Semaphore(self.concurrency), loop
+        return self._semaphore
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens the embedding API will bill for a text."""
+        return count_tokens(text)
+
+    def make_batches(self, texts: List[str]) -> List[Tuple[List[int], int]]:
+        """Group text indices into requests bounded by token and input count.
+
+        Returns:
+            List[Tuple[List[int], int]]: (text indices, token count) per request
+        """
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens
+                            or len(current) >= self.max_batch_size):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    async def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """Embed one request's worth of texts, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            await self.request_limiter.acquire()
+            await self.token_limiter.acquire(tokens)
+            try:
+                with timed("embedding_request"):
+                    return await self.embeddings.aembed_documents(texts)
+            except NON_RETRYABLE_ERRORS:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(
+                    f"Embedding request failed ({str(e)}), retrying in {delay:.1f}s "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                await asyncio.sleep(delay)
+
+    async def embed(
+        self, texts: List[str], on_progress: Optional[Callable[[int], None]] = None
+    ) -> List[List[float]]:
+        """Embed all texts, preserving their order.
+
+        Args:
+            texts: The texts to embed
+            on_progress: Called with the number of texts in each request as it completes
+
+        Returns:
+            List[List[float]]: One vector per input text
+        """
+        if not texts:
+            return []
+
+        batches = self.make_batches(texts)
+        total_tokens = sum(tokens for _, tokens in batches)
+        logger.info(
+            f"Embedding {len(texts)} chunks ({total_tokens} tokens) in {len(batches)} requests, "
+            f"{self.concurrency} at a time"
+        )
+
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = self._shared_semaphore()
+        done = 0
+        started = time.monotonic()
+
+        async def run(indices: List[int], tokens: int):
+            nonlocal done
+            async with semaphore:
+                result = await self._embed_batch([texts[i] for i in indices], tokens)
+            for i, vector in zip(indices, result):
+                vectors[i] = vector
+            done += len(indices)
+            if on_progress is not None:
+                on_progress(len(indices))
+            logger.info(f"Embedded {done}/{len(texts)} chunks")
+
+        await asyncio.gather(*(run(indices, tokens) for indices, tokens in batches))
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Embedded {len(texts)} chunks in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-6):.1f} chunks/s)")
+        return vectors
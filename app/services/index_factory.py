@@ -0,0 +1,322 @@
+import os
+import math
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document as LangchainDocument
+
+from app.config.settings import (
+    VECTOR_INDEX_TYPE,
+    VECTOR_INDEX_HNSW_M,
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION,
+    VECTOR_INDEX_EF_SEARCH,
+    VECTOR_INDEX_NLIST,
+    VECTOR_INDEX_NPROBE,
+    VECTOR_INDEX_PQ_M,
+    VECTOR_INDEX_TRAIN_SAMPLE,
+    VECTOR_SEARCH_DIMENSIONS,
+    VECTOR_RERANK_CANDIDATES,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq_fp16")
+
+# Full-width vectors of a reduced-dimension store, saved next to its index
+RERANK_FILENAME = "rerank_vectors.npy"
+
+def _factory_string(index_type: str, dim: int, n_train: int) -> str:
+    """Translate an index type into a FAISS index_factory description sized for the corpus."""
+    # IVF wants at least ~39 training points per list
+    nlist = max(1, min(VECTOR_INDEX_NLIST, n_train // 39))
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{VECTOR_INDEX_HNSW_M},Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_pq":
+        m = VECTOR_INDEX_PQ_M
+        while dim % m:
+            m -= 1
+        # Same ~39 points per centroid rule for the 2**nbits codebook entries
+        nbits = max(1, min(8, int(math.log2(max(n_train // 39, 2)))))
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    raise ValueError(f"Unknown vector index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+def create_index(vectors: np.ndarray, index_type: str = VECTOR_INDEX_TYPE) -> faiss.Index:
+    """Create an empty FAISS index of the given type, trained on a sample of vectors.
+
+    Args:
+        vectors: float32 matrix of the vectors that will be added
+        index_type: One of INDEX_TYPES
+
+    Returns:
+        faiss.Index: A trained, empty index using L2 distance
+    """
+    n, dim = vectors.shape
+    description = _factory_string(index_type, dim, min(n, VECTOR_INDEX_TRAIN_SAMPLE))
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = VECTOR_INDEX_HNSW_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        sample = vectors
+        if n > VECTOR_INDEX_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, VECTOR_INDEX_TRAIN_SAMPLE, replace=False)]
+        started = time.monotonic()
+        index.train(sample)
+        logger.info(f"Trained {description} index on {len(sample)} vectors in {time.monotonic() - started:.1f}s")
+
+    configure_search(index)
+    return index
+
+def configure_search(index: faiss.Index, nprobe: int = VECTOR_INDEX_NPROBE, ef_search: int = VECTOR_INDEX_EF_SEARCH):
+    """Apply query-time recall/speed parameters to an index."""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass  # not an IVF index
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+def supports_removal(index: faiss.Index) -> bool:
+    """Whether vectors can be deleted from the index in place.
+
+    LangChain renumbers the remaining chunks in order after a delete, which
+    only matches indexes that close up their ids too. Flat and scalar-quantized
+    indexes do; IVF lists keep the old ids and HNSW graphs can't delete at all.
+    """
+    try:
+        faiss.extract_index_ivf(index)
+        return False
+    except RuntimeError:
+        pass  # not an IVF index
+    return isinstance(faiss.downcast_index(index), (faiss.IndexFlat, faiss.IndexScalarQuantizer))
+
+def reduce_dimensions(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Keep the leading dimensions of each vector and re-normalize them to unit length.
+
+    text-embedding-3 models are trained so that such shortened vectors are
+    embeddings in their own right, just somewhat less precise.
+    """
+    reduced = np.array(np.asarray(vectors, dtype=np.float32)[:, :dimensions], order="C")
+    faiss.normalize_L2(reduced)
+    return reduced
+
+class RerankedFAISS(FAISS):
+    """FAISS store whose index holds shortened vectors, with the full ones kept for re-scoring.
+
+    Searches fetch candidates from the small index and order them by their
+    distance at full width. The full vectors are kept as float16 and, once
+    the store is saved, read from a memory-mapped file, so only the rows of
+    candidates are ever paged in.
+    """
+
+    def __init__(self, *args, full_vectors: Optional[np.ndarray] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.full_vectors = full_vectors
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts, vectors = zip(*text_embeddings)
+        full = np.asarray(vectors, dtype=np.float32)
+        added = super().add_embeddings(
+            zip(texts, reduce_dimensions(full, self.index.d).tolist()), metadatas=metadatas, ids=ids, **kwargs
+        )
+        self.full_vectors = np.concatenate([self.full_vectors, full.astype(np.float16)])
+        return added
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        positions = {doc_id: i for i, doc_id in self.index_to_docstore_id.items()}
+        rows = [positions[doc_id] for doc_id in ids or [] if doc_id in positions]
+        deleted = super().delete(ids, **kwargs)
+        # The parent renumbers the remaining chunks in order, and the rows follow suit
+        self.full_vectors = np.delete(self.full_vectors, rows, axis=0)
+        return deleted
+
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        super().save_local(folder_path, index_name)
+        path = os.path.join(folder_path, RERANK_FILENAME)
+        np.save(path, np.asarray(self.full_vectors, dtype=np.float16))
+        # Serve from the saved file from now on, releasing the in-memory copy
+        self.full_vectors = np.load(path, mmap_mode="r")
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings: Embeddings, index_name: str = "index", **kwargs: Any):
+        store = super().load_local(folder_path, embeddings, index_name, **kwargs)
+        store.full_vectors = np.load(os.path.join(folder_path, RERANK_FILENAME), mmap_mode="r")
+        return store
+
+    def search_vectors(
+        self, queries: np.ndarray, k: int, candidates: int = VECTOR_RERANK_CANDIDATES
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search like faiss.Index.search, taking full-width queries and re-scoring at full width.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Squared L2 distances and positions, -1 where there are fewer than k
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        _, found = self.index.search(reduce_dimensions(queries, self.index.d), max(k, candidates))
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, positions) in enumerate(zip(queries, found)):
+            positions = positions[positions != -1]
+            scores = ((np.asarray(self.full_vectors[positions], dtype=np.float32) - query) ** 2).sum(axis=1)
+            best = np.argsort(scores, kind="stable")[:k]
+            distances[row, :len(best)] = scores[best]
+            indices[row, :len(best)] = positions[best]
+        return distances, indices
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Any] = None, fetch_k: int = 20, **kwargs: Any
+    ) -> List[Tuple[LangchainDocument, float]]:
+        # Like the parent, a filter is applied to the top fetch_k hits, here after re-scoring them
+        distances, indices = self.search_vectors(np.asarray([embedding]), k if filter is None else fetch_k)
+        docs = [
+            (self.docstore.search(self.index_to_docstore_id[i]), float(d))
+            for d, i in zip(distances[0], indices[0]) if i != -1
+        ]
+        if filter is not None:
+            matches = self._create_filter_func(filter)
+            docs = [(doc, score) for doc, score in docs if matches(doc.metadata)]
+        return docs[:k]
+
+def search_store(store: FAISS, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Search a store's index with full-width query vectors, re-scoring if its index is reduced."""
+    if isinstance(store, RerankedFAISS):
+        return store.search_vectors(queries, k)
+    return store.index.search(np.asarray(queries, dtype=np.float32), k)
+
+def load_store(path: str, embeddings: Embeddings) -> FAISS:
+    """Load a saved store, as a RerankedFAISS if it was built with shortened vectors."""
+    cls = RerankedFAISS if os.path.exists(os.path.join(path, RERANK_FILENAME)) else FAISS
+    store = cls.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    configure_search(store.index)
+    return store
+
+def build_store(
+    text_embeddings: List[Tuple[str, List[float]]],
+    embedding: Embeddings,
+    metadatas: List[dict],
+    ids: List[str],
+    index_type: str = VECTOR_INDEX_TYPE,
+    search_dimensions: int = VECTOR_SEARCH_DIMENSIONS,
+) -> FAISS:
+    """Build a LangChain FAISS store over an index of the configured type.
+
+    With search_dimensions below the embedding width, the index holds
+    shortened vectors and a RerankedFAISS keeps the full ones for re-scoring.
+    """
+    vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+    full = None
+    if 0 < search_dimensions < vectors.shape[1]:
+        full, vectors = vectors, reduce_dimensions(vectors, search_dimensions)
+    index = create_index(vectors, index_type)
+    index.add(vectors)
+
+    docstore = InMemoryDocstore({
+        doc_id: LangchainDocument(page_content=text, metadata=metadata, id=doc_id)
+        for (text, _), metadata, doc_id in zip(text_embeddings, metadatas, ids)
+    })
+    if full is not None:
+        return RerankedFAISS(
+            embedding, index, docstore, dict(enumerate(ids)), full_vectors=full.astype(np.float16)
+        )
+    return FAISS(
+        embedding_function=embedding,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+def index_size_bytes(index: faiss.Index) -> int:
+    """Serialized size of an index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
+
+def recall_at_k(index: faiss.Index, vectors: np.ndarray, queries: np.ndarray, k: int = 8) -> float:
+    """Fraction of the exact top-k neighbours the index returns for the queries."""
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+def recall_report(
+    vectors: np.ndarray,
+    index_types: Iterable[str] = INDEX_TYPES,
+    k: int = 8,
+    n_queries: int = 200,
+) -> List[Dict[str, float]]:
+    """Compare index types against the exact flat index.
+
+    Args:
+        vectors: float32 matrix of the corpus vectors
+        index_types: Index types to evaluate
+        k: Number of neighbours per query
+        n_queries: Number of corpus vectors, lightly perturbed, used as queries
+
+    Returns:
+        List[Dict[str, float]]: recall@k, size and per-query latency for each type
+    """
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+
+    report = []
+    for index_type in index_types:
+        started = time.monotonic()
+        index = create_index(vectors, index_type)
+        index.add(vectors)
+        build_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        for query in queries:
+            index.search(query[None, :], k)
+        latency_ms = (time.monotonic() - started) * 1000 / len(queries)
+
+        report.append({
+            "index_type": index_type,
+            f"recall@{k}": round(recall_at_k(index, vectors, queries, k), 4),
+            "size_mb": round(index_size_bytes(index) / 2**20, 2),
+            "build_seconds": round(build_seconds, 2),
+            "latency_ms": round(latency_ms, 3),
+        })
+    return report
+
+if __name__ == "__main__":
+    import json
+    import sys
+    from sqlalchemy import select
+    from app.models.database import init_db, get_session_maker, TextChunk, decode_vector
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+
+    db = get_session_maker(init_db())()
+    try:
+        rows = db.execute(select(TextChunk.embedding, TextChunk.embedding_dtype)).all()
+    finally:
+        db.close()
+    if not rows:
+        sys.exit("The database holds no chunks, run /process first")
+
+    corpus = np.stack([decode_vector(blob, dtype) for blob, dtype in rows])
+    for row in recall_report(corpus, k=k):
+        print(json.dumps(row))
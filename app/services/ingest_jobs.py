@@ -0,0 +1,199 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config.settings import DATABASE_URL
+from app.models.database import init_async_db, get_async_session_maker
+from app.services.metrics import observe
+
+logger = logging.getLogger(__name__)
+
+# Stages of process_documents in order; once the database is being written the job runs to the end
+STAGES = ("queued", "scanning", "splitting", "embedding", "indexing", "storing", "publishing")
+COMMIT_STAGES = ("storing", "publishing")
+
+class IngestProgress:
+    """Counters a running ingestion updates, read by status requests from other threads."""
+
+    def __init__(self):
+        self.stage = "queued"
+        self.files_total = 0
+        self.files_done = 0
+        self.chunks = 0
+        self.embeddings_done = 0
+        self.started = time.monotonic()
+        self._work_started: Optional[float] = None
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        if stage == "splitting" and self._work_started is None:
+            self._work_started = time.monotonic()
+
+    def eta_seconds(self) -> Optional[float]:
+        """Time left to embed the remaining chunks at the rate so far, None until there is a rate."""
+        if self.stage in COMMIT_STAGES or self.stage == "indexing":
+            return 0.0
+        if not self.embeddings_done or not self.files_done or self._work_started is None:
+            return None
+        # Files still being split are assumed to be as long as the ones done so far
+        expected = self.chunks * max(1.0, self.files_total / self.files_done)
+        rate = self.embeddings_done / max(time.monotonic() - self._work_started, 1e-6)
+        return max(0.0, expected - self.embeddings_done) / rate
+
+    def snapshot(self) -> dict:
+        eta = self.eta_seconds()
+        return {
+            "stage": self.stage,
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "chunks": self.chunks,
+            "embeddings_done": self.embeddings_done,
+            "elapsed_seconds": round(time.monotonic() - self.started, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+class IngestJob:
+    """One run of process_documents and its outcome."""
+
+    def __init__(self, requested_by: str, full_rebuild: bool = False):
+        self.id = uuid.uuid4().hex[:8]
+        self.requested_by = requested_by
+        self.full_rebuild = full_rebuild
+        self.state = "running"  # running, succeeded, failed or cancelled
+        self.progress = IngestProgress()
+        self.error: Optional[str] = None
+        self.version: Optional[str] = None  # published store version
+        self.total_chunks: Optional[int] = None
+        self.cancel_requested = False
+        # Resolves to the job itself once it has finished, whatever the outcome
+        self.done: Future = Future()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.state == "running"
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "requested_by": self.requested_by,
+            "full_rebuild": self.full_rebuild,
+            "cancel_requested": self.cancel_requested,
+            "progress": self.progress.snapshot(),
+            "version": self.version,
+            "total_chunks": self.total_chunks,
+            "error": self.error,
+        }
+
+class IngestJobRunning(Exception):
+    """Raised when a job is started while another one is still running."""
+
+    def __init__(self, job: IngestJob):
+        super().__init__(f"Ingestion job {job.id} is already running")
+        self.job = job
+
+def _default_processor(sessions: Optional[async_sessionmaker]):
+    # Imported here: the processor pulls in FAISS and LangChain, which the API server starts without
+    from app.services.document_processor import DocumentProcessor
+    return DocumentProcessor(sessions)
+
+class IngestJobRunner:
+    """Runs document ingestion in a worker thread with its own event loop, one job at a time.
+
+    The embedding and FAISS work in process_documents would otherwise hold up
+    the event loop that answers questions. The job opens its own database
+    engine, since pooled async connections belong to the loop that opened them.
+    """
+
+    def __init__(
+        self,
+        make_processor: Callable[[Optional[async_sessionmaker]], object] = _default_processor,
+        database_url: Optional[str] = DATABASE_URL,
+    ):
+        self.make_processor = make_processor
+        self.database_url = database_url
+        self._lock = threading.Lock()
+        # The running job, or else the last one to finish
+        self.current: Optional[IngestJob] = None
+
+    def start(self, requested_by: str, full_rebuild: bool = False) -> IngestJob:
+        """Start processing documents in the background.
+
+        Raises:
+            IngestJobRunning: If a job is already running
+        """
+        with self._lock:
+            if self.current is not None and self.current.running:
+                raise IngestJobRunning(self.current)
+            job = IngestJob(requested_by, full_rebuild)
+            self.current = job
+        logger.info(f"Starting ingestion job {job.id} for {requested_by}")
+        threading.Thread(target=self._run, args=(job,), name=f"ingest-{job.id}", daemon=True).start()
+        return job
+
+    def cancel(self) -> bool:
+        """Ask the running job to stop.
+
+        Returns:
+            bool: False if no job is running or it is already writing its results
+        """
+        with self._lock:
+            job = self.current
+            if job is None or not job.running or job.progress.stage in COMMIT_STAGES:
+                return False
+            job.cancel_requested = True
+            if job._task is not None:
+                job._loop.call_soon_threadsafe(job._task.cancel)
+        logger.info(f"Cancelling ingestion job {job.id}")
+        return True
+
+    def status(self) -> Optional[dict]:
+        """Status of the running or last job, None if there has been none."""
+        job = self.current
+        return job.status() if job is not None else None
+
+    def _run(self, job: IngestJob):
+        started = time.perf_counter()
+        try:
+            store, version = asyncio.run(self._process(job))
+            job.total_chunks = store.index.ntotal if store is not None else 0
+            job.version = version
+            job.state = "succeeded"
+            logger.info(f"Ingestion job {job.id} finished, serving version {version}")
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            logger.info(f"Ingestion job {job.id} cancelled during {job.progress.stage}")
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+        finally:
+            observe("ingest", time.perf_counter() - started)
+            job.done.set_result(job)
+
+    async def _process(self, job: IngestJob):
+        with self._lock:
+            if job.cancel_requested:
+                raise asyncio.CancelledError()
+            job._loop, job._task = asyncio.get_running_loop(), asyncio.current_task()
+
+        engine = init_async_db(self.database_url) if self.database_url else None
+        try:
+            processor = self.make_processor(get_async_session_maker(engine) if engine is not None else None)
+            processor.progress = job.progress
+            store = await processor.process_documents(full_rebuild=job.full_rebuild)
+            return store, processor.registry.current_version()
+        finally:
+            if engine is not None:
+                await engine.dispose()
+
+# Shared by the Telegram commands and the API, so there is one job at a time across both
+ingest_jobs = IngestJobRunner()
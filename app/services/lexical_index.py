@@ -0,0 +1,157 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical.npz"
+
+# Punctuation and whitespace split text into runs; n-grams never cross them
+_SEPARATORS = re.compile(r"[\W_]+")
+
+# Single characters are indexed too so one-character queries (熱, 寒) still match
+INDEX_NGRAM_SIZES = (1, 2, 3)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def _runs(text: str) -> List[str]:
+    return [run for run in _SEPARATORS.split(text.lower()) if run]
+
+def ngrams(text: str, sizes: Sequence[int] = INDEX_NGRAM_SIZES) -> Iterator[str]:
+    """Character n-grams of each punctuation-free run of the text."""
+    for run in _runs(text):
+        for n in sizes:
+            for i in range(len(run) - n + 1):
+                yield run[i:i + n]
+
+def query_terms(query: str) -> List[str]:
+    """Distinct n-grams to look up for a query.
+
+    Multi-character keywords use bigrams and trigrams, which is what makes
+    exact terms like 桂枝湯 stand out; lone characters fall back to unigrams.
+    """
+    terms = []
+    for run in _runs(query):
+        sizes = (1,) if len(run) == 1 else (2, 3)
+        terms.extend(ngrams(run, sizes))
+    return list(dict.fromkeys(terms))
+
+class LexicalIndex:
+    """BM25 inverted index over character n-grams with postings in flat numpy arrays.
+
+    Terms are kept sorted so lookups are a binary search; the postings of
+    term i are doc_index[offsets[i]:offsets[i + 1]] with matching term_freq.
+    """
+
+    def __init__(
+        self,
+        doc_ids: np.ndarray,
+        terms: np.ndarray,
+        offsets: np.ndarray,
+        doc_index: np.ndarray,
+        term_freq: np.ndarray,
+        doc_lengths: np.ndarray,
+    ):
+        self.doc_ids = doc_ids
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_index = doc_index
+        self.term_freq = term_freq
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, doc_ids: Sequence[str], texts: Iterable[str]) -> "LexicalIndex":
+        """Build the index from chunk ids and their texts."""
+        started = time.monotonic()
+        term_list, doc_list, tf_list, lengths = [], [], [], []
+        for d, text in enumerate(texts):
+            counts = Counter(ngrams(text))
+            term_list.extend(counts.keys())
+            tf_list.extend(counts.values())
+            doc_list.extend([d] * len(counts))
+            lengths.append(sum(len(run) for run in _runs(text)))
+
+        terms, inverse = np.unique(np.array(term_list, dtype="<U3"), return_inverse=True)
+        docs = np.array(doc_list, dtype=np.int32)
+        order = np.lexsort((docs, inverse))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(inverse, minlength=len(terms)), out=offsets[1:])
+
+        index = cls(
+            doc_ids=np.array(list(doc_ids)),
+            terms=terms,
+            offsets=offsets,
+            doc_index=docs[order],
+            term_freq=np.minimum(np.array(tf_list, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)[order],
+            doc_lengths=np.array(lengths, dtype=np.int32),
+        )
+        logger.info(
+            f"Built lexical index over {len(lengths)} chunks: {len(terms)} terms, "
+            f"{len(docs)} postings in {time.monotonic() - started:.1f}s"
+        )
+        return index
+
+    def save(self, directory: str):
+        np.savez(
+            os.path.join(directory, LEXICAL_INDEX_FILENAME),
+            doc_ids=self.doc_ids,
+            terms=self.terms,
+            offsets=self.offsets,
+            doc_index=self.doc_index,
+            term_freq=self.term_freq,
+            doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, directory: str) -> "LexicalIndex":
+        with np.load(os.path.join(directory, LEXICAL_INDEX_FILENAME)) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, LEXICAL_INDEX_FILENAME))
+
+    def _term_id(self, term: str) -> int:
+        i = int(np.searchsorted(self.terms, term))
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return -1
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k chunk ids by BM25 score for the query's n-grams."""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = K1 * (1 - B + B * self.doc_lengths / self.avg_length)
+        for term in query_terms(query):
+            term_id = self._term_id(term)
+            if term_id < 0:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_index[start:end]
+            tf = self.term_freq[start:end].astype(np.float32)
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (K1 + 1) / (tf + norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return [(str(self.doc_ids[i]), float(scores[i])) for i in top]
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int, constant: int = 60) -> List[str]:
+    """Fuse ranked id lists: each id scores the sum of 1 / (constant + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (constant + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
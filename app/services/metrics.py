@@ -0,0 +1,94 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import ChatGeneration, LLMResult
+from prometheus_client import Counter, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# From a cached FAISS search up to a slow multi-tool answer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each stage of answering and ingestion", ["stage"], buckets=LATENCY_BUCKETS
+)
+ANSWERS = Counter("rag_answers_total", "Answers given, by where they came from", ["source"])
+TOOL_CALLS = Counter("rag_tool_calls_total", "Tool calls made by the agent", ["tool"])
+TOOL_CALLS_PER_ANSWER = Histogram(
+    "rag_tool_calls_per_answer", "Tool calls the agent made for one answer", buckets=(0, 1, 2, 3, 4, 6, 8, 12)
+)
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens sent to and generated by the LLM", ["direction"])
+
+def observe(stage: str, seconds: float):
+    """Record the duration of one run of a stage."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the enclosed block as one run of a stage, whether or not it raises.
+
+    Also works as a decorator, timing every call of the function.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def render() -> bytes:
+    """All metrics in the Prometheus text format."""
+    return generate_latest()
+
+class AgentMetrics(BaseCallbackHandler):
+    """Times LLM calls and counts tokens and tool calls for one answer.
+
+    Passed in the agent's config, so it sees every model and tool run the
+    agent makes for the answer.
+    """
+
+    # Only counters are touched, so there is no need to hop to a thread
+    run_inline = True
+
+    def __init__(self):
+        self.tool_calls = 0
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        self._finish_llm(run_id)
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                if isinstance(generation, ChatGeneration) and getattr(generation.message, "usage_metadata", None):
+                    usage = generation.message.usage_metadata
+        if usage is not None:
+            LLM_TOKENS.labels("input").inc(usage.get("input_tokens", 0))
+            LLM_TOKENS.labels("output").inc(usage.get("output_tokens", 0))
+        elif response.llm_output and response.llm_output.get("token_usage"):
+            token_usage = response.llm_output["token_usage"]
+            LLM_TOKENS.labels("input").inc(token_usage.get("prompt_tokens") or 0)
+            LLM_TOKENS.labels("output").inc(token_usage.get("completion_tokens") or 0)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish_llm(run_id)
+
+    def _finish_llm(self, run_id: UUID):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            observe("llm", time.perf_counter() - started)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any):
+        self.tool_calls += 1
+        TOOL_CALLS.labels((serialized or {}).get("name") or kwargs.get("name") or "unknown").inc()
+
+    def finish(self, source: str):
+        """Record the answer once the agent is done, with where it came from: model, cache or error."""
+        ANSWERS.labels(source).inc()
+        if source == "model":
+            TOOL_CALLS_PER_ANSWER.observe(self.tool_calls)
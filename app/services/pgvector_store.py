@@ -0,0 +1,269 @@
+import time
+import logging
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document as LangchainDocument
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import (
+    DATABASE_URL,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    PGVECTOR_INDEX_TYPE,
+    VECTOR_INDEX_HNSW_M,
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION,
+    VECTOR_INDEX_EF_SEARCH,
+    VECTOR_INDEX_NLIST,
+    VECTOR_INDEX_NPROBE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS,
+)
+from app.models.database import TextChunk, decode_vector
+from app.services import readiness
+from app.services.embedding_cache import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+
+# How often searches check whether another instance published a new version
+REFRESH_INTERVAL_SECONDS = 5.0
+
+# pgvector's IVFFlat guidance: about one list per thousand rows
+ROWS_PER_LIST = 1000
+
+# Width of each model's vectors when EMBEDDING_DIMENSIONS doesn't shorten them
+NATIVE_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+def embedding_dimensions() -> int:
+    """Width of the configured embeddings, which the halfvec column is declared with."""
+    if EMBEDDING_DIMENSIONS:
+        return EMBEDDING_DIMENSIONS
+    if EMBEDDING_MODEL not in NATIVE_DIMENSIONS:
+        raise ValueError(f"Set EMBEDDING_DIMENSIONS to the width of {EMBEDDING_MODEL!r} vectors")
+    return NATIVE_DIMENSIONS[EMBEDDING_MODEL]
+
+def vector_literal(vector: Sequence[float]) -> str:
+    """pgvector's text form of a vector, at the precision halfvec keeps."""
+    return "[" + ",".join(f"{x:.5g}" for x in np.asarray(vector, dtype=np.float32).tolist()) + "]"
+
+def _index_name(index_type: str) -> str:
+    return f"text_chunks_embedding_{index_type}_idx"
+
+class PgVectorStore:
+    """Chunk embeddings kept in a pgvector column of text_chunks and shared by every instance.
+
+    Vectors are stored as halfvec, which indexes up to 4000 dimensions and
+    halves the size. setup() creates the column once; ingestion writes them in the same transaction as their
+    chunks and then bumps a version row; searches go through a pooled
+    connection and notice a new version within REFRESH_INTERVAL_SECONDS.
+    """
+
+    def __init__(
+        self, url: str = DATABASE_URL, index_type: str = PGVECTOR_INDEX_TYPE, dimensions: Optional[int] = None
+    ):
+        self.url = url
+        self.index_type = index_type
+        self.dimensions = dimensions  # of the embeddings, if not the configured model's
+        self._engine: Optional[Engine] = None
+        self._embeddings = None
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._checked = 0.0
+        self._refreshing = False
+        self.state = "warming"
+
+    @property
+    def engine(self) -> Engine:
+        """Pooled synchronous engine for searches, which run in tool threads."""
+        with self._lock:
+            if self._engine is None:
+                self._engine = create_engine(
+                    make_url(self.url).set(drivername="postgresql+psycopg2"),
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+                    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+                    pool_pre_ping=True,
+                )
+            return self._engine
+
+    @property
+    def embeddings(self):
+        """Embedding model for queries, the same one ingestion uses."""
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def setup(self):
+        """Create the vector extension, the halfvec column and the version table, once at startup.
+
+        Run after init_db(). Creating extensions and altering text_chunks needs
+        rights that ingestion's own transactions then don't.
+        """
+        dimensions = self.dimensions or embedding_dimensions()
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(
+                f"ALTER TABLE text_chunks ADD COLUMN IF NOT EXISTS embedding_vec halfvec({dimensions})"
+            ))
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS vector_index_state "
+                "(id INTEGER PRIMARY KEY CHECK (id = 1), version TEXT NOT NULL, updated_at TIMESTAMPTZ NOT NULL)"
+            ))
+        logger.info(f"pgvector schema ready for {dimensions}-dimension vectors")
+
+    async def write(self, session: AsyncSession, chunk_ids: List[str], vectors: Sequence[Sequence[float]]):
+        """Store the vectors of chunks already inserted in the session's transaction, indexing them.
+
+        Args:
+            session: Session of the transaction that inserted the chunks
+            chunk_ids: Ids of the chunks
+            vectors: Embedding of each chunk
+        """
+        if not chunk_ids:
+            return
+        # Passed as text so neither driver needs a codec for the vector types
+        statement = text(
+            "UPDATE text_chunks SET embedding_vec = CAST(CAST(:vector AS text) AS halfvec) WHERE chunk_id = :chunk_id"
+        )
+        for start in range(0, len(chunk_ids), 1000):
+            await session.execute(statement, [
+                {"chunk_id": chunk_id, "vector": vector_literal(vector)}
+                for chunk_id, vector in zip(chunk_ids[start:start + 1000], vectors[start:start + 1000])
+            ])
+        await self._ensure_index(session)
+        logger.info(f"Stored {len(chunk_ids)} vectors in pgvector")
+
+    async def backfill(self, session: AsyncSession) -> int:
+        """Copy every stored chunk embedding into the pgvector column, e.g. after switching backends.
+
+        Returns:
+            int: Number of vectors written
+        """
+        rows = (await session.execute(
+            select(TextChunk.chunk_id, TextChunk.embedding, TextChunk.embedding_dtype)
+        )).all()
+        await self.write(
+            session, [chunk_id for chunk_id, _, _ in rows], [decode_vector(blob, dtype) for _, blob, dtype in rows]
+        )
+        return len(rows)
+
+    async def _ensure_index(self, session: AsyncSession):
+        """Create the configured ANN index once there is data to build it from."""
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown pgvector index type {self.index_type!r}, expected one of {INDEX_TYPES}")
+        for other in INDEX_TYPES:
+            if other != self.index_type:
+                await session.execute(text(f"DROP INDEX IF EXISTS {_index_name(other)}"))
+        if self.index_type == "hnsw":
+            options = f"m = {VECTOR_INDEX_HNSW_M}, ef_construction = {VECTOR_INDEX_HNSW_EF_CONSTRUCTION}"
+        else:
+            # IVFFlat clusters the rows present now; drop the index to re-cluster after large growth
+            rows = (await session.execute(
+                text("SELECT count(*) FROM text_chunks WHERE embedding_vec IS NOT NULL")
+            )).scalar()
+            options = f"lists = {max(1, min(VECTOR_INDEX_NLIST, rows // ROWS_PER_LIST))}"
+        await session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {_index_name(self.index_type)} ON text_chunks "
+            f"USING {self.index_type} (embedding_vec halfvec_cosine_ops) WITH ({options})"
+        ))
+
+    async def publish(self, session: AsyncSession) -> str:
+        """Record a new version in the session's transaction so every instance drops stale results.
+
+        Returns:
+            str: The name of the new version
+        """
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000 % 10**6:06d}"
+        await session.execute(text(
+            "INSERT INTO vector_index_state (id, version, updated_at) VALUES (1, :version, now()) "
+            "ON CONFLICT (id) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at"
+        ), {"version": name})
+        self._checked = 0.0
+        return name
+
+    def _set_state(self, state: str):
+        self.state = state
+        readiness.set_component_state("retrieval", state)
+
+    def _refresh(self):
+        try:
+            with self.engine.connect() as conn:
+                try:
+                    name = conn.execute(text("SELECT version FROM vector_index_state WHERE id = 1")).scalar()
+                except ProgrammingError:
+                    name = None  # nothing ingested yet
+            if name != self._version:
+                logger.info(f"pgvector index version {name} is now active")
+            self._version = name
+            self._set_state("ready" if name else "empty")
+        except Exception as e:
+            logger.error(f"Could not read the pgvector index version: {str(e)}")
+            if self._version is None:
+                self._set_state("error")
+        finally:
+            self._refreshing = False
+
+    def version(self) -> Optional[str]:
+        """The published version, checked in the background at most every REFRESH_INTERVAL_SECONDS.
+
+        Returns None until the first check completes or while nothing has been ingested.
+        """
+        now = time.monotonic()
+        if not self._refreshing and now - self._checked >= REFRESH_INTERVAL_SECONDS:
+            self._checked = now
+            self._refreshing = True
+            threading.Thread(target=self._refresh, name="pgvector-refresh", daemon=True).start()
+        return self._version
+
+    def warm_up(self):
+        """Open the pool and read the current version ahead of the first search."""
+        self.version()
+
+    def search(self, vector: Sequence[float], n: int) -> List[LangchainDocument]:
+        """The n chunks nearest to the query vector by cosine distance, nearest first."""
+        return self.search_many([vector], n)[0]
+
+    def search_many(self, vectors: Sequence[Sequence[float]], n: int) -> List[List[LangchainDocument]]:
+        """The n nearest chunks for each query vector, all looked up on one pooled connection."""
+        statement = text(
+            "SELECT c.chunk_id, c.content, c.chunk_index, c.byte_offset, c.byte_length, c.section, d.filename "
+            "FROM (SELECT chunk_id, content, chunk_index, byte_offset, byte_length, section, document_id, "
+            "embedding_vec <=> CAST(CAST(:query AS text) AS halfvec) AS distance "
+            "FROM text_chunks ORDER BY distance LIMIT :n) c "
+            "JOIN documents d ON d.id = c.document_id ORDER BY c.distance"
+        )
+        results = []
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef_search, true), set_config('ivfflat.probes', :probes, true)"),
+                {"ef_search": str(max(VECTOR_INDEX_EF_SEARCH, n)), "probes": str(VECTOR_INDEX_NPROBE)},
+            )
+            for vector in vectors:
+                rows = conn.execute(statement, {"query": vector_literal(vector), "n": n}).all()
+                results.append([
+                    LangchainDocument(
+                        page_content=content,
+                        metadata={
+                            "source": filename, "chunk": index, "offset": offset, "length": length, "section": section
+                        },
+                        id=chunk_id,
+                    )
+                    for chunk_id, content, index, offset, length, section, filename in rows
+                ])
+        return results
+
+# Shared by the search tool and document processing when VECTOR_BACKEND is pgvector
+pgvector_store = PgVectorStore()
@@ -0,0 +1,48 @@
+import time
+import logging
+from typing import Dict, Optional
+
+from app.config.settings import STARTUP_BUDGET_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Import time of this module, which app.main imports before anything heavy
+PROCESS_STARTED = time.monotonic()
+
+# State of each component that must be up before answers are fully served
+_components: Dict[str, str] = {"chat": "warming", "retrieval": "warming"}
+_startup_seconds: Optional[float] = None
+
+def set_component_state(name: str, state: str):
+    """Record the state of a component: warming, ready, empty or error."""
+    if _components.get(name) != state:
+        logger.info(f"Component {name} is {state}")
+    _components[name] = state
+
+def mark_accepting_traffic() -> float:
+    """Record how long the process took to start accepting requests."""
+    global _startup_seconds
+    _startup_seconds = time.monotonic() - PROCESS_STARTED
+    if _startup_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning(
+            f"Accepting traffic after {_startup_seconds:.2f}s, "
+            f"over the {STARTUP_BUDGET_SECONDS:.1f}s startup budget"
+        )
+    else:
+        logger.info(f"Accepting traffic after {_startup_seconds:.2f}s")
+    return _startup_seconds
+
+def status() -> dict:
+    """Overall readiness plus the state of every component."""
+    states = set(_components.values())
+    if states == {"ready"}:
+        overall = "ready"
+    elif "warming" in states:
+        overall = "warming"
+    else:
+        overall = "degraded"
+    return {
+        "status": overall,
+        "components": dict(_components),
+        "startup_seconds": round(_startup_seconds, 3) if _startup_seconds is not None else None,
+    }
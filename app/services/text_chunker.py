@@ -0,0 +1,249 @@
+import os
+import re
+import time
+import logging
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000  # characters
+CHUNK_OVERLAP = 200  # characters carried over from the end of the previous chunk
+
+# Sentence ends; a hard-wrapped line break is not a boundary
+SENTENCE_ENDS = "。！？"
+
+# Lines longer than this are read in pieces so a file without newlines can't exhaust memory
+MAX_LINE_BYTES = 1 << 16
+
+# Heading markup used by the digitised texts, each giving the heading level:
+# "1=標題= 上古天真論篇第一", "==2（第一節）論發汗", "==大標題==  脾胃論卷上", "\x01醫宗金鑑卷一"
+_MARKED_HEADINGS = (
+    (re.compile(r"^\s*([1-9])=標題=(.*)$"), lambda m: int(m.group(1))),
+    (re.compile(r"^\s*==([1-9])(.*)$"), lambda m: int(m.group(1))),
+    (re.compile(r"^\s*==([大中小])標題==(.*)$"), lambda m: "大中小".index(m.group(1)) + 1),
+    (re.compile(r"^([\x01-\x06])(.*)$"), lambda m: ord(m.group(1))),
+)
+
+# Otherwise, short standalone lines naming a volume (卷), part (篇) or chapter (章)
+_PLAIN_HEADING = re.compile(r"^(?:.{0,20}卷[一二三四五六七八九十百〇零\d上中下]*|第.{1,8}[卷篇章]|.{1,24}[篇章](?:[上中下]|正誤|存疑)?)$")
+_NOT_HEADING = re.compile(r"[，。！？：；、「」『』]")
+
+# Headings at this level or above (卷, 篇) always start a new chunk; deeper ones
+# (numbered clauses, 節) only update the section so chunks don't get tiny
+BREAK_LEVEL = 2
+
+class SourceChunk(NamedTuple):
+    """A chunk of a text file and where it came from."""
+    source: str  # path relative to the text directory
+    index: int  # position of the chunk within the file
+    offset: int  # byte offset of the chunk in the file
+    length: int  # length of the chunk in bytes
+    section: str  # enclosing headings, e.g. "醫宗金鑑卷一 / 辨太陽病脈證並治上篇"
+    text: str
+
+    @property
+    def metadata(self) -> dict:
+        return {
+            "source": self.source,
+            "chunk": self.index,
+            "offset": self.offset,
+            "length": self.length,
+            "section": self.section,
+        }
+
+class _Segment(NamedTuple):
+    offset: int
+    text: str
+
+def heading(line: str) -> Optional[Tuple[int, str]]:
+    """The (level, title) of a heading line, or None for ordinary text."""
+    for pattern, level in _MARKED_HEADINGS:
+        match = pattern.match(line.rstrip("\r\n"))
+        if match:
+            return level(match), " ".join(match.group(2).split()).rstrip("。")
+    line = line.strip()
+    if not line or len(line) > 30 or _NOT_HEADING.search(line) or not _PLAIN_HEADING.match(line):
+        return None
+    return (1 if "卷" in line else 2), line
+
+def _lines(f) -> Iterator[bytes]:
+    while True:
+        line = f.readline(MAX_LINE_BYTES)
+        if not line:
+            return
+        yield line
+
+def _decode(line: bytes, carry: bytes) -> tuple:
+    """Decode a line, holding back a multi-byte character cut by MAX_LINE_BYTES."""
+    data = carry + line
+    for cut in range(4):
+        try:
+            return data[:len(data) - cut].decode("utf-8"), data[len(data) - cut:]
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace"), b""
+
+def _segments(path: str) -> Iterator[tuple]:
+    """Yield (heading, offset, text) pieces of a file, heading being None for body text.
+
+    Text pieces end at sentence ends or paragraph breaks; together the pieces
+    cover the file byte for byte, so offsets can be summed.
+    """
+    offset, carry = 0, b""
+    pending, pending_offset, pending_size = [], 0, 0
+
+    def flush():
+        nonlocal pending, pending_size
+        text = "".join(pending)
+        pending, pending_size = [], 0
+        return text
+
+    with open(path, "rb") as f:
+        for raw in _lines(f):
+            line, carry = _decode(raw, carry)
+            if not line:
+                continue
+            line_offset, offset = offset, offset + len(line.encode("utf-8"))
+            title = heading(line)
+            if title is not None or not line.strip():
+                # Headings and blank lines close the sentence in progress
+                if pending:
+                    yield None, pending_offset, flush()
+                yield title, line_offset, line
+                continue
+
+            start = 0
+            for i, char in enumerate(line):
+                if char in SENTENCE_ENDS:
+                    if not pending:
+                        pending_offset = line_offset + len(line[:start].encode("utf-8"))
+                    pending.append(line[start:i + 1])
+                    start = i + 1
+                    yield None, pending_offset, flush()
+            if start < len(line):
+                if not pending:
+                    pending_offset = line_offset + len(line[:start].encode("utf-8"))
+                pending.append(line[start:])
+                pending_size += len(line) - start
+                # Unpunctuated text is passed on in pieces rather than held whole
+                if pending_size >= CHUNK_SIZE:
+                    yield None, pending_offset, flush()
+        if pending:
+            yield None, pending_offset, flush()
+
+def _hard_split(segment: _Segment, size: int) -> List[_Segment]:
+    """Cut a segment with no sentence end into pieces of at most size characters."""
+    pieces, offset = [], segment.offset
+    for start in range(0, len(segment.text), size):
+        text = segment.text[start:start + size]
+        pieces.append(_Segment(offset, text))
+        offset += len(text.encode("utf-8"))
+    return pieces
+
+def chunk_file(
+    path: str,
+    source: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+) -> Iterator[SourceChunk]:
+    """Stream a UTF-8 text file as overlapping chunks that follow its structure.
+
+    The file is read line by line and only the chunk being built is held in
+    memory. Chunks end at sentence boundaries, never span a 卷/篇/章 heading,
+    and each one is exactly the bytes file[offset:offset + length].
+
+    Args:
+        path: File to read
+        source: Name recorded in the chunks, the path by default
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Characters of trailing sentences repeated at the start of the next chunk
+
+    Returns:
+        Iterator[SourceChunk]: The chunks in file order
+    """
+    source = source or path
+    headings: List[str] = []
+    current: List[_Segment] = []
+    size = 0
+    index = 0
+    section = ""  # headings in force where the current chunk starts
+    has_body = False
+
+    def emit() -> Optional[SourceChunk]:
+        nonlocal index
+        text = "".join(segment.text for segment in current)
+        stripped = text.strip()
+        if not stripped:
+            return None
+        leading = text[:len(text) - len(text.lstrip())]
+        offset = current[0].offset + len(leading.encode("utf-8"))
+        chunk = SourceChunk(source, index, offset, len(stripped.encode("utf-8")), section, stripped)
+        index += 1
+        return chunk
+
+    def overlap() -> List[_Segment]:
+        carried, total = [], 0
+        for segment in reversed(current[1:]):
+            total += len(segment.text)
+            if total > chunk_overlap:
+                break
+            carried.insert(0, segment)
+        return carried
+
+    for title, offset, text in _segments(path):
+        if title is not None:
+            level, name = title
+            # Volumes and parts always start a new chunk; consecutive headings stay together
+            if level <= BREAK_LEVEL and has_body:
+                chunk = emit()
+                if chunk:
+                    yield chunk
+                current, size, has_body = [], 0, False
+            del headings[level - 1:]
+            headings.extend([""] * (level - 1 - len(headings)))
+            headings.append(name)
+            if not has_body:
+                section = " / ".join(filter(None, headings))
+
+        for segment in _hard_split(_Segment(offset, text), chunk_size):
+            if size + len(segment.text) > chunk_size and current:
+                chunk = emit()
+                if chunk:
+                    yield chunk
+                current = overlap()
+                size = sum(len(s.text) for s in current)
+                if size + len(segment.text) > chunk_size:
+                    current, size = [], 0
+                has_body = bool(current)
+                section = " / ".join(filter(None, headings))
+            if not current and not segment.text.strip():
+                continue
+            current.append(segment)
+            size += len(segment.text)
+            has_body = has_body or (title is None and bool(segment.text.strip()))
+
+    if current:
+        chunk = emit()
+        if chunk:
+            yield chunk
+
+def read_chunk(path: str, offset: int, length: int) -> str:
+    """Read a chunk's text back from its source file."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length).decode("utf-8")
+
+def split_file(path: str, source: str) -> Tuple[str, List[SourceChunk], int, float]:
+    """Chunk a whole file; the unit of work of the ingestion process pool.
+
+    The chunks come back as one list, since results cross the process
+    boundary per task, so embedding batches are cut per file rather than as
+    chunk_file produces them. Reading stays streamed; what a worker holds is
+    the file's chunk texts, which ingestion keeps until they are stored anyway.
+
+    Returns:
+        Tuple[str, List[SourceChunk], int, float]: Source, its chunks, file size in bytes and seconds taken
+    """
+    started = time.monotonic()
+    chunks = list(chunk_file(path, source))
+    return source, chunks, os.path.getsize(path), time.monotonic() - started
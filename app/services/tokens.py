@@ -0,0 +1,21 @@
+import logging
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the cl100k_base encoding used by OpenAI embedding models."""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Classical Chinese is about one token per character, so this overestimates safely
+            logger.warning(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+            _encoding = False
+    if _encoding is False:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
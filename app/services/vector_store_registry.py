@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from langchain_community.vectorstores import FAISS
+
+from app.config.settings import KNOWLEDGE_KEEP_VERSIONS
+from app.services import readiness
+from app.services.embedding_cache import get_embeddings
+from app.services.index_factory import load_store
+from app.services.lexical_index import LexicalIndex
+
+# Root of the knowledge store; each rebuild is written to versions/<name>
+VECTOR_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "knowledge")
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+MANIFEST_FILENAME = "manifest.json"
+
+# How often readers check whether another process published a new version
+REFRESH_INTERVAL_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+class StoreVersion:
+    """One loaded version of the vector store and the readers still using it."""
+
+    def __init__(self, name: str, store: FAISS, lexical: Optional[LexicalIndex] = None):
+        self.name = name
+        self.store = store
+        self.lexical = lexical
+        self.readers = 0
+        self.retired = False
+
+def build_lexical_index(store: FAISS) -> LexicalIndex:
+    """Build the lexical index over the chunks of a vector store."""
+    ids = [store.index_to_docstore_id[i] for i in range(len(store.index_to_docstore_id))]
+    return LexicalIndex.build(ids, (store.docstore.search(doc_id).page_content for doc_id in ids))
+
+class VectorStoreRegistry:
+    """Versioned vector stores on disk with an atomically swappable active version.
+
+    Readers lease the active version with `acquire()`; publishing or rolling
+    back swaps the active version without waiting for them, and the old
+    version is released once its last reader is done.
+    """
+
+    def __init__(self, root: str = VECTOR_STORE_PATH, keep_versions: int = KNOWLEDGE_KEEP_VERSIONS):
+        self.root = root
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._active: Optional[StoreVersion] = None
+        self._embeddings = None
+        self._loading = False
+        self._last_refresh = 0.0
+        self.state = "warming"
+
+    def _set_state(self, state: str):
+        self.state = state
+        readiness.set_component_state("retrieval", state)
+
+    @property
+    def versions_path(self) -> str:
+        return os.path.join(self.root, VERSIONS_DIRNAME)
+
+    def version_path(self, name: str) -> str:
+        """Directory holding one version of the store."""
+        # Stores saved before versioning live directly in the root
+        if name == "legacy":
+            return self.root
+        return os.path.join(self.versions_path, name)
+
+    def list_versions(self) -> List[str]:
+        """Published versions, oldest first."""
+        if not os.path.isdir(self.versions_path):
+            return []
+        return sorted(
+            name for name in os.listdir(self.versions_path)
+            if os.path.exists(os.path.join(self.versions_path, name, "index.faiss"))
+        )
+
+    def current_version(self) -> Optional[str]:
+        """Name of the version the CURRENT pointer designates."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILENAME), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            if os.path.exists(os.path.join(self.root, "index.faiss")):
+                return "legacy"
+            return None
+
+    @property
+    def active_version(self) -> Optional[str]:
+        """Name of the version currently served to readers."""
+        active = self._active
+        return active.name if active else None
+
+    @property
+    def current_store(self) -> Optional[FAISS]:
+        """The active store, for callers that don't need a lease."""
+        active = self._active
+        return active.store if active else None
+
+    def load_manifest(self, name: Optional[str] = None) -> Optional[dict]:
+        """Read the manifest saved with a version (the current one by default)."""
+        name = name or self.current_version()
+        if name is None:
+            return None
+        path = os.path.join(self.version_path(name), MANIFEST_FILENAME)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load_store(self, name: str) -> FAISS:
+        """Load a version of the store from disk, independent of the active one."""
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        return load_store(self.version_path(name), self._embeddings)
+
+    def _load_version(self, name: str) -> StoreVersion:
+        store = self.load_store(name)
+        path = self.version_path(name)
+        # Versions published before the lexical index existed get one built on load
+        lexical = LexicalIndex.load(path) if LexicalIndex.exists(path) else build_lexical_index(store)
+        return StoreVersion(name, store, lexical)
+
+    def _write_current(self, name: str):
+        tmp_path = os.path.join(self.root, CURRENT_FILENAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILENAME))
+
+    def _swap(self, version: StoreVersion):
+        """Make a loaded version active and retire the previous one."""
+        with self._lock:
+            previous, self._active = self._active, version
+            self._last_refresh = time.monotonic()
+            if previous is not None:
+                previous.retired = True
+                if previous.readers == 0:
+                    self._release(previous)
+        self._set_state("ready")
+        logger.info(f"Vector store version {version.name} is now active ({version.store.index.ntotal} chunks)")
+
+    def _release(self, version: StoreVersion):
+        # Drop our references so the index memory is freed with the last reader
+        version.store = None
+        version.lexical = None
+        logger.info(f"Released vector store version {version.name}")
+
+    def _prune(self):
+        """Delete old versions beyond keep_versions, never the active one."""
+        active = self.active_version
+        versions = [name for name in self.list_versions() if name != active]
+        for name in versions[:max(0, len(versions) - self.keep_versions)]:
+            shutil.rmtree(self.version_path(name), ignore_errors=True)
+            logger.info(f"Deleted old vector store version {name}")
+
+    def publish(self, store: FAISS, manifest: Dict) -> str:
+        """Save a store as a new version, make it current and active.
+
+        Args:
+            store: The vector store to publish
+            manifest: Manifest describing the files the store was built from
+
+        Returns:
+            str: The name of the new version
+        """
+        # Names sort chronologically, which rollback relies on
+        while True:
+            name = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000 % 10**6:06d}"
+            path = self.version_path(name)
+            try:
+                os.makedirs(path)
+                break
+            except FileExistsError:
+                continue
+        store.save_local(path)
+        lexical = build_lexical_index(store)
+        lexical.save(path)
+        with open(os.path.join(path, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        self._write_current(name)
+        self._swap(StoreVersion(name, store, lexical))
+        self._prune()
+        logger.info(f"Published vector store version {name} to {path}")
+        return name
+
+    def activate(self, name: str):
+        """Load a published version and make it current, e.g. to roll back."""
+        if name not in self.list_versions() and name != "legacy":
+            raise ValueError(f"Unknown vector store version {name!r}")
+        version = self._load_version(name)
+        self._write_current(name)
+        self._swap(version)
+
+    def rollback(self) -> str:
+        """Activate the version published before the current one."""
+        versions = self.list_versions()
+        current = self.current_version()
+        older = [name for name in versions if current is None or name < current]
+        if not older:
+            raise ValueError("No earlier vector store version to roll back to")
+        self.activate(older[-1])
+        return older[-1]
+
+    def load_current(self) -> Optional[FAISS]:
+        """Load the current version from disk if it isn't already active."""
+        name = self.current_version()
+        if name is None:
+            if self._active is None:
+                self._set_state("empty")
+            return None
+        if name != self.active_version:
+            self._swap(self._load_version(name))
+        return self.current_store
+
+    def _refresh_in_background(self, force: bool = False):
+        """Load the current version, e.g. one published by another process, without blocking readers."""
+        now = time.monotonic()
+        if self._loading or (not force and now - self._last_refresh < REFRESH_INTERVAL_SECONDS):
+            return
+        self._last_refresh = now
+        name = self.current_version()
+        if name is None:
+            if self._active is None:
+                self._set_state("empty")
+            return
+        if name == self.active_version:
+            return
+
+        def load():
+            started = time.monotonic()
+            try:
+                self.load_current()
+                logger.info(f"Loaded vector store version {name} in {time.monotonic() - started:.2f}s")
+            except Exception as e:
+                logger.error(f"Failed to load vector store version {name}: {str(e)}")
+                if self._active is None:
+                    self._set_state("error")
+            finally:
+                self._loading = False
+
+        self._loading = True
+        threading.Thread(target=load, name="vector-store-refresh", daemon=True).start()
+
+    def warm_up(self):
+        """Start loading the current version in the background ahead of the first search."""
+        self._refresh_in_background(force=True)
+
+    @contextmanager
+    def lease(self) -> Iterator[Optional[StoreVersion]]:
+        """Lease the active version, with its name, for the duration of a search.
+
+        Yields None while no version is loaded yet; the first call starts loading it.
+        """
+        self._refresh_in_background()
+        with self._lock:
+            version = self._active
+            if version is not None:
+                version.readers += 1
+        try:
+            yield version
+        finally:
+            if version is not None:
+                with self._lock:
+                    version.readers -= 1
+                    if version.retired and version.readers == 0 and version.store is not None:
+                        self._release(version)
+
+    @contextmanager
+    def acquire(self) -> Iterator[Optional[FAISS]]:
+        """Lease the active store for the duration of a search."""
+        with self.lease() as version:
+            yield version.store if version else None
+
+# Shared by the search tool, the chat service and document processing
+registry = VectorStoreRegistry()
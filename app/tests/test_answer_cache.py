@@ -0,0 +1,54 @@
+import asyncio
+import itertools
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.services import chat_service as chat_module
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.chat_service import ChatService
+
+def test_similar_questions_hit_within_their_scope():
+    cache = SemanticAnswerCache(max_entries=10, ttl_seconds=60, threshold=0.9)
+    cache.set(("霜降", "v1"), "桂枝湯的功效", [1.0, 0.0, 0.0], "調和營衛")
+
+    assert cache.get(("霜降", "v1"), "桂枝湯的功效") == "調和營衛"
+    assert cache.get(("霜降", "v1"), "桂枝湯有什麼功效", [0.95, 0.1, 0.0]) == "調和營衛"
+    assert cache.get(("霜降", "v1"), "麻黃湯的功效", [0.5, 0.8, 0.0]) is None
+    assert cache.get(("立冬", "v1"), "桂枝湯的功效", [1.0, 0.0, 0.0]) is None
+    assert cache.get(("霜降", "v2"), "桂枝湯的功效") is None
+    assert cache.stats()["hits"] == 2
+
+def test_opening_question_answered_from_cache(monkeypatch):
+    cache = SemanticAnswerCache(max_entries=10, ttl_seconds=60, threshold=0.9)
+    monkeypatch.setattr(chat_module, "answer_cache", cache)
+    monkeypatch.setattr(chat_module, "index_version", lambda: "v1")
+    monkeypatch.setattr(chat_module, "embed_question", lambda question: [1.0, 0.0])
+
+    def replies():
+        for i in itertools.count():
+            yield AIMessage(content=f"回答{i}")
+
+    class NoToolModel(GenericFakeChatModel):
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+    service = ChatService.__new__(ChatService)
+    service.llm = NoToolModel(messages=replies())
+    service._agent_lock = asyncio.Lock()
+    service.agent = service._create_agent(InMemorySaver())
+
+    async def scenario():
+        first = await service.answer_question("1", "桂枝湯的功效？")
+        other_user = await service.answer_question("2", "桂枝湯 的功效？")
+        follow_up = await service.answer_question("2", "桂枝湯的功效？")
+        history = (await service.agent.aget_state({"configurable": {"thread_id": "2"}})).values["messages"]
+        return first, other_user, follow_up, history
+
+    first, other_user, follow_up, history = asyncio.run(scenario())
+
+    assert first == other_user == "回答0"
+    # Later turns depend on the conversation, so they always reach the model
+    assert follow_up == "回答1"
+    assert [m.content for m in history] == ["桂枝湯 的功效？", "回答0", "桂枝湯的功效？", "回答1"]
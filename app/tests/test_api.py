@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.handlers.api import APIServer
+
+class FakeChatService:
+    """Answers on its own event loop in another thread, like the bot's ChatService."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.user_ids = []
+
+    async def answer_question(self, user_id, question):
+        assert asyncio.get_running_loop() is self.loop
+        self.user_ids.append(user_id)
+        if question == "slow":
+            await asyncio.sleep(10)
+        return f"答：{question}"
+
+    async def stream_answer(self, user_id, question):
+        assert asyncio.get_running_loop() is self.loop
+        yield "status", "📚 查閱典籍…"
+        yield "partial", "答"
+        if question == "slow":
+            await asyncio.sleep(10)
+        yield "answer", f"答：{question}"
+
+AUTH = {"Authorization": "Bearer secret"}
+
+def test_queries_need_the_token_and_stay_in_api_threads():
+    server = APIServer(FakeChatService(), admin_token="secret")
+    client = TestClient(server.get_app())
+    assert client.post("/query", json={"question": "桂枝湯"}).status_code == 401
+    assert client.post("/query/stream", json={"question": "桂枝湯"}).status_code == 401
+    assert client.post("/query/batch", json={"queries": [{"question": "桂枝湯"}]}).status_code == 401
+    disabled = TestClient(APIServer(FakeChatService(), admin_token="").get_app())
+    assert disabled.post("/query", json={"question": "桂枝湯"}, headers=AUTH).status_code == 403
+
+    # A Telegram user's thread is their numeric id; the API can't reach it
+    response = client.post("/query", json={"question": "桂枝湯", "user_id": "12345"}, headers=AUTH)
+    assert response.json()["user_id"] == "12345"
+    assert server.chat_service.user_ids == ["api:12345"]
+
+def test_queries_run_on_the_chat_loop():
+    server = APIServer(admin_token="secret")
+    client = TestClient(server.get_app(), headers=AUTH)
+    assert client.post("/query", json={"question": "桂枝湯"}).status_code == 503
+
+    server.set_chat_service(FakeChatService())
+    response = client.post("/query", json={"question": "桂枝湯", "user_id": "u1"})
+    assert response.status_code == 200
+    assert response.json()["answer"] == "答：桂枝湯"
+    assert client.post("/query", json={"question": "slow", "timeout_seconds": 0.2}).status_code == 504
+
+    response = client.post("/query/batch", json={"queries": [
+        {"question": "桂枝湯"}, {"question": "slow", "timeout_seconds": 0.2}, {"question": "麻黃湯"},
+    ]})
+    results = response.json()["results"]
+    assert [r["answer"] for r in results] == ["答：桂枝湯", None, "答：麻黃湯"]
+    assert results[1]["error"].startswith("Timed out")
+    # Questions without a user id each start their own conversation
+    assert len(set(server.chat_service.user_ids)) == len(server.chat_service.user_ids)
+
+def test_stream_sends_events_and_times_out():
+    server = APIServer(FakeChatService(), admin_token="secret")
+    client = TestClient(server.get_app(), headers=AUTH)
+
+    body = client.post("/query/stream", json={"question": "桂枝湯", "user_id": "u1"}).text
+    assert [line for line in body.splitlines() if line.startswith("event:")] == [
+        "event: start", "event: status", "event: partial", "event: answer",
+    ]
+    assert 'data: {"text": "答：桂枝湯"}' in body
+
+    body = client.post("/query/stream", json={"question": "slow", "timeout_seconds": 0.2}).text
+    assert body.rstrip().splitlines()[-2:] == ["event: error", 'data: {"error": "Timed out after 0.2s"}']
@@ -0,0 +1,38 @@
+import numpy as np
+
+import benchmark
+from app.tools import search_tool
+
+def test_hash_embeddings_are_deterministic_and_meaningful():
+    embeddings = benchmark.HashEmbeddings(size=256)
+    first, again = embeddings.embed_query("太陽病，發熱汗出"), benchmark.HashEmbeddings(size=256).embed_query("太陽病，發熱汗出")
+    similar, unrelated = embeddings.embed_documents(["太陽病，發熱惡寒", "小柴胡湯方"])
+
+    assert first == again
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert np.dot(first, similar) > np.dot(first, unrelated)
+    assert len(embeddings.embed_query("")) == 256
+
+def test_benchmark_reports_every_index_type_and_k(tmp_path):
+    corpus = tmp_path / "texts"
+    corpus.mkdir()
+    for i in range(2):
+        (corpus / f"book{i}.txt").write_text("# 太陽病\n" + "太陽病，發熱汗出，桂枝湯主之。" * 200 + str(i), encoding="utf-8")
+    registry = search_tool.registry
+
+    results = benchmark.run_benchmark(
+        str(corpus), index_types=["flat", "hnsw"], ks=[2, 4], queries=["桂枝湯", "發熱"], repeat=2, embedding_size=16
+    )
+
+    assert search_tool.registry is registry
+    assert results["ingestion"]["files"] == 2 and results["ingestion"]["chunks"] > 2
+    assert [index["index_type"] for index in results["indexes"]] == ["flat", "hnsw"]
+    for index in results["indexes"]:
+        assert index["disk_mb"] > 0
+        assert index["resident_mb"] >= index["index_mb"] >= 0
+        assert [(search["k"], search["searches"]) for search in index["search"]] == [(2, 4), (4, 4)]
+        assert all(0 < search["p50_ms"] <= search["p99_ms"] for search in index["search"])
+
+    metrics = benchmark.flatten_metrics(results)
+    assert "hnsw.k=4.p95_ms" in metrics and "ingestion.chunks_per_second" in metrics
+    assert len(benchmark.compare(results, results)) == len(metrics)
@@ -0,0 +1,46 @@
+from langchain_core.documents import Document
+
+from app.services import context_packer
+from app.services.context_packer import pack_context, source_label
+
+def doc(text, source, chunk):
+    return Document(page_content=text, metadata={"source": source, "chunk": chunk})
+
+def test_source_label_strips_file_naming():
+    assert source_label("CM001-醫宗金鑑 File_1039.txt") == "醫宗金鑑"
+    assert source_label("傷寒論.txt") == "傷寒論"
+
+def test_adjacent_chunks_merge_and_duplicates_drop(monkeypatch):
+    monkeypatch.setattr(context_packer, "count_tokens", len)
+    docs = [
+        doc("太陽病，頭痛發熱，汗出惡風，", "傷寒論.txt", 3),
+        doc("汗出惡風，桂枝湯主之。", "傷寒論.txt", 4),
+        doc("太陽病，頭痛發熱，汗出惡風，", "CM002-傷寒論注 File_7.txt", 0),
+        doc("傷寒五六日，往來寒熱，小柴胡湯主之。", "傷寒論.txt", 20),
+    ]
+
+    packed = pack_context(docs, token_budget=200)
+
+    assert packed.split("\n\n") == [
+        "【傷寒論】\n太陽病，頭痛發熱，汗出惡風，桂枝湯主之。",
+        "【傷寒論】\n傷寒五六日，往來寒熱，小柴胡湯主之。",
+    ]
+
+def test_budget_cuts_at_sentence_boundary(monkeypatch):
+    monkeypatch.setattr(context_packer, "count_tokens", len)
+    text = "太陽病，頭痛發熱。" * 20
+
+    packed = pack_context([doc(text, "傷寒論.txt", 0)], token_budget=100)
+
+    assert len(packed) <= 100
+    assert packed.endswith("。")
+
+def test_offsets_merge_overlapping_chunks(monkeypatch):
+    monkeypatch.setattr(context_packer, "count_tokens", len)
+    first, second = "太陽病，發熱。汗出，惡風。", "汗出，惡風。名為中風。"
+    docs = [
+        Document(page_content=second, metadata={"source": "a.txt", "offset": 21, "length": 33, "section": "卷一 / 01"}),
+        Document(page_content=first, metadata={"source": "a.txt", "offset": 0, "length": 39, "section": "卷一"}),
+    ]
+
+    assert pack_context(docs, token_budget=200) == "【a · 卷一】\n太陽病，發熱。汗出，惡風。名為中風。"
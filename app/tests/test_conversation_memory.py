@@ -0,0 +1,105 @@
+import asyncio
+import itertools
+
+import aiosqlite
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.prebuilt import create_react_agent
+
+from app.services import conversation_memory
+from app.services.conversation_memory import BoundedSqliteSaver, compact_history, open_checkpointer, trim_history
+
+class ToolCallingFakeModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+@tool
+def search_documents(query: str) -> str:
+    """Search the classics."""
+    return "太陽病，頭痛發熱，汗出惡風，桂枝湯主之。" * 50
+
+def turn(i):
+    return [
+        HumanMessage(content=f"問題{i}", id=f"h{i}"),
+        AIMessage(content="", tool_calls=[{"name": "search_documents", "args": {"query": "桂枝湯"}, "id": f"c{i}"}], id=f"a{i}"),
+        ToolMessage(content="經文" * 500, tool_call_id=f"c{i}", id=f"t{i}"),
+        AIMessage(content=f"回答{i}", id=f"r{i}"),
+    ]
+
+def test_compact_history_keeps_current_turn(monkeypatch):
+    monkeypatch.setattr(conversation_memory, "count_tokens", len)
+    messages = turn(1) + turn(2) + turn(3)[:3]
+
+    compacted = compact_history(messages, token_budget=100, tool_output_chars=20)
+
+    # Only the newest earlier turn fits, with its tool output cut down
+    assert [m.id for m in compacted] == ["h2", "a2", "t2", "r2", "h3", "a3", "t3"]
+    assert len(compacted[2].content) < 40
+    assert compacted[-1].content == messages[-1].content
+    assert trim_history({"messages": compacted[-3:]}) == {"llm_input_messages": compacted[-3:]}
+
+def test_saver_prunes_checkpoints_and_evicts_threads(tmp_path, monkeypatch):
+    # Ten tokens per character, so only one earlier turn fits the default budget
+    monkeypatch.setattr(conversation_memory, "count_tokens", lambda text: 10 * len(text))
+
+    async def scenario():
+        saver = await open_checkpointer(str(tmp_path / "memory.db"))
+        saver.checkpoints_per_thread, saver.max_threads = 2, 1
+        def replies():
+            for i in itertools.count():
+                yield AIMessage(content="", tool_calls=[{"name": "search_documents", "args": {"query": "桂枝湯"}, "id": f"c{i}"}])
+                yield AIMessage(content="桂枝湯主之")
+
+        agent = create_react_agent(
+            ToolCallingFakeModel(messages=replies()), [search_documents],
+            pre_model_hook=trim_history, checkpointer=saver
+        )
+        config = {"configurable": {"thread_id": "1"}}
+        sizes = []
+        for i in range(6):
+            await agent.ainvoke({"messages": [HumanMessage(content=f"問題{i}")]}, config)
+            state = await agent.aget_state(config)
+            sizes.append(len(state.values["messages"]))
+        async with saver.conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = '1'") as cursor:
+            checkpoints = (await cursor.fetchone())[0]
+
+        await agent.ainvoke({"messages": [HumanMessage(content="你好")]}, {"configurable": {"thread_id": "2"}})
+        evicted = await saver.evict_threads()
+        remaining = await saver.aget_tuple(config)
+        await saver.conn.close()
+        return sizes, checkpoints, evicted, remaining
+
+    sizes, checkpoints, evicted, remaining = asyncio.run(scenario())
+
+    assert max(sizes[2:]) == min(sizes[2:])  # the stored conversation stops growing
+    assert checkpoints == 2
+    assert evicted == 1 and remaining is None
+
+def test_idle_threads_are_evicted_as_checkpoints_are_saved(tmp_path, monkeypatch):
+    """Threads unused for idle_seconds go on the periodic sweep, even with room under max_threads."""
+    monkeypatch.setattr(conversation_memory, "EVICT_EVERY", 3)
+
+    async def scenario():
+        saver = BoundedSqliteSaver(
+            await aiosqlite.connect(str(tmp_path / "memory.db")),
+            max_threads=10, idle_seconds=60, checkpoints_per_thread=1,
+        )
+        await saver.setup()
+        agent = create_react_agent(
+            ToolCallingFakeModel(messages=itertools.repeat(AIMessage(content="桂枝湯主之"))), [], checkpointer=saver
+        )
+        idle, active = {"configurable": {"thread_id": "idle"}}, {"configurable": {"thread_id": "active"}}
+        await agent.ainvoke({"messages": [HumanMessage(content="問題")]}, idle)
+        await saver.conn.execute("UPDATE thread_activity SET last_used = last_used - 120 WHERE thread_id = 'idle'")
+        await saver.conn.commit()
+        # Each turn saves a few checkpoints, which triggers the sweep
+        await agent.ainvoke({"messages": [HumanMessage(content="問題")]}, active)
+
+        async with saver.conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id") as cursor:
+            checkpoints = dict(await cursor.fetchall())
+        await saver.conn.close()
+        return checkpoints
+
+    assert asyncio.run(scenario()) == {"active": 1}
@@ -0,0 +1,79 @@
+import asyncio
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from sqlalchemy import create_engine, func, inspect, select, text
+
+from app.models.database import (
+    Base, TextChunk, async_database_url, get_async_session_maker, init_async_db, init_db
+)
+from app.services import document_processor
+from app.services.vector_store_registry import VectorStoreRegistry
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///./rag_chatbot.db") == "sqlite+aiosqlite:///./rag_chatbot.db"
+    assert async_database_url("postgres://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+    assert async_database_url("postgresql+psycopg2://u:p@host:5433/db") == "postgresql+asyncpg://u:p@host:5433/db"
+
+def test_chunks_round_trip_through_the_async_database(tmp_path, monkeypatch):
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    for i in range(2):
+        (texts / f"book{i}.txt").write_text("太陽病，發熱汗出。" * 300 + str(i), encoding="utf-8")
+    monkeypatch.setattr(document_processor, "TEXT_DIRECTORY", str(texts))
+    monkeypatch.setattr(document_processor, "INGEST_WORKERS", 1)
+    monkeypatch.setattr(document_processor, "get_embeddings", lambda: DeterministicFakeEmbedding(size=8))
+
+    async def scenario():
+        engine = init_async_db(f"sqlite:///{tmp_path}/chunks.db")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = get_async_session_maker(engine)
+            stored = await document_processor.DocumentProcessor(
+                sessions, VectorStoreRegistry(str(tmp_path / "a"))
+            ).process_documents()
+            async with sessions() as session:
+                rows = await session.scalar(select(func.count()).select_from(TextChunk))
+            # A fresh container rebuilds the same index from the database alone
+            rebuilt = await document_processor.DocumentProcessor(
+                sessions, VectorStoreRegistry(str(tmp_path / "b"))
+            ).rebuild_from_db()
+            return stored.index.ntotal, rows, rebuilt
+        finally:
+            await engine.dispose()
+
+    stored, rows, rebuilt = asyncio.run(scenario())
+
+    assert stored == rows == rebuilt.index.ntotal > 2
+    assert {doc.metadata["source"] for doc in rebuilt.docstore._dict.values()} == {"book0.txt", "book1.txt"}
+
+def test_init_db_replaces_tables_of_the_original_schema(tmp_path):
+    """Databases created before chunk ids and binary embeddings are upgraded on start."""
+    url = f"sqlite:///{tmp_path}/legacy.db"
+    legacy = create_engine(url)
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, filename VARCHAR(255) NOT NULL, content TEXT NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE text_chunks (id INTEGER PRIMARY KEY, content TEXT NOT NULL, "
+            "document_id INTEGER NOT NULL REFERENCES documents(id), embedding TEXT NOT NULL)"
+        ))
+        conn.execute(text("INSERT INTO documents (filename, content) VALUES ('傷寒論.txt', '太陽病')"))
+    legacy.dispose()
+
+    engine = init_db(url)
+    columns = {column["name"] for column in inspect(engine).get_columns("documents")}
+    assert {"sha256", "filename"} <= columns
+    assert "chunk_id" in {column["name"] for column in inspect(engine).get_columns("text_chunks")}
+    engine.dispose()
+
+    # Current tables are left alone
+    engine = init_db(url)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO documents (filename, sha256) VALUES ('金匱要略.txt', 'x')"))
+    engine.dispose()
+    engine = init_db(url)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM documents")).scalar() == 1
+    engine.dispose()
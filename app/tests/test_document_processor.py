@@ -0,0 +1,146 @@
+import asyncio
+import functools
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from sqlalchemy import select
+
+from app.models.database import Base, TextChunk, get_async_session_maker, init_async_db
+from app.services import document_processor
+from app.services.index_factory import RerankedFAISS, build_store
+from app.services.vector_store_registry import VectorStoreRegistry
+
+class RecordingEmbeddings(Embeddings):
+    """Fake embeddings that remember every text sent to be embedded."""
+
+    def __init__(self):
+        self.fake = DeterministicFakeEmbedding(size=8)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.fake.embed_query(text)
+
+def write_book(directory, name: str, marker: str):
+    (directory / name).write_text(f"{marker}病，發熱汗出。" * 300, encoding="utf-8")
+
+@pytest.mark.parametrize("index_type, search_dimensions", [
+    ("flat", 0), ("hnsw", 0), ("ivf_flat", 0), ("ivf_pq", 0), ("flat", 4), ("ivf_flat", 4),
+])
+def test_only_changed_files_are_reembedded(tmp_path, monkeypatch, index_type, search_dimensions):
+    """Editing, deleting and adding files re-embeds just those, and the index, docstore and manifest agree."""
+    monkeypatch.setattr(document_processor, "INGEST_WORKERS", 1)
+    # HNSW and IVF indexes can't delete in place, so the processor rebuilds them from the database
+    monkeypatch.setattr(document_processor, "VECTOR_INDEX_TYPE", index_type)
+    monkeypatch.setattr(document_processor, "VECTOR_SEARCH_DIMENSIONS", search_dimensions)
+    monkeypatch.setattr(document_processor, "build_store", functools.partial(
+        build_store, index_type=index_type, search_dimensions=search_dimensions
+    ))
+
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    write_book(texts, "edited.txt", "太陽")
+    write_book(texts, "deleted.txt", "少陽")
+    write_book(texts, "unchanged.txt", "陽明")
+    embeddings = RecordingEmbeddings()
+    registry = VectorStoreRegistry(str(tmp_path / "knowledge"))
+    registry._embeddings = embeddings
+    rebuilds = []
+    build_from_db = document_processor.DocumentProcessor._build_from_db
+
+    async def counting_build_from_db(self):
+        rebuilds.append(self)
+        return await build_from_db(self)
+
+    monkeypatch.setattr(document_processor.DocumentProcessor, "_build_from_db", counting_build_from_db)
+
+    async def scenario():
+        engine = init_async_db(f"sqlite:///{tmp_path}/chunks.db")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = get_async_session_maker(engine)
+
+            def processor():
+                return document_processor.DocumentProcessor(sessions, registry, None, embeddings, str(texts))
+
+            await processor().process_documents()
+            first = registry.load_manifest()["files"]
+
+            write_book(texts, "edited.txt", "厥陰")
+            (texts / "deleted.txt").unlink()
+            write_book(texts, "added.txt", "太陰")
+            embeddings.embedded.clear()
+            rebuilds.clear()
+            store = await processor().process_documents()
+
+            async with sessions() as session:
+                stored = set(await session.scalars(select(TextChunk.chunk_id)))
+            return first, store, stored
+        finally:
+            await engine.dispose()
+
+    first, store, stored = asyncio.run(scenario())
+    manifest = registry.load_manifest()
+
+    assert set(manifest["files"]) == {"edited.txt", "unchanged.txt", "added.txt"}
+    assert manifest["index_type"] == index_type
+    assert manifest["files"]["unchanged.txt"] == first["unchanged.txt"]
+    assert manifest["files"]["edited.txt"]["sha256"] != first["edited.txt"]["sha256"]
+
+    expected = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]}
+    assert set(store.index_to_docstore_id.values()) == set(store.docstore._dict) == stored == expected
+    assert store.index.ntotal == len(expected)
+    assert not expected & set(first["deleted.txt"]["chunk_ids"])
+
+    # Only the edited and the added file went to the embedding API
+    assert embeddings.embedded
+    assert all(("厥陰" in text) or ("太陰" in text) for text in embeddings.embedded)
+    assert registry.load_store(registry.current_version()).index.ntotal == len(expected)
+    assert len(rebuilds) == (0 if index_type == "flat" else 1)
+
+    # Every position still finds its own chunk, and reduced stores re-score it with its own full vector
+    assert isinstance(store, RerankedFAISS) == bool(search_dimensions)
+    if index_type == "ivf_pq":
+        return  # product quantization only finds approximate neighbours
+    for position, doc_id in store.index_to_docstore_id.items():
+        doc = store.docstore.search(doc_id)
+        vector = embeddings.embed_query(doc.page_content)
+        if search_dimensions:
+            np.testing.assert_allclose(store.full_vectors[position], vector, atol=1e-3)
+        found, distance = store.similarity_search_with_score_by_vector(vector, k=1)[0]
+        assert found.page_content == doc.page_content and distance < 1e-3
+
+def test_process_pool_splits_like_a_single_worker(tmp_path, monkeypatch):
+    """Chunks split in spawned worker processes match the in-process ones exactly."""
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    for name, marker in (("傷寒論.txt", "太陽"), ("金匱要略.txt", "少陰"), ("溫病條辨.txt", "陽明")):
+        write_book(texts, name, marker)
+    executors = []
+    split_executor = document_processor.DocumentProcessor._split_executor
+
+    def recording_split_executor(self, files):
+        executors.append(split_executor(self, files))
+        return executors[-1]
+
+    monkeypatch.setattr(document_processor.DocumentProcessor, "_split_executor", recording_split_executor)
+
+    def ingest(workers: int) -> dict:
+        monkeypatch.setattr(document_processor, "INGEST_WORKERS", workers)
+        embeddings = RecordingEmbeddings()
+        registry = VectorStoreRegistry(str(tmp_path / f"knowledge-{workers}"))
+        registry._embeddings = embeddings
+        processor = document_processor.DocumentProcessor(None, registry, None, embeddings, str(texts))
+        store = asyncio.run(processor.process_documents())
+        return {doc_id: (doc.page_content, doc.metadata) for doc_id, doc in store.docstore._dict.items()}
+
+    single = ingest(1)
+    pooled = ingest(2)
+
+    assert [type(executor).__name__ for executor in executors] == ["ThreadPoolExecutor", "ProcessPoolExecutor"]
+    assert pooled == single and len(single) > 3
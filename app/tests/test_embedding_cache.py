@@ -0,0 +1,35 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings that record which texts reached the "API"."""
+
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+def test_cache_only_embeds_misses(tmp_path):
+    """Texts seen before are served from the cache, even by a new process."""
+    underlying = CountingEmbeddings(size=8, calls=[])
+    embeddings = CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path / "cache.db")), "model:native")
+
+    first = embeddings.embed_documents(["咳嗽", "頭痛", "咳嗽"])
+    reopened = CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path / "cache.db")), "model:native")
+    second = reopened.embed_documents(["頭痛", "發熱"])
+
+    assert underlying.calls == [["咳嗽", "頭痛"], ["發熱"]]
+    assert first[0] == first[2]
+    assert second[0] == pytest.approx(first[1], abs=1e-6)  # stored as float32
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """The cache never holds more than max_entries vectors."""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    cache.get_many(["a"])
+    cache.put_many({"c": [3.0]})
+
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
@@ -0,0 +1,24 @@
+import asyncio
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.embedding_pipeline import EmbeddingPipeline
+
+def test_batches_respect_token_and_size_limits():
+    """Batches never exceed the token budget or the input count."""
+    pipeline = EmbeddingPipeline(DeterministicFakeEmbedding(size=8), max_batch_tokens=10, max_batch_size=3)
+    pipeline.count_tokens = len  # one token per character
+
+    batches = pipeline.make_batches(["咳嗽", "發熱", "頭痛", "腹瀉", "太陽病發熱"])
+
+    assert [indices for indices, _ in batches] == [[0, 1, 2], [3, 4]]
+    assert all(tokens <= 10 for _, tokens in batches)
+
+def test_embed_preserves_order():
+    """Vectors come back in input order however the requests complete."""
+    embeddings = DeterministicFakeEmbedding(size=8)
+    pipeline = EmbeddingPipeline(embeddings, max_batch_size=2, concurrency=3)
+    texts = [f"第{i}章" for i in range(7)]
+
+    vectors = asyncio.run(pipeline.embed(texts))
+
+    assert vectors == embeddings.embed_documents(texts)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from app.services.index_factory import (
+    INDEX_TYPES, RerankedFAISS, build_store, create_index, load_store, recall_at_k, search_store, supports_removal
+)
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(42)
+    matrix = rng.normal(size=(600, 32)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_every_index_type_finds_its_own_vectors(vectors, index_type):
+    """Each index type trains, adds and returns near-exact neighbours."""
+    index = create_index(vectors, index_type)
+    index.add(vectors)
+
+    assert index.ntotal == len(vectors)
+    assert recall_at_k(index, vectors, vectors[:50], k=1) >= 0.5
+
+def test_flat_recall_is_exact(vectors):
+    index = create_index(vectors, "flat")
+    index.add(vectors)
+
+    assert recall_at_k(index, vectors, vectors[:50], k=8) == 1.0
+
+def test_build_store_keeps_ids_and_metadata(vectors):
+    """Stores built by the factory work like FAISS.from_embeddings ones."""
+    texts = [f"第{i}條" for i in range(len(vectors))]
+    store = build_store(
+        list(zip(texts, vectors.tolist())),
+        DeterministicFakeEmbedding(size=32),
+        [{"source": "test.txt", "chunk": i} for i in range(len(vectors))],
+        [f"id-{i}" for i in range(len(vectors))],
+        index_type="hnsw",
+    )
+
+    doc, _ = store.similarity_search_with_score_by_vector(vectors[7].tolist(), k=1)[0]
+    assert (doc.page_content, doc.metadata["chunk"]) == ("第7條", 7)
+    assert not supports_removal(store.index)
+
+def test_reduced_store_reranks_at_full_width(vectors, tmp_path):
+    """A store searched on shortened vectors still ranks by full-width distance, before and after saving."""
+    texts = [f"第{i}條" for i in range(len(vectors))]
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = build_store(
+        list(zip(texts, vectors.tolist())), embedding,
+        [{"chunk": i} for i in range(len(vectors))], [f"id-{i}" for i in range(len(vectors))],
+        index_type="flat", search_dimensions=8,
+    )
+    assert isinstance(store, RerankedFAISS) and store.index.d == 8
+
+    distances, found = search_store(store, vectors[:20], 4)
+    assert (found[:, 0] == np.arange(20)).all()
+    full_width = ((vectors[found] - vectors[:20, None, :]) ** 2).sum(axis=2)
+    assert np.allclose(distances, full_width, atol=1e-2)
+
+    store.save_local(str(tmp_path))
+    loaded = load_store(str(tmp_path), embedding)
+    assert isinstance(loaded, RerankedFAISS) and isinstance(loaded.full_vectors, np.memmap)
+
+    # Full-width rows stay aligned with the index as chunks come and go
+    loaded.delete(["id-0", "id-1"])
+    loaded.add_embeddings([("新條", vectors[0].tolist())], ids=["id-new"])
+    doc, _ = loaded.similarity_search_with_score_by_vector(vectors[5].tolist(), k=1)[0]
+    assert doc.page_content == "第5條"
+    doc, _ = loaded.similarity_search_with_score_by_vector(vectors[0].tolist(), k=1)[0]
+    assert doc.page_content == "新條"
+    assert len(loaded.full_vectors) == loaded.index.ntotal == len(vectors) - 1
+
+    # Metadata filters apply to the re-scored hits
+    hits = loaded.similarity_search_with_score_by_vector(vectors[6].tolist(), k=2, filter={"chunk": 6})
+    assert [doc.page_content for doc, _ in hits] == ["第6條"]
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from app.handlers.api import APIServer
+from app.services.document_processor import DocumentProcessor
+from app.services.ingest_jobs import IngestJobRunner, IngestJobRunning
+from app.services.vector_store_registry import VectorStoreRegistry
+
+class GatedEmbeddings(Embeddings):
+    """Embeds only once the test opens the gate, so a job can be caught mid-run."""
+
+    def __init__(self):
+        self.fake = DeterministicFakeEmbedding(size=8)
+        self.gate = threading.Event()
+
+    def embed_documents(self, texts):
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.fake.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        while not self.gate.is_set():
+            await asyncio.sleep(0.01)
+        return self.embed_documents(texts)
+
+@pytest.fixture
+def make_runner(tmp_path):
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    for name in ("傷寒論", "金匱要略"):
+        (texts / f"{name}.txt").write_text(f"{name}\n\n" + "太陽之為病，脈浮，頭項強痛而惡寒。\n" * 20, encoding="utf-8")
+    registry = VectorStoreRegistry(str(tmp_path / "knowledge"))
+
+    def make_runner(embeddings):
+        registry._embeddings = embeddings
+        return IngestJobRunner(
+            lambda sessions: DocumentProcessor(sessions, registry, None, embeddings, str(texts)), database_url=None
+        )
+
+    make_runner.registry = registry
+    return make_runner
+
+def test_job_runs_in_the_background_with_progress(make_runner):
+    embeddings = GatedEmbeddings()
+    runner = make_runner(embeddings)
+    job = runner.start("test")
+
+    with pytest.raises(IngestJobRunning):
+        runner.start("test")
+    assert runner.status()["state"] == "running"
+
+    embeddings.gate.set()
+    assert job.done.result(timeout=30) is job
+    status = runner.status()
+    assert status["state"] == "succeeded" and status["error"] is None
+    assert status["progress"]["files_done"] == status["progress"]["files_total"] == 2
+    assert status["progress"]["embeddings_done"] == status["progress"]["chunks"] == status["total_chunks"] > 0
+    assert status["version"] == make_runner.registry.current_version()
+    assert not runner.cancel()
+
+def test_cancelled_job_publishes_nothing(make_runner):
+    embeddings = GatedEmbeddings()
+    runner = make_runner(embeddings)
+    job = runner.start("test")
+
+    assert runner.cancel()
+    assert job.done.result(timeout=30).state == "cancelled"
+    assert make_runner.registry.current_version() is None
+    # A new job can start once the last one is done
+    embeddings.gate.set()
+    assert runner.start("test").done.result(timeout=30).state == "succeeded"
+
+def test_process_routes_need_the_admin_token(make_runner):
+    embeddings = GatedEmbeddings()
+    client = TestClient(APIServer(ingest_runner=make_runner(embeddings), admin_token="secret").get_app())
+    auth = {"Authorization": "Bearer secret"}
+
+    assert client.post("/process").status_code == 401
+    assert client.get("/process/status", headers=auth).status_code == 404
+    assert client.post("/process", headers=auth).status_code == 202
+    assert client.post("/process", headers=auth).status_code == 409
+    assert client.get("/process/status", headers=auth).json()["state"] == "running"
+    assert client.post("/process/cancel", headers=auth).json()["cancel_requested"]
+
+    embeddings.gate.set()
+    disabled = TestClient(APIServer(ingest_runner=make_runner(embeddings), admin_token="").get_app())
+    assert disabled.get("/process/status", headers=auth).status_code == 403
@@ -0,0 +1,26 @@
+from app.services.lexical_index import LexicalIndex, query_terms, reciprocal_rank_fusion
+
+TEXTS = [
+    "太陽病，頭痛發熱，汗出惡風，桂枝湯主之。",
+    "太陽病，頭痛發熱，身疼腰痛，無汗而喘者，麻黃湯主之。",
+    "傷寒五六日，往來寒熱，胸脇苦滿，小柴胡湯主之。",
+]
+
+def test_query_terms_use_bigrams_and_trigrams():
+    assert query_terms("桂枝湯") == ["桂枝", "枝湯", "桂枝湯"]
+    assert query_terms("熱") == ["熱"]
+
+def test_exact_terms_rank_first(tmp_path):
+    index = LexicalIndex.build(["a", "b", "c"], TEXTS)
+    index.save(str(tmp_path))
+    index = LexicalIndex.load(str(tmp_path))
+
+    assert index.search("桂枝湯", k=3)[0][0] == "a"
+    assert index.search("小柴胡湯", k=3)[0][0] == "c"
+    assert [doc_id for doc_id, _ in index.search("寒", k=3)] == ["c"]
+    assert index.search("人參", k=3) == []
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "e"]], k=3)
+
+    assert fused == ["b", "a", "d"]
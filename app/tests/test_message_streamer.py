@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import json
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langgraph.checkpoint.memory import InMemorySaver
+
+from telegram.error import BadRequest, RetryAfter
+
+from app.handlers.message_streamer import MessageStreamer, split_answer
+from app.services.chat_service import ChatService
+
+class StreamingToolModel(GenericFakeChatModel):
+    """Streams text token by token and tool calls as tool call chunks, like the OpenAI client."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = next(self.messages)
+        for token in message.content.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, id=message.id))
+        for i, call in enumerate(message.tool_calls):
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", id=message.id, tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call["id"], "index": i}
+            ]))
+
+class FakeMessage:
+    def __init__(self, failures=()):
+        self.edits, self.replies = [], []
+        self.failures = list(failures)  # raised by the next edits, in order
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+        return self
+
+    async def reply_markdown_v2(self, text):
+        self.replies.append(text)
+
+    async def edit_text(self, text, parse_mode=None):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.edits.append(text)
+
+def test_stream_answer_reports_tools_then_answer():
+    def replies():
+        for i in itertools.count():
+            yield AIMessage(content="", tool_calls=[{"name": "search_documents", "args": {"query": "桂枝湯"}, "id": f"c{i}"}])
+            yield AIMessage(content="桂枝湯 主治 太陽中風。")
+
+    service = ChatService.__new__(ChatService)
+    service.llm = StreamingToolModel(messages=replies())
+    service._agent_lock = asyncio.Lock()
+    service.agent = service._create_agent(InMemorySaver())
+
+    async def collect():
+        return [event async for event in service.stream_answer("1", "桂枝湯？")]
+
+    events = asyncio.run(collect())
+
+    assert events[0] == ("status", "📚 查閱典籍：桂枝湯…")
+    assert ("partial", "桂枝湯主治") in events
+    assert events[-1] == ("answer", "桂枝湯主治太陽中風。")
+
+def test_streamer_throttles_edits_but_always_shows_the_answer():
+    async def scenario():
+        message = FakeMessage()
+        streamer = MessageStreamer(message, min_interval=60)
+        await streamer.start()
+        await streamer.update("📚 查閱典籍…")  # too soon after the placeholder
+        streamer.next_edit = 0
+        await streamer.update("桂枝湯")
+        await streamer.update("桂枝湯主治")  # throttled
+        streamer.next_edit = 0
+        await streamer.finish("**桂枝湯**主治太陽中風。")
+        return message
+
+    message = asyncio.run(scenario())
+
+    assert message.replies == ["🤔 思考中…"]
+    assert message.edits == ["桂枝湯", "*桂枝湯*主治太陽中風。"]
+
+def test_split_answer():
+    text = "第一段\n" * 10 + "長" * 25
+    parts = split_answer(text, limit=20)
+
+    assert "".join(parts) == text
+    assert all(len(part) <= 20 for part in parts)
+
+def test_final_edit_waits_out_flood_control():
+    """A RetryAfter on the answer is waited out instead of leaving the placeholder and sending a new message."""
+    async def scenario():
+        message = FakeMessage(failures=[RetryAfter(0)])
+        streamer = MessageStreamer(message, min_interval=0)
+        await streamer.start()
+        await streamer.finish("桂枝湯主治太陽中風。")
+        return message
+
+    message = asyncio.run(scenario())
+
+    assert message.replies == ["🤔 思考中…"]
+    assert message.edits == ["桂枝湯主治太陽中風。"]
+
+def test_errors_replace_the_placeholder():
+    async def scenario(failures):
+        message = FakeMessage(failures)
+        streamer = MessageStreamer(message, min_interval=0)
+        await streamer.start()
+        await streamer.update("桂枝湯 ▌")
+        await streamer.fail("出錯了")
+        return message
+
+    message = asyncio.run(scenario([]))
+    assert message.replies == ["🤔 思考中…"]
+    assert message.edits == ["桂枝湯 ▌", "出錯了"]
+
+    # Only when the placeholder can't be edited is the error sent on its own
+    message = asyncio.run(scenario([BadRequest("Message to edit not found")] * 2))
+    assert message.replies == ["🤔 思考中…", "出錯了"]
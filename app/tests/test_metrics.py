@@ -0,0 +1,65 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.prebuilt import create_react_agent
+from prometheus_client import REGISTRY
+
+from app.handlers.api import APIServer
+from app.services import chat_service as chat_module
+from app.services.chat_service import ChatService
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+@tool
+def lookup(query: str) -> str:
+    """Look a keyword up."""
+    return f"關於{query}"
+
+def test_answer_records_llm_time_tokens_and_tool_calls(monkeypatch):
+    monkeypatch.setattr(chat_module, "index_version", lambda: None)
+
+    class NoBindModel(GenericFakeChatModel):
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+    usage = {"input_tokens": 100, "output_tokens": 20, "total_tokens": 120}
+    model = NoBindModel(messages=iter([
+        AIMessage(content="", usage_metadata=usage, tool_calls=[
+            {"name": "lookup", "args": {"query": "咳嗽"}, "id": "1"},
+            {"name": "lookup", "args": {"query": "發熱"}, "id": "2"},
+        ]),
+        AIMessage(content="多喝水", usage_metadata=usage),
+    ]))
+    service = ChatService.__new__(ChatService)
+    service._agent_lock = asyncio.Lock()
+    service.agent = create_react_agent(model, tools=[lookup], checkpointer=InMemorySaver())
+    before = {
+        "llm": sample("rag_stage_seconds_count", stage="llm"),
+        "answer": sample("rag_stage_seconds_count", stage="answer"),
+        "tools": sample("rag_tool_calls_total", tool="lookup"),
+        "input": sample("rag_llm_tokens_total", direction="input"),
+        "answers": sample("rag_answers_total", source="model"),
+        "per_answer": sample("rag_tool_calls_per_answer_sum"),
+    }
+
+    assert asyncio.run(service.answer_question("u1", "感冒怎麼辦")) == "多喝水"
+
+    assert sample("rag_stage_seconds_count", stage="llm") - before["llm"] == 2
+    assert sample("rag_stage_seconds_count", stage="answer") - before["answer"] == 1
+    assert sample("rag_tool_calls_total", tool="lookup") - before["tools"] == 2
+    assert sample("rag_llm_tokens_total", direction="input") - before["input"] == 200
+    assert sample("rag_answers_total", source="model") - before["answers"] == 1
+    assert sample("rag_tool_calls_per_answer_sum") - before["per_answer"] == 2
+
+def test_metrics_endpoint_serves_prometheus_text():
+    client = TestClient(APIServer().get_app())
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE rag_stage_seconds histogram" in response.text
@@ -0,0 +1,111 @@
+import time
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.query_cache import TTLCache, normalize_query
+from app.services.vector_store_registry import VectorStoreRegistry
+from app.tools import search_tool
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    queries: list = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+def test_lru_and_ttl_eviction():
+    cache = TTLCache(max_entries=2, ttl_seconds=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 2
+
+def test_normalize_query():
+    assert normalize_query("  咳嗽　 痰 ") == normalize_query("咳嗽 痰")
+
+def test_retrieve_caches_until_version_changes(tmp_path, monkeypatch):
+    """Repeated queries skip embedding and search until a new index version is published."""
+    embeddings = CountingEmbeddings(size=8, queries=[])
+    registry = VectorStoreRegistry(str(tmp_path))
+    monkeypatch.setattr(search_tool, "registry", registry)
+    search_tool.query_embedding_cache.clear()
+    search_tool.search_result_cache.clear()
+
+    registry.publish(FAISS.from_texts(["桂枝湯", "麻黃湯"], embeddings), {"files": {}})
+    first = search_tool.retrieve("桂枝湯", k=1)
+    again = search_tool.retrieve(" 桂枝湯 ", k=1)
+    assert again is first
+    assert embeddings.queries == ["桂枝湯"]
+
+    registry.publish(FAISS.from_texts(["小柴胡湯"], embeddings), {"files": {}})
+    after_swap = search_tool.retrieve("桂枝湯", k=1)
+    assert after_swap[0].page_content == "小柴胡湯"
+    assert embeddings.queries == ["桂枝湯"]  # the query embedding is still reused
+
+def test_questions_bypass_the_query_embedding_cache(tmp_path, monkeypatch):
+    """Embedding a whole question for the answer cache leaves the keyword cache to the searches."""
+    embeddings = CountingEmbeddings(size=8, queries=[])
+    registry = VectorStoreRegistry(str(tmp_path))
+    monkeypatch.setattr(search_tool, "registry", registry)
+    search_tool.query_embedding_cache.clear()
+    registry.publish(FAISS.from_texts(["桂枝湯"], embeddings), {"files": {}})
+
+    first = search_tool.embed_question("桂枝湯有什麼功效？")
+    assert search_tool.embed_question("桂枝湯有什麼功效？") == first
+    assert embeddings.queries == [normalize_query("桂枝湯有什麼功效？")] * 2
+    assert search_tool.query_embedding_cache.items() == []
+
+def test_batch_search_embeds_and_searches_once(tmp_path, monkeypatch):
+    """A batch embeds all its uncached queries in one request and searches them in one go."""
+    embeddings = CountingEmbeddings(size=8, queries=[])
+    batches = []
+    registry = VectorStoreRegistry(str(tmp_path))
+    monkeypatch.setattr(search_tool, "registry", registry)
+    monkeypatch.setattr(search_tool, "SEARCH_MODE", "vector")
+    search_tool.query_embedding_cache.clear()
+    search_tool.search_result_cache.clear()
+    registry.publish(FAISS.from_texts(["桂枝湯", "麻黃湯", "小柴胡湯"], embeddings), {"files": {}})
+    monkeypatch.setattr(
+        embeddings.__class__, "embed_documents",
+        lambda self, texts: batches.append(list(texts)) or [self.embed_query(t) for t in texts],
+    )
+    searches = []
+    vector_search = search_tool._vector_search
+    monkeypatch.setattr(
+        search_tool, "_vector_search",
+        lambda store, vectors, n: searches.append(len(vectors)) or vector_search(store, vectors, n),
+    )
+
+    results = search_tool.retrieve_many(["桂枝湯", "麻黃湯", "桂枝湯"], k=1)
+
+    assert batches == [["桂枝湯", "麻黃湯"]]
+    assert searches == [2]
+    assert [docs[0].page_content for docs in results] == ["桂枝湯", "麻黃湯", "桂枝湯"]
+
+    text = search_tool.search_documents_batch.invoke({"queries": ["桂枝湯", "麻黃湯"]})
+    assert text.index("## 桂枝湯") < text.index("## 麻黃湯")
+    assert searches == [2, 2]  # embeddings are cached, one search covers both keywords
+    assert text.count("麻黃湯") == 2  # its chunk came with 桂枝湯's results and isn't repeated
+
+def test_postgres_search_reports_an_embedding_outage(monkeypatch):
+    """Without lexical fallback, a failed query embedding is not mistaken for a loading knowledge base."""
+    monkeypatch.setattr(search_tool, "VECTOR_BACKEND", "pgvector")
+    monkeypatch.setattr(search_tool.pgvector_store, "version", lambda: "v1")
+    monkeypatch.setattr(search_tool, "_embed_queries", lambda embeddings, queries: [None] * len(queries))
+    monkeypatch.setattr(search_tool.pgvector_store, "_embeddings", object())
+    search_tool.search_result_cache.clear()
+
+    for answer in (
+        search_tool.search_documents.invoke({"query": "咳嗽"}),
+        search_tool.search_documents_batch.invoke({"queries": ["咳嗽", "頭痛"]}),
+    ):
+        assert answer.startswith("Searching the knowledge base is temporarily unavailable")
+
+    monkeypatch.setattr(search_tool.pgvector_store, "version", lambda: None)
+    assert search_tool.search_documents.invoke({"query": "咳嗽"}).startswith("The knowledge base is still loading")
@@ -0,0 +1,41 @@
+from app.services.text_chunker import chunk_file, heading, read_chunk
+
+def write(tmp_path, text):
+    path = tmp_path / "book.txt"
+    path.write_bytes(text.encode("utf-8"))
+    return str(path)
+
+def test_headings():
+    assert heading("醫宗金鑑卷一\n") == (1, "醫宗金鑑卷一")
+    assert heading("辨太陽病脈證並治上篇\r\n") == (2, "辨太陽病脈證並治上篇")
+    assert heading("1=標題= 上古天真論篇第一\n") == (1, "上古天真論篇第一")
+    assert heading("==2（第一節）論發汗\n") == (2, "（第一節）論發汗")
+    assert heading("==中標題==  中風。\n") == (2, "中風")
+    assert heading("\x0301\n") == (3, "01")
+    assert heading("篇用桂枝湯解肌，所以治風傷衛之表也\n") is None
+
+def test_chunks_point_back_into_the_file(tmp_path):
+    path = write(tmp_path, "醫宗金鑑卷一\n\n" + "太陽病，發熱，\n汗出，惡風。" * 40 + "\n\n辨陽明病脈證並治全篇\n\n" + "陽明之為病，胃家實是也。" * 5)
+
+    chunks = list(chunk_file(path, "book.txt", chunk_size=100, chunk_overlap=20))
+
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert read_chunk(path, chunk.offset, chunk.length) == chunk.text
+        assert len(chunk.text) <= 100
+        assert chunk.text.endswith("。")
+    # A new part starts a new chunk headed by it
+    last = chunks[-1]
+    assert last.text.startswith("辨陽明病脈證並治全篇") and "太陽" not in last.text
+    assert last.section == "醫宗金鑑卷一 / 辨陽明病脈證並治全篇"
+    assert chunks[0].section == "醫宗金鑑卷一"
+    # Consecutive chunks overlap by whole sentences
+    assert chunks[1].offset < chunks[0].offset + chunks[0].length
+
+def test_unpunctuated_text_is_cut_to_size(tmp_path):
+    path = write(tmp_path, "桂" * 250)
+
+    chunks = list(chunk_file(path, chunk_size=100))
+
+    assert [len(chunk.text) for chunk in chunks] == [100, 100, 50]
+    assert [chunk.offset for chunk in chunks] == [0, 300, 600]
@@ -0,0 +1,32 @@
+import datetime
+
+from app.services.chat_service import build_prompt
+from app.tools.time_tool import JIEQI_NAMES, jieqi_on, modern_to_dizhi, time_context
+
+def test_jieqi_dates_match_the_almanac():
+    almanac = {
+        "2020-03-20": "春分", "2023-04-05": "清明", "2024-02-04": "立春", "2024-06-21": "夏至",
+        "2025-08-07": "立秋", "2025-12-21": "冬至", "2026-01-05": "小寒", "2026-10-23": "霜降",
+    }
+    for day, name in almanac.items():
+        day = datetime.date.fromisoformat(day)
+        (current, since), _, _ = jieqi_on(day)
+        assert (current, since) == (name, day)
+        # The day before still belongs to the previous term
+        (previous, _), (upcoming, starts), _ = jieqi_on(day - datetime.timedelta(days=1))
+        assert (upcoming, starts) == (name, day)
+        assert JIEQI_NAMES.index(previous) == (JIEQI_NAMES.index(name) - 1) % 24
+
+def test_seasons_and_time_context():
+    assert jieqi_on(datetime.date(2024, 2, 3))[2] == "冬季"
+    assert jieqi_on(datetime.date(2024, 2, 4))[2] == "春季"
+    assert jieqi_on(datetime.date(2026, 10, 18))[2] == "秋季"
+    assert [modern_to_dizhi(hour) for hour in (23, 0, 1, 12, 22)] == ["子時", "子時", "丑時", "午時", "亥時"]
+
+    context = time_context(datetime.datetime(2026, 10, 18, 19, 30))
+    assert context.splitlines() == [
+        "日期：2026-10-18", "時辰：戌時", "季節：秋季", "當前節氣：寒露（10月8日起）", "下一個節氣：霜降（10月23日）",
+    ]
+
+    prompt = build_prompt({"messages": []})
+    assert prompt[0].content.endswith(time_context())
@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.handlers.update_processor import ChatUpdateProcessor, OVERLOADED_MESSAGE
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+def make_update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_message=FakeMessage())
+
+def test_orders_per_user_and_rejects_when_full():
+    async def scenario():
+        processor = ChatUpdateProcessor(max_in_flight=2, max_queued=2)
+        await processor.initialize()
+        log, release = [], asyncio.Event()
+
+        async def handle(name):
+            log.append(f"start {name}")
+            await release.wait()
+            log.append(f"end {name}")
+
+        updates = [make_update(1), make_update(1), make_update(2), make_update(3)]
+        tasks = [
+            asyncio.create_task(processor.process_update(update, handle(name)))
+            for update, name in zip(updates, ["1a", "1b", "2", "3"])
+        ]
+        await asyncio.sleep(0.01)
+        # 1a and 2 run; 1b waits for 1a and 3 waits for a slot
+        assert log == ["start 1a", "start 2"]
+        assert processor.stats() == {"in_flight": 2, "queued": 2, "rejected": 0}
+
+        overflow = make_update(4)
+        await processor.process_update(overflow, handle("4"))
+        assert overflow.effective_message.replies == [OVERLOADED_MESSAGE]
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert log.index("end 1a") < log.index("start 1b")
+        assert "start 4" not in log
+        assert processor.stats() == {"in_flight": 0, "queued": 0, "rejected": 1}
+        assert not processor._user_locks
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.vector_store_registry import VectorStoreRegistry
+
+def make_store(*texts):
+    return FAISS.from_texts(list(texts), DeterministicFakeEmbedding(size=8))
+
+def make_registry(tmp_path, **kwargs):
+    registry = VectorStoreRegistry(str(tmp_path), **kwargs)
+    registry._embeddings = DeterministicFakeEmbedding(size=8)
+    return registry
+
+def test_publish_swaps_without_disturbing_readers(tmp_path):
+    """A reader keeps its version until it finishes; the old index is then released."""
+    registry = make_registry(tmp_path)
+    registry.publish(make_store("咳嗽"), {"files": {}})
+    first = registry._active
+
+    with registry.acquire() as store:
+        registry.publish(make_store("頭痛", "發熱"), {"files": {}})
+        assert store.index.ntotal == 1
+        assert registry.current_store.index.ntotal == 2
+        assert first.store is not None
+
+    assert first.store is None
+
+def test_versions_are_pruned_and_can_be_rolled_back(tmp_path):
+    registry = make_registry(tmp_path, keep_versions=1)
+    names = [registry.publish(make_store(*["太陽病"] * n), {"files": {}}) for n in (1, 2, 3)]
+
+    assert registry.list_versions() == names[1:]
+    assert registry.rollback() == names[1]
+    assert registry.current_store.index.ntotal == 2
+
+    reopened = make_registry(tmp_path)
+    assert reopened.load_current().index.ntotal == 2
@@ -1,34 +1,236 @@
-import os
+import time
 import logging
-from langchain_core.tools import tool
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.tools import tool
+
+from app.config.settings import (
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_TTL_SECONDS,
+    SEARCH_TOP_K,
+    SEARCH_MODE,
+    SEARCH_CANDIDATES,
+    SEARCH_BATCH_MAX_QUERIES,
+    SEARCH_BATCH_TOKEN_BUDGET,
+    VECTOR_BACKEND,
+    QUERY_EMBEDDING_TIMEOUT_SECONDS,
+    QUERY_EMBEDDING_COOLDOWN_SECONDS,
+)
+from app.services.context_packer import pack_context
+from app.services.index_factory import search_store
+from app.services.lexical_index import reciprocal_rank_fusion
+from app.services.metrics import timed
+from app.services.pgvector_store import pgvector_store
+from app.services.query_cache import TTLCache, normalize_query
+from app.services.vector_store_registry import registry
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Define vector store path
-VECTOR_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "knowledge")
+class QueryEmbeddingUnavailable(LookupError):
+    """The query couldn't be embedded, and the backend has no lexical search to fall back on."""
+
+# Popular keyword queries repeat constantly, so both their embeddings and results are cached.
+# Results are keyed by index version and dropped whenever a new version becomes active.
+query_embedding_cache = TTLCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS)
+search_result_cache = TTLCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS)
+_result_cache_version = None
+
+# Query embeddings run here so a slow embedding API can be abandoned after a timeout
+_embedding_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embedding")
+_embedding_unavailable_until = 0.0
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the search caches."""
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+    }
+
+def _embed_queries(
+    embeddings: Embeddings, normalized: List[str], cache: Optional[TTLCache] = query_embedding_cache
+) -> List[Optional[List[float]]]:
+    """Embed queries in one request; a query gets None if the embedding API is slow or failing.
 
-def init_vector_store():
-    """Initialize the vector store from disk."""
+    Args:
+        cache: Where embeddings are looked up and kept, None to always embed afresh
+    """
+    global _embedding_unavailable_until
+    vectors = {query: cache.get(query) if cache is not None else None for query in normalized}
+    missing = [query for query, vector in vectors.items() if vector is None]
+    if not missing or time.monotonic() < _embedding_unavailable_until:
+        return [vectors[query] for query in normalized]
+
+    def remember(future):
+        # Late answers still warm the cache for the next time these queries come up
+        if cache is not None and not future.cancelled() and future.exception() is None:
+            for query, vector in zip(missing, future.result()):
+                cache.set(query, vector)
+
+    # The served model embeds queries and documents alike, so a batch is one embed_documents request
+    if len(missing) == 1:
+        future = _embedding_executor.submit(lambda: [embeddings.embed_query(missing[0])])
+    else:
+        future = _embedding_executor.submit(embeddings.embed_documents, missing)
+    future.add_done_callback(remember)
     try:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        vector_store = FAISS.load_local(
-            VECTOR_STORE_PATH,
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
-        logger.info("Vector store initialized successfully")
-        return vector_store
+        with timed("query_embedding"):
+            vectors.update(zip(missing, future.result(timeout=QUERY_EMBEDDING_TIMEOUT_SECONDS)))
     except Exception as e:
-        logger.error(f"Failed to initialize vector store: {str(e)}")
-        raise
+        logger.warning(
+            f"Query embedding unavailable ({type(e).__name__}: {str(e)}), "
+            f"using lexical search only for {QUERY_EMBEDDING_COOLDOWN_SECONDS:.0f}s"
+        )
+        _embedding_unavailable_until = time.monotonic() + QUERY_EMBEDDING_COOLDOWN_SECONDS
+    return [vectors[query] for query in normalized]
 
-# Initialize vector store at module level
-vector_store = init_vector_store()
+def embed_question(question: str) -> Optional[List[float]]:
+    """Embed a user's question with the served index's model, or return None if that isn't possible right now.
+
+    Whole questions rarely repeat word for word, so they bypass the query
+    embedding cache, which is kept for the short keyword searches the agent makes.
+    """
+    if VECTOR_BACKEND == "pgvector":
+        embeddings = pgvector_store.embeddings
+    else:
+        store = registry.current_store
+        if store is None:
+            return None
+        embeddings = store.embedding_function
+    return _embed_queries(embeddings, [normalize_query(question)], cache=None)[0]
+
+def index_version() -> Optional[str]:
+    """Name of the index version searches are served from, or None while there is none."""
+    if VECTOR_BACKEND == "pgvector":
+        return pgvector_store.version()
+    return registry.active_version
+
+def retrieval_state() -> str:
+    """State of the configured vector backend: warming, ready, empty or error."""
+    return pgvector_store.state if VECTOR_BACKEND == "pgvector" else registry.state
+
+def warm_up():
+    """Start loading the configured vector backend ahead of the first search."""
+    if VECTOR_BACKEND == "pgvector":
+        pgvector_store.warm_up()
+    else:
+        registry.warm_up()
+
+def _vector_search(store: FAISS, vectors: List[List[float]], n: int) -> List[List[str]]:
+    """Ids of the n chunks nearest to each query vector, from one search over the query matrix."""
+    with timed("vector_search"):
+        _, indices = search_store(store, np.asarray(vectors, dtype=np.float32), n)
+    return [[store.index_to_docstore_id[i] for i in row if i != -1] for row in indices]
+
+def retrieve(query: str, k: int = SEARCH_TOP_K) -> List[Document]:
+    """Retrieve the k most relevant chunks, fusing vector and lexical rankings.
+
+    Uses the caches where possible, and falls back to lexical search alone
+    when the query can't be embedded in time.
+    """
+    return retrieve_many([query], k)[0]
+
+def retrieve_many(queries: List[str], k: int = SEARCH_TOP_K) -> List[List[Document]]:
+    """Retrieve the k most relevant chunks for each of several queries.
+
+    Queries that aren't cached are embedded in one request and looked up
+    with one vector search over all of them.
+
+    Returns:
+        List[List[Document]]: The chunks found for each query, in query order
+    """
+    normalized = [normalize_query(query) for query in queries]
+    if VECTOR_BACKEND == "pgvector":
+        return _retrieve_from_postgres(normalized, k)
+
+    # Retrieve relevant documents from whichever version is active right now
+    with registry.lease() as version:
+        if version is None:
+            raise LookupError(f"Vector store is {registry.state}")
+
+        results = {}
+        for query in dict.fromkeys(normalized):
+            docs = _cached_result((query, k, version.name))
+            if docs is not None:
+                logger.info(f"Search result cache hit for query: {query}")
+                results[query] = docs
+        missing = [query for query in dict.fromkeys(normalized) if query not in results]
+        if not missing:
+            return [results[query] for query in normalized]
+
+        candidates = max(k, SEARCH_CANDIDATES)
+        rankings = {query: [] for query in missing}
+        degraded = set()
+        if SEARCH_MODE != "lexical":
+            vectors = _embed_queries(version.store.embedding_function, missing)
+            embedded = [(query, vector) for query, vector in zip(missing, vectors) if vector is not None]
+            degraded = {query for query, vector in zip(missing, vectors) if vector is None}
+            if embedded:
+                found = _vector_search(version.store, [vector for _, vector in embedded], candidates)
+                for (query, _), doc_ids in zip(embedded, found):
+                    rankings[query].append(doc_ids)
+        if SEARCH_MODE != "vector" and version.lexical is not None:
+            for query in missing:
+                with timed("lexical_search"):
+                    rankings[query].append([doc_id for doc_id, _ in version.lexical.search(query, candidates)])
+
+        for query in missing:
+            doc_ids = reciprocal_rank_fusion(rankings[query], k)
+            results[query] = [version.store.docstore.search(doc_id) for doc_id in doc_ids]
+            # Degraded results would otherwise keep being served after the API recovers
+            if query not in degraded:
+                search_result_cache.set((query, k, version.name), results[query])
+
+    return [results[query] for query in normalized]
+
+def _cached_result(result_key: tuple) -> Optional[List[Document]]:
+    """Cached results for (query, k, version), dropping the whole cache when the version changes."""
+    global _result_cache_version
+    if result_key[-1] != _result_cache_version:
+        search_result_cache.clear()
+        _result_cache_version = result_key[-1]
+    return search_result_cache.get(result_key)
+
+def _retrieve_from_postgres(normalized: List[str], k: int) -> List[List[Document]]:
+    """Retrieve the k nearest chunks for each query from the shared pgvector index.
+
+    The lexical index is built per FAISS version on local disk, so this
+    backend ranks by vector similarity alone.
+    """
+    version = pgvector_store.version()
+    if version is None:
+        raise LookupError(f"Vector store is {pgvector_store.state}")
+
+    results = {}
+    for query in dict.fromkeys(normalized):
+        docs = _cached_result((query, k, version))
+        if docs is not None:
+            logger.info(f"Search result cache hit for query: {query}")
+            results[query] = docs
+    missing = [query for query in dict.fromkeys(normalized) if query not in results]
+    if missing:
+        vectors = _embed_queries(pgvector_store.embeddings, missing)
+        if any(vector is None for vector in vectors):
+            raise QueryEmbeddingUnavailable("Query embedding is unavailable")
+        with timed("vector_search"):
+            found = pgvector_store.search_many(vectors, k)
+        for query, docs in zip(missing, found):
+            results[query] = docs
+            search_result_cache.set((query, k, version), docs)
+    return [results[query] for query in normalized]
+
+def _unavailable_message(error: LookupError) -> str:
+    """What to tell the agent when the knowledge base can't be searched right now."""
+    if isinstance(error, QueryEmbeddingUnavailable):
+        return "Searching the knowledge base is temporarily unavailable, please answer from your own knowledge for now."
+    return "The knowledge base is still loading, please answer from your own knowledge for now."
 
 @tool
+@timed("search_documents")
 def search_documents(query: str) -> str:
     """Search for relevant documents in Chinese Traditional Medicine.
     
@@ -41,8 +243,12 @@ def search_documents(query: str) -> str:
     try:
         logger.info(f"🔍 Searching documents for query: {query}")
         
-        # Retrieve relevant documents
-        docs = vector_store.similarity_search(query, k=8)
+        try:
+            # Over-fetch so the packer can merge neighbours and drop repeats
+            docs = retrieve(query, k=2 * SEARCH_TOP_K)
+        except LookupError as e:
+            logger.warning(f"{str(e)}, cannot search for: {query}")
+            return _unavailable_message(e)
         if not docs or not docs[0].page_content.strip():
             logger.warning(f"❌ No relevant documents found for query: {query}")
             return "I couldn't find any relevant information in the documents for your query."
@@ -53,7 +259,53 @@ def search_documents(query: str) -> str:
             content_preview = doc.page_content[:100].replace('\n', ' ')
             logger.info(f"   {i}. {content_preview}...")
         
-        return "\n\n".join(doc.page_content for doc in docs)
+        with timed("pack_context"):
+            return pack_context(docs)
+    except Exception as e:
+        logger.error(f"❌ Error searching documents: {str(e)}")
+        return "I encountered an error while searching the documents."
+
+@tool
+@timed("search_documents_batch")
+def search_documents_batch(queries: List[str]) -> str:
+    """Search the Chinese Traditional Medicine documents for several keywords at once.
+
+    Faster than one search_documents call per keyword: the keywords are
+    embedded and looked up together, and passages already shown for an
+    earlier keyword are not repeated.
+
+    Args:
+        queries: Short search keywords, e.g. ["咳嗽", "頭痛穴道", "桂枝湯"]
+
+    Returns:
+        str: The relevant document content, one section per keyword
+    """
+    try:
+        queries = [query for query in dict.fromkeys(q.strip() for q in queries) if query][:SEARCH_BATCH_MAX_QUERIES]
+        if not queries:
+            return "Please give at least one search keyword."
+        logger.info(f"🔍 Searching documents for {len(queries)} queries: {queries}")
+
+        try:
+            found = retrieve_many(queries, k=2 * SEARCH_TOP_K)
+        except LookupError as e:
+            logger.warning(f"{str(e)}, cannot search for: {queries}")
+            return _unavailable_message(e)
+
+        sections = []
+        seen = set()
+        for query, docs in zip(queries, found):
+            docs = [doc for doc in docs if doc.page_content.strip() and (doc.id or doc.page_content) not in seen]
+            seen.update(doc.id or doc.page_content for doc in docs)
+            if not docs:
+                logger.warning(f"❌ No new documents found for query: {query}")
+                sections.append(f"## {query}\nNo further relevant information found.")
+                continue
+            logger.info(f"✅ Found {len(docs)} relevant documents for: {query}")
+            with timed("pack_context"):
+                packed = pack_context(docs, token_budget=SEARCH_BATCH_TOKEN_BUDGET // len(queries))
+            sections.append(f"## {query}\n{packed}")
+        return "\n\n".join(sections)
     except Exception as e:
         logger.error(f"❌ Error searching documents: {str(e)}")
-        return "I encountered an error while searching the documents." 
\ No newline at end of file
+        return "I encountered an error while searching the documents."
@@ -1,98 +1,130 @@
+import math
 import datetime
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Tuple
 from langchain_core.tools import tool
 import logging
 
+from app.services.metrics import timed
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# 节气表，每年的节气日期 (阳历)
-jieqi_table = {
-    "小寒": (1, 5),
-    "大寒": (1, 20),
-    "立春": (2, 3),  # 春季开始
-    "雨水": (2, 18),
-    "惊蛰": (3, 5),
-    "春分": (3, 20),
-    "清明": (4, 4),
-    "谷雨": (4, 19),
-    "立夏": (5, 5),  # 夏季开始
-    "小满": (5, 20),
-    "芒种": (6, 5),
-    "夏至": (6, 21),
-    "小暑": (7, 7),
-    "大暑": (7, 22),
-    "立秋": (8, 7),  # 秋季开始
-    "处暑": (8, 23),
-    "白露": (9, 7),
-    "秋分": (9, 23),
-    "寒露": (10, 8),
-    "霜降": (10, 23),
-    "立冬": (11, 7),  # 冬季开始
-    "小雪": (11, 22),
-    "大雪": (12, 7),
-    "冬至": (12, 21)
-}
+# 节气，依太阳视黄经每 15° 一个，自小寒 (285°) 起
+JIEQI_NAMES = (
+    "小寒", "大寒", "立春", "雨水", "惊蛰", "春分",
+    "清明", "谷雨", "立夏", "小满", "芒种", "夏至",
+    "小暑", "大暑", "立秋", "处暑", "白露", "秋分",
+    "寒露", "霜降", "立冬", "小雪", "大雪", "冬至",
+)
+SEASONS = ("春季", "夏季", "秋季", "冬季")  # 各自立春、立夏、立秋、立冬起
+
+# Years covered by the precomputed table
+FIRST_YEAR = 1900
+LAST_YEAR = 2199
+
+J2000 = 2451545.0  # Julian day of 2000-01-01 12:00
+J2000_DATETIME = datetime.datetime(2000, 1, 1, 12)
+CHINA_UTC_OFFSET = datetime.timedelta(hours=8)  # 节气 dates follow Beijing time
+
+def sun_longitude(jd: float) -> float:
+    """Apparent ecliptic longitude of the sun in degrees (Meeus, low accuracy: about 0.01°)."""
+    t = (jd - J2000) / 36525
+    l0 = 280.46646 + 36000.76983 * t + 0.0003032 * t * t
+    m = math.radians(357.52911 + 35999.05029 * t - 0.0001537 * t * t)
+    center = (
+        (1.914602 - 0.004817 * t - 0.000014 * t * t) * math.sin(m)
+        + (0.019993 - 0.000101 * t) * math.sin(2 * m)
+        + 0.000289 * math.sin(3 * m)
+    )
+    omega = math.radians(125.04 - 1934.136 * t)
+    return (l0 + center - 0.00569 - 0.00478 * math.sin(omega)) % 360
+
+def _crossing(longitude: float, jd: float) -> float:
+    """Julian day near jd when the sun reaches the given longitude."""
+    for _ in range(10):
+        delta = (longitude - sun_longitude(jd) + 180) % 360 - 180
+        jd += delta / 0.98564736  # mean motion in degrees per day
+        if abs(delta) < 1e-6:
+            break
+    return jd
+
+@lru_cache(maxsize=None)
+def _jieqi_table() -> array:
+    """Date ordinal of every 节气 from FIRST_YEAR to LAST_YEAR, in order, starting with 小寒.
+
+    Entry i is JIEQI_NAMES[i % 24]. Computed once, accurate to within about a
+    quarter of an hour, so only a term falling right at midnight can land on
+    the neighbouring day.
+    """
+    ordinals = array("i")
+    jd = J2000 + (datetime.datetime(FIRST_YEAR, 1, 5) - J2000_DATETIME) / datetime.timedelta(days=1)
+    for i in range((LAST_YEAR - FIRST_YEAR + 1) * 24):
+        jd = _crossing((285 + 15 * i) % 360, jd)
+        moment = J2000_DATETIME + datetime.timedelta(days=jd - J2000) + CHINA_UTC_OFFSET
+        ordinals.append(moment.toordinal())
+        jd += 15.2  # roughly where the next term falls
+    return ordinals
+
+@lru_cache(maxsize=64)
+def jieqi_on(day: datetime.date) -> Tuple[Tuple[str, datetime.date], Tuple[str, datetime.date], str]:
+    """The 节气 in effect on a day, the next one, and the season.
+
+    Returns:
+        Tuple: ((current name, start date), (next name, start date), season)
+    """
+    table = _jieqi_table()
+    i = bisect_right(table, day.toordinal()) - 1
+    if i < 0 or i + 1 >= len(table):
+        raise ValueError(f"{day} is outside the 节气 table ({FIRST_YEAR}-{LAST_YEAR})")
+    current = (JIEQI_NAMES[i % 24], datetime.date.fromordinal(table[i]))
+    upcoming = (JIEQI_NAMES[(i + 1) % 24], datetime.date.fromordinal(table[i + 1]))
+    # 立春 is term 2, and every season spans six terms
+    return current, upcoming, SEASONS[(i % 24 - 2) % 24 // 6]
 
 def get_season(month, day):
     """Get the current season based on solar terms."""
-    current_year = datetime.datetime.now().year
-    date = datetime.date(current_year, month, day)
-    
-    # Define season boundaries
-    seasons = {
-        "春季": (datetime.date(current_year, 2, 3), datetime.date(current_year, 5, 4)),  # 立春 to 立夏前
-        "夏季": (datetime.date(current_year, 5, 5), datetime.date(current_year, 8, 6)),  # 立夏 to 立秋前
-        "秋季": (datetime.date(current_year, 8, 7), datetime.date(current_year, 11, 6)),  # 立秋 to 立冬前
-        "冬季": (datetime.date(current_year, 11, 7), datetime.date(current_year + 1, 2, 2))   # 立冬 to 立春前
-    }
-    
-    for season, (start, end) in seasons.items():
-        if start <= date <= end:
-            return season
-        # Handle winter which spans across year end
-        if season == "冬季" and (date >= start or date <= end):
-            return season
-    
-    return "未知季節"
+    return jieqi_on(datetime.date(datetime.datetime.now().year, month, day))[2]
 
 def get_closest_jieqi(month, day):
     """Get the current and next solar term."""
-    current_year = datetime.datetime.now().year
-    current_date = datetime.date(current_year, month, day)
-    jieqi_dates = [(name, datetime.date(current_year, m, d)) for name, (m, d) in jieqi_table.items()]
-    jieqi_dates.sort(key=lambda x: x[1])
-    
-    # Find the current and next solar term
-    current_jieqi = None
-    next_jieqi = None
-    
-    for i, (name, date) in enumerate(jieqi_dates):
-        if date <= current_date:
-            current_jieqi = (name, date)
-            next_jieqi = jieqi_dates[(i + 1) % len(jieqi_dates)]
-    
-    return current_jieqi, next_jieqi
+    current, upcoming, _ = jieqi_on(datetime.date(datetime.datetime.now().year, month, day))
+    return current, upcoming
+
+# 十二時辰, each two hours long, starting with 子時 at 23:00
+DIZHI_HOURS = ("子時", "丑時", "寅時", "卯時", "辰時", "巳時", "午時", "未時", "申時", "酉時", "戌時", "亥時")
 
 def modern_to_dizhi(hour):
     """Convert modern hour to traditional Chinese time period."""
-    time_mapping = {
-        23: "子時", 0: "子時",
-        1: "丑時", 2: "丑時",
-        3: "寅時", 4: "寅時",
-        5: "卯時", 6: "卯時",
-        7: "辰時", 8: "辰時",
-        9: "巳時", 10: "巳時",
-        11: "午時", 12: "午時",
-        13: "未時", 14: "未時",
-        15: "申時", 16: "申時",
-        17: "酉時", 18: "酉時",
-        19: "戌時", 20: "戌時",
-        21: "亥時", 22: "亥時"
-    }
-    
-    return time_mapping.get(hour, "時間格式錯誤")
+    if not 0 <= hour <= 23:
+        return "時間格式錯誤"
+    return DIZHI_HOURS[(hour + 1) % 24 // 2]
+
+def solar_context(now: datetime.datetime = None):
+    """The current solar term and season, e.g. ("霜降", "秋季")."""
+    now = now or datetime.datetime.now()
+    (current_jieqi, _), _, season = jieqi_on(now.date())
+    return current_jieqi, season
+
+def time_context(now: datetime.datetime = None) -> str:
+    """Date, 時辰, season and 节气 for the system prompt.
+
+    Only changes every two hours, so the prompt prefix stays cacheable.
+    """
+    now = now or datetime.datetime.now()
+    (current_jieqi, since), (next_jieqi, starts), season = jieqi_on(now.date())
+    return (
+        f"日期：{now:%Y-%m-%d}\n"
+        f"時辰：{modern_to_dizhi(now.hour)}\n"
+        f"季節：{season}\n"
+        f"當前節氣：{current_jieqi}（{since.month}月{since.day}日起）\n"
+        f"下一個節氣：{next_jieqi}（{starts.month}月{starts.day}日）"
+    )
 
 @tool
+@timed("get_time_and_season")
 def get_time_and_season() -> str:
     """Get current time information including traditional Chinese time, period and season. 
     獲取當前的節氣、時辰
@@ -100,30 +132,7 @@ def get_time_and_season() -> str:
     Returns:
         str: A string containing current time information in both modern and traditional formats.
     """
-    # Get current date and time
     now = datetime.datetime.now()
-    
-    # Format time
-    formatted_time = now.strftime('%H:%M:%S')
-    
-    # Get current season
-    season = get_season(now.month, now.day)
-    
-    # Get current and next solar term
-    current_jieqi, next_jieqi = get_closest_jieqi(now.month, now.day)
-    
-    # Get traditional Chinese time period
-    traditional_time = modern_to_dizhi(now.hour)
-    
-    # Combine all information
-    result = (
-        f"時間：{formatted_time}\n"
-        f"時辰：{traditional_time}\n"
-        f"季節：{season}\n"
-        f"當前節氣：{current_jieqi[0] if current_jieqi else '無'}\n"
-        f"下一個節氣：{next_jieqi[0] if next_jieqi else '無'}"
-    )
-
+    result = f"時間：{now:%H:%M:%S}\n{time_context(now)}"
     logger.info(f"Time information: {result}")
-    
-    return result 
\ No newline at end of file
+    return result
@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from app.config.settings import (
+    TEXT_DIRECTORY,
+    EMBEDDING_DIMENSIONS,
+    SEARCH_MODE,
+    SEARCH_CANDIDATES,
+    INGEST_WORKERS,
+    VECTOR_INDEX_HNSW_M,
+    VECTOR_INDEX_EF_SEARCH,
+    VECTOR_INDEX_NLIST,
+    VECTOR_INDEX_NPROBE,
+    VECTOR_RERANK_CANDIDATES,
+)
+from app.models.database import Base, init_async_db, get_async_session_maker
+from app.services.context_packer import pack_context
+from app.services.document_processor import DocumentProcessor
+from app.services.embedding_pipeline import EmbeddingPipeline
+from app.services.index_factory import INDEX_TYPES, build_store, index_size_bytes, search_store
+from app.services.vector_store_registry import VectorStoreRegistry
+from app.tools import search_tool
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Keywords of the kind the agent searches for
+DEFAULT_QUERIES = [
+    "咳嗽", "發熱", "頭痛", "腹瀉", "失眠", "胃痛", "惡寒", "汗出",
+    "桂枝湯", "麻黃湯", "小柴胡湯", "四逆湯", "太陽病", "少陽病", "脈浮", "脈沉細",
+    "中風", "傷寒", "溫病", "頭痛穴道",
+]
+
+# Text-embedding-3-large's native size, so indexes are as large as in production
+DEFAULT_EMBEDDING_SIZE = EMBEDDING_DIMENSIONS or 3072
+
+class HashEmbeddings(Embeddings):
+    """Deterministic, offline stand-in for the embedding API.
+
+    Each character bigram is hashed to a signed bucket, so texts that share
+    wording get similar vectors and rankings are meaningful, while a whole
+    corpus embeds in seconds and every run produces the same vectors. Like
+    text-embedding-3, any leading 2**n dimensions (from 64) form a coarser
+    embedding: every bigram is hashed once into each band of doubling width.
+    """
+
+    def __init__(self, size: int = DEFAULT_EMBEDDING_SIZE):
+        self.size = size
+        bounds = [0]
+        while bounds[-1] < size:
+            bounds.append(min(size, max(64, 2 * bounds[-1])))
+        self.bands = list(zip(bounds[:-1], bounds[1:]))
+
+    def _embed(self, text: str) -> List[float]:
+        codes = np.frombuffer("".join(text.split()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(codes) < 2:
+            codes = np.concatenate([codes, np.zeros(2 - len(codes), dtype=np.uint64)])
+        hashes = ((codes[:-1] * np.uint64(0x9E3779B1)) ^ (codes[1:] * np.uint64(0x85EBCA77))) % np.uint64(2**32)
+        signs = np.where(hashes & np.uint64(1), 1.0, -1.0)
+        vector = np.zeros(self.size)
+        for start, end in self.bands:
+            buckets = (hashes >> np.uint64(1)) % np.uint64(end - start)
+            vector[start:end] = np.bincount(buckets, weights=signs, minlength=end - start)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def _percentiles(samples: Sequence[float], prefix: str = "") -> Dict[str, float]:
+    p50, p95, p99 = (float(p) for p in np.percentile(samples, [50, 95, 99]))
+    return {
+        f"{prefix}p50_ms": round(p50 * 1000, 3),
+        f"{prefix}p95_ms": round(p95 * 1000, 3),
+        f"{prefix}p99_ms": round(p99 * 1000, 3),
+        f"{prefix}mean_ms": round(float(np.mean(samples)) * 1000, 3),
+    }
+
+def _resident_bytes(store: FAISS) -> int:
+    """Memory a store's vectors take once fully paged in: the index plus any full-width rerank vectors.
+
+    Measured from the structures themselves rather than the process RSS,
+    which the allocator and the previous index's freed memory make noise of.
+    """
+    full_vectors = getattr(store, "full_vectors", None)
+    return index_size_bytes(store.index) + (int(full_vectors.nbytes) if full_vectors is not None else 0)
+
+def _directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+async def benchmark_ingestion(text_directory: str, embeddings: Embeddings, workdir: str) -> Tuple[Dict, FAISS]:
+    """Run a full ingestion of the corpus into a scratch database and knowledge store.
+
+    Returns:
+        Tuple[Dict, FAISS]: Corpus size, chunk count and throughput, and the ingested store
+    """
+    engine = init_async_db(f"sqlite:///{os.path.join(workdir, 'benchmark.db')}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        processor = DocumentProcessor(
+            get_async_session_maker(engine),
+            VectorStoreRegistry(os.path.join(workdir, "ingest")),
+            shared_index=None,
+            embeddings=embeddings,
+            text_directory=text_directory,
+        )
+        # There are no API quotas to respect offline
+        processor.embedding_pipeline = EmbeddingPipeline(embeddings, requests_per_minute=10**9, tokens_per_minute=10**12)
+        total_bytes = _directory_bytes(text_directory)
+
+        started = time.monotonic()
+        store = await processor.process_documents(full_rebuild=True)
+        seconds = time.monotonic() - started
+    finally:
+        await engine.dispose()
+
+    if store is None:
+        raise ValueError(f"No chunks were ingested from {text_directory}")
+    chunks = store.index.ntotal
+    return {
+        "files": len(processor._scan_files()),
+        "mb": round(total_bytes / 1e6, 3),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / max(seconds, 1e-9), 1),
+        "mb_per_second": round(total_bytes / 1e6 / max(seconds, 1e-9), 3),
+    }, store
+
+def benchmark_index(
+    index_type: str,
+    search_dimensions: int,
+    text_embeddings: list,
+    metadatas: List[dict],
+    ids: List[str],
+    embeddings: Embeddings,
+    workdir: str,
+    queries: Sequence[str],
+    ks: Sequence[int],
+    repeat: int,
+    exact: np.ndarray,
+) -> Dict:
+    """Build one index type over the ingested chunks and time searches against it.
+
+    Searches time what search_documents does, retrieve() and pack_context(),
+    with the query caches cleared so every search is a cold one; the vector_
+    percentiles time the vector search alone. Recall is that of the vector
+    search against the exact full-width neighbours.
+
+    Args:
+        search_dimensions: Width of the indexed vectors, 0 for the full embedding
+        exact: Positions of the exact nearest chunks of each query, nearest first
+
+    Returns:
+        Dict: Build time, on-disk and resident size, and latency percentiles and recall per k
+    """
+    label = f"{index_type}@{search_dimensions}" if search_dimensions else index_type
+    started = time.monotonic()
+    store = build_store(
+        text_embeddings, embeddings, metadatas, ids, index_type=index_type, search_dimensions=search_dimensions
+    )
+    build_seconds = time.monotonic() - started
+
+    store_registry = VectorStoreRegistry(os.path.join(workdir, label), keep_versions=0)
+    name = store_registry.publish(store, {"index_type": index_type, "files": {}})
+    # Searches go through the search tool, served from this index
+    search_tool.registry = store_registry
+
+    def search(query: str, k: int):
+        search_tool.query_embedding_cache.clear()
+        search_tool.search_result_cache.clear()
+        return pack_context(search_tool.retrieve(query, k))
+
+    query_vectors = np.asarray(embeddings.embed_documents(list(queries)), dtype=np.float32)
+    results = []
+    for k in ks:
+        _, found = search_store(store, query_vectors, k)
+        recall = sum(len(set(f) & set(t[:k])) for f, t in zip(found, exact)) / (len(queries) * k)
+        for query in queries:
+            search(query, k)  # warm-up, untimed
+        samples, vector_samples = [], []
+        for _ in range(repeat):
+            for query, vector in zip(queries, query_vectors):
+                started = time.perf_counter()
+                search(query, k)
+                samples.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                search_store(store, vector[None, :], k)
+                vector_samples.append(time.perf_counter() - started)
+        results.append({
+            "k": k,
+            "searches": len(samples),
+            "recall": round(recall, 4),
+            **_percentiles(samples),
+            **_percentiles(vector_samples, prefix="vector_"),
+        })
+        logger.info(f"{label} k={k}: {results[-1]}")
+
+    return {
+        "label": label,
+        "index_type": index_type,
+        "search_dimensions": search_dimensions,
+        "build_seconds": round(build_seconds, 3),
+        "disk_mb": round(_directory_bytes(store_registry.version_path(name)) / 2**20, 2),
+        "index_mb": round(index_size_bytes(store.index) / 2**20, 2),
+        "resident_mb": round(_resident_bytes(store) / 2**20, 2),
+        "search": results,
+    }
+
+def run_benchmark(
+    text_directory: str = TEXT_DIRECTORY,
+    index_types: Sequence[str] = INDEX_TYPES,
+    search_dimensions: Sequence[int] = (0,),
+    ks: Sequence[int] = (4, 8, 16),
+    queries: Sequence[str] = DEFAULT_QUERIES,
+    repeat: int = 5,
+    embedding_size: int = DEFAULT_EMBEDDING_SIZE,
+) -> Dict:
+    """Benchmark ingestion of a corpus, then index build and search for each index type.
+
+    Args:
+        text_directory: Corpus of .txt files to ingest
+        index_types: Index types to build and search
+        search_dimensions: Widths of the indexed vectors to try with each type, 0 for the full embedding
+        ks: Numbers of chunks retrieved per search
+        queries: Search keywords
+        repeat: Timed passes over the queries per index type and k
+        embedding_size: Dimension of the hash embeddings
+
+    Returns:
+        Dict: The results, ready to be saved as JSON
+    """
+    embeddings = HashEmbeddings(embedding_size)
+    original_registry, original_backend = search_tool.registry, search_tool.VECTOR_BACKEND
+    # The benchmark covers the local FAISS backend, whatever the environment configures
+    search_tool.VECTOR_BACKEND = "faiss"
+    try:
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+            ingestion, ingested = asyncio.run(benchmark_ingestion(text_directory, embeddings, workdir))
+            logger.info(f"Ingestion: {ingestion}")
+
+            ids = [ingested.index_to_docstore_id[i] for i in range(ingested.index.ntotal)]
+            docs = [ingested.docstore.search(doc_id) for doc_id in ids]
+            texts = [doc.page_content for doc in docs]
+            text_embeddings = list(zip(texts, embeddings.embed_documents(texts)))
+            metadatas = [doc.metadata for doc in docs]
+            del ingested, docs
+
+            # Ground truth for recall: exact search over the full-width vectors
+            exact_index = faiss.IndexFlatL2(embedding_size)
+            exact_index.add(np.asarray([vector for _, vector in text_embeddings], dtype=np.float32))
+            _, exact = exact_index.search(
+                np.asarray(embeddings.embed_documents(list(queries)), dtype=np.float32), max(ks)
+            )
+            del exact_index
+
+            indexes = [
+                benchmark_index(
+                    index_type, dimensions, text_embeddings, metadatas, ids, embeddings, workdir,
+                    queries, ks, repeat, exact,
+                )
+                for index_type in index_types
+                for dimensions in search_dimensions
+            ]
+    finally:
+        search_tool.registry, search_tool.VECTOR_BACKEND = original_registry, original_backend
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "config": {
+            "text_directory": text_directory,
+            "embedding": f"hash-{embedding_size}",
+            "queries": len(queries),
+            "repeat": repeat,
+            "search_mode": SEARCH_MODE,
+            "search_candidates": SEARCH_CANDIDATES,
+            "ingest_workers": INGEST_WORKERS,
+            "hnsw_m": VECTOR_INDEX_HNSW_M,
+            "ef_search": VECTOR_INDEX_EF_SEARCH,
+            "nlist": VECTOR_INDEX_NLIST,
+            "nprobe": VECTOR_INDEX_NPROBE,
+            "rerank_candidates": VECTOR_RERANK_CANDIDATES,
+        },
+        "ingestion": ingestion,
+        "indexes": indexes,
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten_metrics(results: Dict) -> Dict[str, float]:
+    """Numeric metrics of a result file keyed by a stable path, e.g. 'hnsw@256.k=8.p95_ms'."""
+    metrics = {f"ingestion.{key}": value for key, value in results["ingestion"].items()}
+    for index in results["indexes"]:
+        for key, value in index.items():
+            if key not in ("label", "index_type", "search_dimensions", "search"):
+                metrics[f"{index['label']}.{key}"] = value
+        for search in index["search"]:
+            for key, value in search.items():
+                if key not in ("k", "searches"):
+                    metrics[f"{index['label']}.k={search['k']}.{key}"] = value
+    return {key: value for key, value in metrics.items() if isinstance(value, (int, float))}
+
+def compare(previous: Dict, current: Dict) -> List[str]:
+    """One line per metric present in both result files, with the relative change."""
+    before, after = flatten_metrics(previous), flatten_metrics(current)
+    lines = []
+    for key in sorted(before.keys() & after.keys()):
+        change = f"{(after[key] - before[key]) / before[key]:+.1%}" if before[key] else "n/a"
+        lines.append(f"{key:<32} {before[key]:>12} -> {after[key]:>12}  {change}")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline ingestion and retrieval benchmark with deterministic hash embeddings"
+    )
+    parser.add_argument("--text-directory", default=TEXT_DIRECTORY, help="corpus to ingest (default: %(default)s)")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--search-dimensions", nargs="+", type=int, default=[0, 256, 512, 1024],
+                        help="widths of the indexed vectors, 0 for the full embedding; shorter ones are re-scored")
+    parser.add_argument("--k", nargs="+", type=int, default=[4, 8, 16], help="chunks retrieved per search")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the queries")
+    parser.add_argument("--embedding-size", type=int, default=DEFAULT_EMBEDDING_SIZE)
+    parser.add_argument("--output", default="benchmark_results.json", help="where to save the results")
+    parser.add_argument("--compare", metavar="PREVIOUS", help="earlier results to print the changes against")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        text_directory=args.text_directory,
+        index_types=args.index_types,
+        search_dimensions=args.search_dimensions,
+        ks=args.k,
+        repeat=args.repeat,
+        embedding_size=args.embedding_size,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    logger.info(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print("\n".join(compare(json.load(f), results)))
@@ -1,9 +1,21 @@
+import os
+import sys
+import uuid
 import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Keeps the whole session in one conversation
+USER_ID = f"cli:{uuid.uuid4().hex}"
+# /query only answers requests carrying the server's admin token
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
 
 def chat_with_bot(question: str) -> str:
     response = requests.post(
         "http://localhost:8000/query",
-        json={"question": question}
+        json={"question": question, "user_id": USER_ID},
+        headers={"Authorization": f"Bearer {ADMIN_API_TOKEN}"}
     )
     if response.status_code == 200:
         return response.json()["answer"]
@@ -11,6 +23,8 @@ def chat_with_bot(question: str) -> str:
         return f"Error: {response.text}"
 
 def main():
+    if not ADMIN_API_TOKEN:
+        sys.exit("Set ADMIN_API_TOKEN to the server's token to chat over the API")
     print("Chat with your documents (type 'quit' to exit)")
     print("-" * 50)
     
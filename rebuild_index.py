@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.config.settings import VECTOR_BACKEND
+from app.models.database import init_db, init_async_db, get_async_session_maker
+from app.services.document_processor import DocumentProcessor
+from app.services.pgvector_store import pgvector_store
+from app.services.vector_store_registry import registry
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+async def rebuild_index():
+    """Rebuild the local FAISS index from the vectors stored in the database."""
+    init_db().dispose()
+    if VECTOR_BACKEND == "pgvector":
+        pgvector_store.setup()
+    engine = init_async_db()
+
+    try:
+        processor = DocumentProcessor(get_async_session_maker(engine))
+        if await processor.rebuild_from_db() is None:
+            logger.error("The database holds no chunks, run /process first")
+            sys.exit(1)
+        logger.info("Index rebuilt from the database")
+    finally:
+        await engine.dispose()
+
+def rollback(version: str = None):
+    """Point the knowledge store back at an earlier version.
+
+    Running processes pick up the change within a few seconds.
+    """
+    try:
+        if version:
+            registry.activate(version)
+        else:
+            version = registry.rollback()
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    logger.info(f"Vector store version {version} is now current")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the knowledge store index")
+    parser.add_argument("--list", action="store_true", help="list the versions kept on disk")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION",
+                        help="make VERSION (default: the previous one) current instead of rebuilding")
+    args = parser.parse_args()
+
+    if args.list:
+        current = registry.current_version()
+        for name in registry.list_versions():
+            print(f"{'*' if name == current else ' '} {name}")
+    elif args.rollback is not None:
+        rollback(args.rollback or None)
+    else:
+        asyncio.run(rebuild_index())
@@ -1,8 +1,7 @@
 import logging
 import sys
-from sqlalchemy.orm import Session
 
-from app.models.database import init_db, get_session_maker
+from app.models.database import init_db, init_async_db, get_async_session_maker
 from app.services.document_processor import DocumentProcessor
 
 # Configure logging
@@ -18,13 +17,12 @@ async def test_document_processing():
     try:
         # Initialize database
         logger.info("Initializing database...")
-        engine = init_db()
-        SessionLocal = get_session_maker(engine)
-        db = SessionLocal()
+        init_db().dispose()
+        engine = init_async_db()
         
         try:
             # Initialize processor
-            processor = DocumentProcessor(db)
+            processor = DocumentProcessor(get_async_session_maker(engine))
             
             # Test document processing
             logger.info("Starting document processing test...")
@@ -36,7 +34,7 @@ async def test_document_processing():
             logger.error(f"Error during processing: {str(e)}")
             raise
         finally:
-            db.close()
+            await engine.dispose()
             
     except Exception as e:
         logger.error(f"Fatal error: {str(e)}")